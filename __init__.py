@@ -79,10 +79,24 @@ class ImportCPJ(bpy.types.Operator, ImportHelper):
         default=False
     )
 
+    parallel_parse: BoolProperty(
+        name='Parallel Chunk Parsing',
+        description='Parse the chunks of large files in multiple worker processes',
+        default=True
+    )
+
+    share_meshes: BoolProperty(
+        name='Share Meshes',
+        description='Link MAC objects with the same geometry, surface, skeleton and vertex animations to one mesh instead of copying it',
+        default=False
+    )
+
     def draw(self, context):
         layout = self.layout
 
         layout.prop(self, 'only_import_animations')
+        layout.prop(self, 'parallel_parse')
+        layout.prop(self, 'share_meshes')
 
     def execute(self, context):
         from . import import_cpj
@@ -105,6 +119,12 @@ class ExportCPJ(bpy.types.Operator, ExportHelper):
         default=False
     )
 
+    compress_frames: BoolProperty(
+        name='Compress Vertex Frames',
+        description='Store the FRM vertex frames as bytes quantized per "frm_group_index" group. Smaller, but lossy',
+        default=False
+    )
+
     def execute(self, context):
         from . import export_cpj
         export_settings = self.as_keywords()
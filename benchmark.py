@@ -0,0 +1,64 @@
+# Import performance benchmarks. These need to be run inside Blender:
+# blender --background --factory-startup --python benchmark.py -- [num_frames] [num_verts]
+
+import sys
+import time
+
+import bpy
+import numpy as np
+
+def create_grid_object(num_verts):
+    mesh_data = bpy.data.meshes.new("benchmark")
+    mesh_data.vertices.add(num_verts)
+    obj = bpy.data.objects.new("benchmark", mesh_data)
+    bpy.context.scene.collection.objects.link(obj)
+    obj.shape_key_add(name='Basis')
+    return obj
+
+def shape_keys_per_vertex(obj, frame_positions):
+    for i, positions in enumerate(frame_positions):
+        sk = obj.shape_key_add(name=f"frame{i}")
+        for vert_index, pos in enumerate(positions.tolist()):
+            sk.data[vert_index].co.x = pos[0]
+            sk.data[vert_index].co.y = pos[1]
+            sk.data[vert_index].co.z = pos[2]
+
+def shape_keys_foreach_set(obj, frame_positions):
+    for i, positions in enumerate(frame_positions):
+        sk = obj.shape_key_add(name=f"frame{i}")
+        sk.data.foreach_set("co", positions.ravel())
+
+def benchmark_frm_shape_keys(num_frames, num_verts):
+    rng = np.random.default_rng(0)
+    frame_positions = rng.random((num_frames, num_verts, 3), dtype=np.float32)
+
+    results = {}
+    for name, func in (("per vertex", shape_keys_per_vertex), ("foreach_set", shape_keys_foreach_set)):
+        obj = create_grid_object(num_verts)
+        start = time.perf_counter()
+        func(obj, frame_positions)
+        results[name] = time.perf_counter() - start
+
+        # Make sure that both methods wrote the same data
+        co = np.empty(num_verts * 3, dtype=np.float32)
+        obj.data.shape_keys.key_blocks[-1].data.foreach_get("co", co)
+        if not np.allclose(co, frame_positions[-1].ravel()):
+            raise ValueError(name + " wrote the wrong shape key positions")
+
+        mesh_data = obj.data
+        bpy.data.objects.remove(obj)
+        bpy.data.meshes.remove(mesh_data)
+
+    print(f"FRM shape keys, {num_frames} frames x {num_verts} verts:")
+    for name, seconds in results.items():
+        print(f"  {name:>12}: {seconds:.3f} s")
+
+def main():
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    num_frames = int(argv[0]) if len(argv) > 0 else 150
+    num_verts = int(argv[1]) if len(argv) > 1 else 3000
+
+    benchmark_frm_shape_keys(num_frames, num_verts)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1185 @@
+import multiprocessing
+import numpy as np
+import numpy.lib.recfunctions as rfn
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from math import pi
+
+from cpj_utils import *
+
+# NumPy decoders and writers for the fixed size records in the CPJ chunks.
+# Every table in a chunk is read with a single np.frombuffer call over the chunk data,
+# so the returned arrays are read only views of the chunk (no data is copied).
+# The writers copy whole record arrays into the chunk byte array in one go.
+# The record layouts mirror the kaitai declarations in format_declarations.
+# NOTE: All data in CPJ files is stored in little endian byte order.
+
+GEO_VERT_DTYPE = np.dtype([
+    ("flags", "u1"),
+    ("group_index", "u1"),
+    ("reserved", "<u2"),
+    ("num_edge_links", "<u2"),
+    ("num_tri_links", "<u2"),
+    ("first_edge_link", "<u4"),
+    ("first_tri_link", "<u4"),
+    ("ref_pos", "<f4", (3,)),
+])
+
+GEO_EDGE_DTYPE = np.dtype([
+    ("head_vertex", "<u2"),
+    ("tail_vertex", "<u2"),
+    ("inverted_edge", "<u2"),
+    ("num_tri_links", "<u2"),
+    ("first_tri_link", "<u4"),
+])
+
+GEO_TRI_DTYPE = np.dtype([
+    ("edge_ring", "<u2", (3,)),
+    ("reserved", "<u2"),
+])
+
+GEO_MOUNT_DTYPE = np.dtype([
+    ("offset_name", "<u4"),
+    ("tri_index", "<u4"),
+    ("tri_barys", "<f4", (3,)),
+    ("base_scale", "<f4", (3,)),
+    # x, y, z, s
+    ("base_rotate", "<f4", (4,)),
+    ("base_translate", "<f4", (3,)),
+])
+
+GEO_OBJ_LINK_DTYPE = np.dtype("<u2")
+
+SEQ_FRAME_DTYPE = np.dtype([
+    ("reserved", "u1"),
+    ("num_bone_translate", "u1"),
+    ("num_bone_rotate", "u1"),
+    ("num_bone_scale", "u1"),
+    ("first_bone_translate", "<u4"),
+    ("first_bone_rotate", "<u4"),
+    ("first_bone_scale", "<u4"),
+    ("offset_vert_frame_name", "<i4"),
+])
+
+SEQ_EVENT_DTYPE = np.dtype([
+    # Raw bytes, "S4" would strip trailing NUL bytes from the event type
+    ("event_type", "V4"),
+    ("time", "<f4"),
+    ("offset_param_str", "<i4"),
+])
+
+SEQ_BONE_INFO_DTYPE = np.dtype([
+    ("offset_name", "<u4"),
+    ("src_length", "<f4"),
+])
+
+SEQ_BONE_TRANSLATE_DTYPE = np.dtype([
+    ("bone_index", "<u2"),
+    ("reserved", "<u2"),
+    ("translate", "<f4", (3,)),
+])
+
+SEQ_BONE_ROTATE_DTYPE = np.dtype([
+    ("bone_index", "<u2"),
+    ("roll", "<i2"),
+    ("pitch", "<i2"),
+    ("yaw", "<i2"),
+])
+
+SEQ_BONE_SCALE_DTYPE = np.dtype([
+    ("bone_index", "<u2"),
+    ("reserved", "<u2"),
+    ("scale", "<f4", (3,)),
+])
+
+FRM_FRAME_DTYPE = np.dtype([
+    ("offset_name", "<u4"),
+    ("bb_min", "<f4", (3,)),
+    ("bb_max", "<f4", (3,)),
+    ("num_groups", "<u4"),
+    ("data_offset_groups", "<u4"),
+    ("num_verts", "<u4"),
+    ("data_offset_verts", "<u4"),
+])
+
+FRM_GROUP_DTYPE = np.dtype([
+    ("byte_scale", "<f4", (3,)),
+    ("byte_translate", "<f4", (3,)),
+])
+
+FRM_BYTE_POS_DTYPE = np.dtype([
+    ("group", "u1"),
+    ("pos", "u1", (3,)),
+])
+
+FRM_VEC3F_DTYPE = np.dtype(("<f4", (3,)))
+
+LOD_LEVEL_DTYPE = np.dtype([
+    ("detail", "<f4"),
+    ("num_tri", "<u4"),
+    ("num_vert_relay", "<u4"),
+    ("first_tri", "<u4"),
+    ("first_vert_relay", "<u4"),
+])
+
+LOD_TRI_DTYPE = np.dtype([
+    ("tri_index", "<u4"),
+    ("vert_index", "<u2", (3,)),
+    ("uv_index", "<u2", (3,)),
+])
+
+LOD_VERT_RELAY_DTYPE = np.dtype("<u2")
+
+SKL_BONE_DTYPE = np.dtype([
+    ("offset_name", "<u4"),
+    ("parent_index", "<i4"),
+    ("base_scale", "<f4", (3,)),
+    # x, y, z, s
+    ("base_rotate", "<f4", (4,)),
+    ("base_translate", "<f4", (3,)),
+    ("length", "<f4"),
+])
+
+SKL_VERT_DTYPE = np.dtype([
+    ("num_weights", "<u2"),
+    ("first_weight", "<u2"),
+])
+
+SKL_WEIGHT_DTYPE = np.dtype([
+    ("bone_index", "<u4"),
+    ("weight_factor", "<f4"),
+    ("offset_pos", "<f4", (3,)),
+])
+
+SKL_MOUNT_DTYPE = np.dtype([
+    ("offset_name", "<u4"),
+    ("bone_index", "<u4"),
+    ("base_scale", "<f4", (3,)),
+    # x, y, z, s
+    ("base_rotate", "<f4", (4,)),
+    ("base_translate", "<f4", (3,)),
+])
+
+SRF_TEXTURE_DTYPE = np.dtype([
+    ("offset_name", "<u4"),
+    ("offset_ref_name", "<u4"),
+])
+
+SRF_TRI_DTYPE = np.dtype([
+    ("uv_index", "<u2", (3,)),
+    ("tex_index", "u1"),
+    ("reserved", "u1"),
+    ("flags", "<u4"),
+    ("smooth_group", "u1"),
+    ("alpha_level", "u1"),
+    ("glaze_tex_index", "u1"),
+    ("glaze_func", "u1"),
+])
+
+SRF_UV_DTYPE = np.dtype(("<f4", (2,)))
+
+# CPJ (x, y, z) -> Blender (x, -z, y)
+BLENDER_AXES = [0, 2, 1]
+BLENDER_AXES_SIGN = np.array([1.0, -1.0, 1.0], dtype=np.float32)
+# The same conversion as a transform matrix
+BLENDER_AXES_MATRIX = np.array([[1.0, 0.0, 0.0, 0.0],
+                                [0.0, 0.0, -1.0, 0.0],
+                                [0.0, 1.0, 0.0, 0.0],
+                                [0.0, 0.0, 0.0, 1.0]])
+
+def read_chunk_info(data, magic, info_struct):
+    # Validate the chunk header and unpack the chunk info variables that follow it.
+    # Returns the chunk name, the info variables and the start offset of the data block.
+    if len(data) < CPJ_CHUNK_HEADER.size + info_struct.size:
+        raise ImportError("The " + magic + " chunk is too small to contain its chunk header")
+
+    chunk_magic, _, _, _, offset_name = CPJ_CHUNK_HEADER.unpack_from(data, 0)
+    if chunk_magic != bytes(magic, "ASCII"):
+        raise ImportError("Expected a " + magic + " chunk but got: " + str(chunk_magic))
+
+    name = None
+    if offset_name != 0:
+        name = read_c_string(data, offset_name, len(data))
+
+    info = info_struct.unpack_from(data, CPJ_CHUNK_HEADER.size)
+
+    return name, info, CPJ_CHUNK_HEADER.size + info_struct.size
+
+def read_table(data, data_block, data_offset, count, dtype):
+    # The data offsets in the chunk info are relative to the start of the data block
+    offset = data_block + data_offset
+    if count != 0 and offset + count * dtype.itemsize > len(data):
+        raise ImportError("A data table points outside of the chunk data")
+    return np.frombuffer(data, dtype=dtype, count=count, offset=min(offset, len(data)))
+
+class GeoArrays:
+    """NumPy view of a GEO chunk.
+
+    Each table is decoded as a structured array. The most used fields are
+    also exposed as plain arrays, like "ref_pos" (N,3) and "edge_ring" (T,3).
+    """
+
+    def __init__(self, data):
+        self.name, info, data_block = read_chunk_info(data, "GEOB", CPJ_GEO_INFO)
+        (num_verts, offset_verts, num_edges, offset_edges, num_tris, offset_tris,
+         num_mounts, offset_mounts, num_obj_links, offset_obj_links) = info
+
+        self.verts = read_table(data, data_block, offset_verts, num_verts, GEO_VERT_DTYPE)
+        self.edges = read_table(data, data_block, offset_edges, num_edges, GEO_EDGE_DTYPE)
+        self.tris = read_table(data, data_block, offset_tris, num_tris, GEO_TRI_DTYPE)
+        self.mounts = read_table(data, data_block, offset_mounts, num_mounts, GEO_MOUNT_DTYPE)
+        self.obj_links = read_table(data, data_block, offset_obj_links, num_obj_links, GEO_OBJ_LINK_DTYPE)
+
+        self.mount_names = [read_c_string(data, data_block + offset, len(data)) for offset in self.mounts["offset_name"].tolist()]
+
+        self.ref_pos = self.verts["ref_pos"]
+        self.flags = self.verts["flags"]
+        self.group_index = self.verts["group_index"]
+
+        self.head_vertex = self.edges["head_vertex"]
+        self.tail_vertex = self.edges["tail_vertex"]
+        self.inverted_edge = self.edges["inverted_edge"]
+
+        self.edge_ring = self.tris["edge_ring"]
+
+    def tri_vertex_indices(self):
+        # The vertex indices of each triangle (T,3) in the CPJ winding order.
+        # Each triangle edge starts at its tail vertex, so the lookup is a single gather over the edge table.
+        if len(self.edge_ring) != 0 and self.edge_ring.max() >= len(self.edges):
+            raise ImportError("A GEO triangle references an edge that doesn't exist")
+        tri_verts = self.tail_vertex[self.edge_ring]
+        if len(tri_verts) != 0 and tri_verts.max() >= len(self.verts):
+            raise ImportError("A GEO edge references a vertex that doesn't exist")
+        return tri_verts
+
+@dataclass
+class SeqEvent:
+    event_type: str
+    time: float
+    # None if the event doesn't have a parameter string
+    param_str: str
+
+class SeqTrack:
+    """The keys of one SEQ bone track (translate, rotate or scale) in frame order.
+
+    "frame", "bone_index" and "value" have one entry per key.
+    The keys of frame "i" are the slice start[i]:start[i] + count[i].
+    "table" is the track table as stored in the file.
+    """
+
+    def __init__(self, table, value, first, count):
+        self.table = table
+        num_frames = len(count)
+        self.count = count.astype(np.intp)
+        self.start = np.zeros(num_frames, dtype=np.intp)
+        np.cumsum(self.count[:-1], out=self.start[1:])
+
+        num_keys = int(self.count.sum())
+        self.frame = np.repeat(np.arange(num_frames), self.count)
+        # Index of every key in the track table. The keys of a frame are consecutive in the table,
+        # but there is no guarantee that the frames are stored in order.
+        rows = first.astype(np.intp)[self.frame] + (np.arange(num_keys) - self.start[self.frame])
+        if num_keys != 0 and rows.max() >= len(table):
+            raise ImportError("A SEQ frame references bone keys outside of its track table")
+
+        self.bone_index = table["bone_index"][rows]
+        self.value = value[rows]
+        self._bone_keys = None
+
+    def bone_keys(self):
+        # Returns (keys, key_bones, bone_starts, bone_ends) where "keys" are the key indices sorted
+        # by bone and then frame, and the keys of the n:th keyed bone are keys[bone_starts[n]:bone_ends[n]].
+        # If a bone is keyed more than once on the same frame the last key wins.
+        # The result is cached, so every object using this sequence shares one sort.
+        if self._bone_keys == None:
+            key_bones = self.bone_index.astype(np.intp)
+            bone_frame = key_bones * (len(self.count) + 1) + self.frame
+            _, last = np.unique(bone_frame[::-1], return_index=True)
+            keys = len(bone_frame) - 1 - last
+
+            key_bones = key_bones[keys]
+            bone_starts = np.flatnonzero(np.r_[True, key_bones[1:] != key_bones[:-1]])
+            bone_ends = np.r_[bone_starts[1:], len(keys)]
+            self._bone_keys = (keys, key_bones, bone_starts, bone_ends)
+        return self._bone_keys
+
+def seq_rotations_to_quaternions(rotations):
+    # Converts (N,3) int16 roll, pitch, yaw values to (N,4) w,x,y,z quaternions.
+    # 32768 is 180 degrees in the compressed 16bit value from roll,pitch, and yaw.
+    # This is the same as mathutils.Euler((pitch, yaw, roll), 'ZXY').to_quaternion()
+    # Order of rotation is:
+    # 1. Roll (Z)
+    # 2. Pitch (X)
+    # 3. Yaw (Y)
+    half_angles = rotations.astype(np.float64) * (pi / 65536)
+    cos = np.cos(half_angles)
+    sin = np.sin(half_angles)
+    cr, cp, cy = cos[:, 0], cos[:, 1], cos[:, 2]
+    sr, sp, sy = sin[:, 0], sin[:, 1], sin[:, 2]
+
+    # q = q_yaw * q_pitch * q_roll
+    quats = np.empty((len(rotations), 4), dtype=np.float32)
+    quats[:, 0] = cy * cp * cr + sy * sp * sr
+    quats[:, 1] = cy * sp * cr + sy * cp * sr
+    quats[:, 2] = sy * cp * cr - cy * sp * sr
+    quats[:, 3] = cy * cp * sr - sy * sp * cr
+    return quats
+
+class SeqArrays:
+    """NumPy view of a SEQ chunk.
+
+    The frame table is decoded as a structured array and the bone tracks are
+    gathered into contiguous per-key arrays (see SeqTrack). Rotation values are
+    the raw int16 (roll, pitch, yaw) triplets.
+    """
+
+    def __init__(self, data):
+        self.name, info, data_block = read_chunk_info(data, "SEQB", CPJ_SEQ_INFO)
+        (self.play_rate, num_frames, offset_frames, num_events, offset_events,
+         num_bone_info, offset_bone_info, num_translate, offset_translate,
+         num_rotate, offset_rotate, num_scale, offset_scale) = info
+
+        self.num_frames = num_frames
+        self.frames = read_table(data, data_block, offset_frames, num_frames, SEQ_FRAME_DTYPE)
+        events = read_table(data, data_block, offset_events, num_events, SEQ_EVENT_DTYPE)
+        bone_info = read_table(data, data_block, offset_bone_info, num_bone_info, SEQ_BONE_INFO_DTYPE)
+        translate = read_table(data, data_block, offset_translate, num_translate, SEQ_BONE_TRANSLATE_DTYPE)
+        rotate = read_table(data, data_block, offset_rotate, num_rotate, SEQ_BONE_ROTATE_DTYPE)
+        scale = read_table(data, data_block, offset_scale, num_scale, SEQ_BONE_SCALE_DTYPE)
+
+        def read_optional_str(offset):
+            if offset == -1:
+                return None
+            return read_c_string(data, data_block + offset, len(data))
+
+        self.vert_frame_names = [read_optional_str(offset) for offset in self.frames["offset_vert_frame_name"].tolist()]
+
+        self.events = []
+        for event_type, time, offset_param_str in events.tolist():
+            self.events.append(SeqEvent(bytes(event_type).decode("ASCII"), time, read_optional_str(offset_param_str)))
+
+        self.bone_names = [read_c_string(data, data_block + offset, len(data)) for offset in bone_info["offset_name"].tolist()]
+        self.bone_src_length = bone_info["src_length"]
+
+        frames = self.frames
+        self.translate = SeqTrack(translate, translate["translate"],
+                                  frames["first_bone_translate"], frames["num_bone_translate"])
+        rotate_value = np.stack((rotate["roll"], rotate["pitch"], rotate["yaw"]), axis=1)
+        self.rotate = SeqTrack(rotate, rotate_value,
+                               frames["first_bone_rotate"], frames["num_bone_rotate"])
+        self.scale = SeqTrack(scale, scale["scale"],
+                              frames["first_bone_scale"], frames["num_bone_scale"])
+        self._rotate_quaternions = None
+
+    def precompute(self):
+        # Build the derived arrays up front, used by the decode worker processes
+        self.rotate_quaternions()
+        for track in (self.translate, self.rotate, self.scale):
+            track.bone_keys()
+
+    def rotate_quaternions(self):
+        # The rotation track converted to (keys, 4) w,x,y,z quaternions.
+        # Cached, so the conversion only happens once per import.
+        if self._rotate_quaternions is None:
+            self._rotate_quaternions = seq_rotations_to_quaternions(self.rotate.value)
+        return self._rotate_quaternions
+
+class FrmArrays:
+    """NumPy view of a FRM chunk.
+
+    The vertex tables of the frames are only read when positions() is called.
+    The expanded positions are cached, so every object using the chunk shares one decode.
+    """
+
+    def __init__(self, data):
+        self.name, info, data_block = read_chunk_info(data, "FRMB", CPJ_FRM_INFO)
+        self.bb_min = info[0:3]
+        self.bb_max = info[3:6]
+        num_frames, offset_frames = info[6:8]
+
+        self.frames = read_table(data, data_block, offset_frames, num_frames, FRM_FRAME_DTYPE)
+        self.frame_names = [read_c_string(data, data_block + offset, len(data)) for offset in self.frames["offset_name"].tolist()]
+        self.num_frames = num_frames
+
+        self._data = data
+        self._data_block = data_block
+        self._positions = {}
+
+    def precompute(self):
+        # Expand the positions up front and drop the reference to the chunk data.
+        # Used by the decode worker processes so only the expanded positions are sent back.
+        # raw_frame() can't be used afterwards.
+        self.positions()
+        self._data = None
+
+    def raw_frame(self, frame_index):
+        # Returns the (groups, verts) tables of a frame as stored in the file.
+        # "groups" is None for uncompressed frames, then "verts" is a (verts, 3) float32 array.
+        if self._data == None:
+            raise ValueError("The chunk data of FRM chunk " + str(self.name) + " has been released by precompute()")
+        frame = self.frames[frame_index]
+        data, data_block = self._data, self._data_block
+        num_verts = int(frame["num_verts"])
+        if frame["num_groups"] == 0:
+            return None, read_table(data, data_block, int(frame["data_offset_verts"]), num_verts, FRM_VEC3F_DTYPE)
+        groups = read_table(data, data_block, int(frame["data_offset_groups"]), int(frame["num_groups"]), FRM_GROUP_DTYPE)
+        return groups, read_table(data, data_block, int(frame["data_offset_verts"]), num_verts, FRM_BYTE_POS_DTYPE)
+
+    def positions(self, blender_axes=True):
+        # Returns the vertex positions of all frames as a (frames, verts, 3) float32 array.
+        # Byte compressed frames are expanded with their group scale and translation.
+        # The returned array is shared between calls and must not be modified.
+        if blender_axes not in self._positions:
+            self._positions[blender_axes] = self._expand_positions(blender_axes)
+        return self._positions[blender_axes]
+
+    def _expand_positions(self, blender_axes):
+        frames = self.frames
+        if self.num_frames == 0:
+            return np.zeros((0, 0, 3), dtype=np.float32)
+
+        if self._data == None:
+            # Only the Blender space positions are left after precompute(), swap the axes back (this is exact)
+            pos = self._positions[True]
+            return pos[..., BLENDER_AXES] * np.array([1.0, 1.0, -1.0], dtype=np.float32)
+
+        num_verts = int(frames["num_verts"][0])
+        if np.any(frames["num_verts"] != num_verts):
+            raise ImportError("The frames in FRM chunk " + str(self.name) + " don't have the same number of vertices")
+
+        data, data_block = self._data, self._data_block
+        out = np.empty((self.num_frames, num_verts, 3), dtype=np.float32)
+
+        compressed = np.flatnonzero(frames["num_groups"] != 0)
+        uncompressed = np.flatnonzero(frames["num_groups"] == 0)
+
+        for i in uncompressed.tolist():
+            pos = read_table(data, data_block, int(frames["data_offset_verts"][i]), num_verts, FRM_VEC3F_DTYPE)
+            if blender_axes:
+                pos = pos[:, BLENDER_AXES] * BLENDER_AXES_SIGN
+            out[i] = pos
+
+        if len(compressed) != 0:
+            # Stack the group tables of all compressed frames so every vertex can be expanded in a single gather
+            num_groups = frames["num_groups"][compressed].astype(np.intp)
+            group_base = np.zeros(len(compressed), dtype=np.intp)
+            np.cumsum(num_groups[:-1], out=group_base[1:])
+
+            groups = np.concatenate([read_table(data, data_block, int(frames["data_offset_groups"][i]), int(frames["num_groups"][i]), FRM_GROUP_DTYPE)
+                                     for i in compressed.tolist()])
+            byte_pos = np.stack([read_table(data, data_block, int(frames["data_offset_verts"][i]), num_verts, FRM_BYTE_POS_DTYPE)
+                                 for i in compressed.tolist()])
+
+            group_index = byte_pos["group"].astype(np.intp)
+            if np.any(group_index >= num_groups[:, None]):
+                raise ImportError("A compressed vertex in FRM chunk " + str(self.name) + " references a group that doesn't exist")
+            group_index += group_base[:, None]
+
+            scale = groups["byte_scale"]
+            translate = groups["byte_translate"]
+            pos = byte_pos["pos"]
+            if blender_axes:
+                # Swap the axes of the group tables and the byte positions before expanding
+                # so the expanded positions are written directly in Blender space
+                scale = scale[:, BLENDER_AXES] * BLENDER_AXES_SIGN
+                translate = translate[:, BLENDER_AXES] * BLENDER_AXES_SIGN
+                pos = pos[..., BLENDER_AXES]
+
+            out[compressed] = pos * scale[group_index] + translate[group_index]
+
+        return out
+
+@dataclass
+class SrfTexture:
+    name: str
+    # None if the texture doesn't have a reference name
+    ref_name: str
+
+class SrfArrays:
+    """NumPy view of a SRF chunk.
+
+    "tris" is a structured array, "uv_index" (T,3) and "uvs" (N,2) are plain views of it.
+    """
+
+    def __init__(self, data):
+        self.name, info, data_block = read_chunk_info(data, "SRFB", CPJ_SRF_INFO)
+        num_textures, offset_textures, num_tris, offset_tris, num_uvs, offset_uvs = info
+
+        textures = read_table(data, data_block, offset_textures, num_textures, SRF_TEXTURE_DTYPE)
+        self.tris = read_table(data, data_block, offset_tris, num_tris, SRF_TRI_DTYPE)
+        self.uvs = read_table(data, data_block, offset_uvs, num_uvs, SRF_UV_DTYPE)
+        self.num_tris = num_tris
+
+        self.textures = []
+        for offset_name, offset_ref_name in textures.tolist():
+            ref_name = None
+            if offset_ref_name != 0:
+                ref_name = read_c_string(data, data_block + offset_ref_name, len(data))
+            self.textures.append(SrfTexture(read_c_string(data, data_block + offset_name, len(data)), ref_name))
+
+        self.uv_index = self.tris["uv_index"]
+        self.tex_index = self.tris["tex_index"]
+
+def quaternions_to_matrices(quats):
+    # Converts (N,4) x, y, z, s quaternions to (N,3,3) rotation matrices
+    quats = quats.astype(np.float64)
+    quats = quats / np.linalg.norm(quats, axis=1)[:, None]
+    x, y, z, w = quats[:, 0], quats[:, 1], quats[:, 2], quats[:, 3]
+
+    matrices = np.empty((len(quats), 3, 3))
+    matrices[:, 0, 0] = 1.0 - 2.0 * (y * y + z * z)
+    matrices[:, 0, 1] = 2.0 * (x * y - w * z)
+    matrices[:, 0, 2] = 2.0 * (x * z + w * y)
+    matrices[:, 1, 0] = 2.0 * (x * y + w * z)
+    matrices[:, 1, 1] = 1.0 - 2.0 * (x * x + z * z)
+    matrices[:, 1, 2] = 2.0 * (y * z - w * x)
+    matrices[:, 2, 0] = 2.0 * (x * z - w * y)
+    matrices[:, 2, 1] = 2.0 * (y * z + w * x)
+    matrices[:, 2, 2] = 1.0 - 2.0 * (x * x + y * y)
+    return matrices
+
+class SklArrays:
+    """NumPy view of a SKL chunk.
+
+    The bone, vertex, weight and mount tables are structured arrays.
+    The bone fields are also exposed as plain arrays, like "base_rotate" (B,4) in x, y, z, s order.
+    """
+
+    def __init__(self, data):
+        self.name, info, data_block = read_chunk_info(data, "SKLB", CPJ_SKL_INFO)
+        (num_bones, offset_bones, num_verts, offset_verts,
+         num_weights, offset_weights, num_mounts, offset_mounts) = info
+
+        self.bones = read_table(data, data_block, offset_bones, num_bones, SKL_BONE_DTYPE)
+        self.verts = read_table(data, data_block, offset_verts, num_verts, SKL_VERT_DTYPE)
+        self.weights = read_table(data, data_block, offset_weights, num_weights, SKL_WEIGHT_DTYPE)
+        self.mounts = read_table(data, data_block, offset_mounts, num_mounts, SKL_MOUNT_DTYPE)
+
+        self.bone_names = [read_c_string(data, data_block + offset, len(data)) for offset in self.bones["offset_name"].tolist()]
+        self.mount_names = [read_c_string(data, data_block + offset, len(data)) for offset in self.mounts["offset_name"].tolist()]
+
+        self.parent_index = self.bones["parent_index"]
+        self.base_scale = self.bones["base_scale"]
+        self.base_rotate = self.bones["base_rotate"]
+        self.base_translate = self.bones["base_translate"]
+        self.length = self.bones["length"]
+
+    def rest_matrices(self):
+        # Computes the armature space rest matrices of all bones in Blender axes.
+        # Returns the (bones, 4, 4) matrices with orthonormal rotations and the (bones,) bone lengths
+        # with the bone scale applied. This is the rest pose that applying the base transforms
+        # as a pose on bones pointing along the CPJ Y axis gives.
+        num_bones = len(self.bones)
+        parent_index = self.parent_index.astype(np.intp)
+        if np.any(parent_index >= num_bones):
+            raise ImportError("A bone in skeleton " + str(self.name) + " has a parent that doesn't exist")
+
+        # Local bone transforms: translate @ rotate @ scale
+        local = np.zeros((num_bones, 4, 4))
+        local[:, :3, :3] = quaternions_to_matrices(self.base_rotate) * self.base_scale[:, None, :]
+        local[:, :3, 3] = self.base_translate
+        local[:, 3, 3] = 1.0
+
+        # Forward kinematics, one batch per level of the bone hierarchy
+        matrices = np.empty_like(local)
+        is_root = parent_index < 0
+        matrices[is_root] = BLENDER_AXES_MATRIX @ local[is_root]
+        processed = is_root
+        while not np.all(processed):
+            ready = ~processed & processed[parent_index]
+            if not np.any(ready):
+                raise ImportError("The bone hierarchy in skeleton " + str(self.name) + " has a cycle")
+            matrices[ready] = matrices[parent_index[ready]] @ local[ready]
+            processed = processed | ready
+
+        # Shorter axes than this are treated as zero length
+        eps = 1e-6
+
+        # The rest matrices can't contain scale, so move it into the bone length
+        y_axis = matrices[:, :3, 1]
+        y_len = np.linalg.norm(y_axis, axis=1)
+        # A bone with no length along its own axis (zero scale) has no direction to point in.
+        # Written as "not greater" so NaN values are caught as well.
+        degenerate = ~(y_len > eps)
+        if np.any(degenerate):
+            bone_index = np.flatnonzero(degenerate)[0]
+            raise ImportError("Bone " + self.bone_names[bone_index] + " in skeleton " + str(self.name) + " is degenerate (zero scale along the bone axis)")
+        lengths = self.length * y_len
+        y_axis = y_axis / y_len[:, None]
+
+        z_axis = matrices[:, :3, 2]
+        z_axis = z_axis - np.sum(z_axis * y_axis, axis=1)[:, None] * y_axis
+        z_len = np.linalg.norm(z_axis, axis=1)
+        # If the Z axis is collapsed or collinear with the bone axis, derive it from the X axis instead
+        fallback = ~(z_len > eps)
+        if np.any(fallback):
+            z_axis[fallback] = np.cross(matrices[fallback, :3, 0], y_axis[fallback])
+            z_len[fallback] = np.linalg.norm(z_axis[fallback], axis=1)
+            # If that doesn't work either, use the world axis that is least aligned with the bone
+            fallback = ~(z_len > eps)
+            if np.any(fallback):
+                fallback_y = y_axis[fallback]
+                world_axis = np.eye(3)[np.argmin(np.abs(fallback_y), axis=1)]
+                z_axis[fallback] = world_axis - np.sum(world_axis * fallback_y, axis=1)[:, None] * fallback_y
+                z_len[fallback] = np.linalg.norm(z_axis[fallback], axis=1)
+        z_axis /= z_len[:, None]
+
+        rest = np.zeros_like(matrices)
+        rest[:, :3, 0] = np.cross(y_axis, z_axis)
+        rest[:, :3, 1] = y_axis
+        rest[:, :3, 2] = z_axis
+        rest[:, :, 3] = matrices[:, :, 3]
+        return rest, lengths
+
+CHUNK_DECODERS = {
+    "GEOB": GeoArrays,
+    "SRFB": SrfArrays,
+    "SKLB": SklArrays,
+    "FRMB": FrmArrays,
+    "SEQB": SeqArrays,
+}
+
+# Starting the worker processes takes about a second, so only large files are decoded in parallel
+PARALLEL_DECODE_MIN_BYTES = 32 * 1024 * 1024
+
+# The shared memory block with the chunk data, attached once per worker process
+_worker_chunk_memory = None
+
+def _init_decode_worker(shared_memory_name):
+    global _worker_chunk_memory
+    _worker_chunk_memory = shared_memory.SharedMemory(name=shared_memory_name)
+
+def _decode_shared_chunk(chunk_type, offset, size):
+    # Copy the chunk out of the shared memory so the decoded arrays don't reference it.
+    # The arrays are pickled when they are sent back to the main process anyway.
+    data = bytes(_worker_chunk_memory.buf[offset:offset + size])
+    arrays = CHUNK_DECODERS[chunk_type](data)
+    # The FRM frame expansion and the SEQ track conversions are the expensive part of decoding.
+    # Do them here as well, this also leaves out the FRM chunk data when the arrays are sent back.
+    if chunk_type in ("FRMB", "SEQB"):
+        arrays.precompute()
+    return arrays
+
+def decode_chunks_parallel(chunks, max_workers=None):
+    # Decode a list of (chunk_type, data) in worker processes.
+    # The chunk data is passed to the workers through one shared memory block.
+    chunk_views = [memoryview(data).cast("B") for _, data in chunks]
+    total_size = sum(view.nbytes for view in chunk_views)
+
+    chunk_memory = shared_memory.SharedMemory(create=True, size=max(total_size, 1))
+    try:
+        offsets = []
+        offset = 0
+        for view in chunk_views:
+            chunk_memory.buf[offset:offset + view.nbytes] = view
+            offsets.append(offset)
+            offset += view.nbytes
+
+        # Start the workers with "spawn" as forking a process with Blender loaded is not safe
+        mp_context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context,
+                                 initializer=_init_decode_worker, initargs=(chunk_memory.name,)) as executor:
+            # Submit the largest chunks first to keep all workers busy until the end
+            order = sorted(range(len(chunks)), key=lambda i: chunk_views[i].nbytes, reverse=True)
+            futures = {}
+            for i in order:
+                futures[i] = executor.submit(_decode_shared_chunk, chunks[i][0], offsets[i], chunk_views[i].nbytes)
+            return [futures[i].result() for i in range(len(chunks))]
+    finally:
+        chunk_memory.close()
+        chunk_memory.unlink()
+
+def decode_chunks(cpj_data, parallel=True, max_workers=None):
+    # Decode all chunks in a "load_cpj_data" style dict into their array classes.
+    # Returns a dict with the same layout. Chunk types without an array class are left out.
+    chunks = []
+    for chunk_type, chunk_list in cpj_data.items():
+        if chunk_type in CHUNK_DECODERS:
+            chunks += [(chunk_type, data) for data in chunk_list]
+
+    decoded = None
+    total_size = sum(memoryview(data).nbytes for _, data in chunks)
+    if parallel and len(chunks) > 1 and total_size >= PARALLEL_DECODE_MIN_BYTES:
+        try:
+            decoded = decode_chunks_parallel(chunks, max_workers)
+        except (OSError, BrokenProcessPool) as e:
+            print("Parallel chunk decoding failed, decoding serially instead: " + str(e))
+
+    if decoded == None:
+        decoded = [CHUNK_DECODERS[chunk_type](data) for chunk_type, data in chunks]
+
+    decoded_data = {}
+    for (chunk_type, _), arrays in zip(chunks, decoded):
+        decoded_data.setdefault(chunk_type, []).append(arrays)
+    return decoded_data
+
+def as_records(array, dtype):
+    # Convert writer input into a contiguous array of "dtype" records.
+    # Structured arrays are matched by field name (missing fields, like "reserved", are zero filled).
+    # Plain arrays need one column per scalar in the record (a "(3,)" field takes three columns).
+    array = np.asarray(array)
+    if array.dtype == dtype:
+        return np.ascontiguousarray(array)
+    if dtype.names == None:
+        # Plain record types, like (3,) float vectors
+        return np.ascontiguousarray(array, dtype=dtype.base).reshape(array.shape[:array.ndim - len(dtype.shape)] + dtype.shape)
+    if array.dtype.names != None:
+        records = np.zeros(array.shape, dtype=dtype)
+        for name in dtype.names:
+            if name in array.dtype.names:
+                records[name] = array[name]
+        return records
+    return rfn.unstructured_to_structured(array, dtype=dtype)
+
+def write_records(byte_arr, pos, records):
+    # Copy the raw bytes of a record array into the chunk byte array
+    if records.size == 0:
+        return
+    np.frombuffer(byte_arr, dtype=np.uint8, count=records.nbytes, offset=pos)[:] = records.reshape(-1).view(np.uint8)
+
+def build_geo_topology(tris, num_verts, edge_keys=None):
+    # Builds the GEO vertex, edge, triangle and object link tables from a (T,3) triangle vertex index array.
+    # Every triangle corner is a half edge, edge "3 * t + k" goes from tris[t][k] to tris[t][(k + 1) % 3].
+    # The "tris" winding is reversed in the edge rings, like the CPJ coordinate system requires.
+    # Returns (verts, edges, tris, obj_links), only the link fields of "verts" are filled in.
+    # The links are listed in the order the BMesh based export wrote them in.
+    # "edge_keys" are the (E,2) vertex pairs of the mesh edges (like the mesh "edges" table) in the order
+    # they were created in, this is the order BMesh walks the edges around a vertex in.
+    # Edges that are not in "edge_keys" (or all of them if it is None) follow in the order "tris" first uses them.
+    tris = np.asarray(tris, dtype=np.intp).reshape(-1, 3)
+    num_tris = len(tris)
+    num_edges = num_tris * 3
+
+    edge_tri = np.repeat(np.arange(num_tris), 3)
+    tail_vertex = tris.ravel()
+    head_vertex = tris[:, [1, 2, 0]].ravel()
+
+    # Join the half edges that share the same undirected edge by sorting on the edge key.
+    # The sorted half edges of an edge form its radial cycle.
+    edge_key = np.minimum(tail_vertex, head_vertex) * num_verts + np.maximum(tail_vertex, head_vertex)
+    radial_order = np.argsort(edge_key, kind="stable")
+    sorted_key = edge_key[radial_order]
+    is_radial_start = np.r_[True, sorted_key[1:] != sorted_key[:-1]][:num_edges]
+    radial_starts = np.flatnonzero(is_radial_start)
+    radial_sizes = np.diff(np.r_[radial_starts, num_edges])
+
+    radial_id = np.empty(num_edges, dtype=np.intp)
+    radial_id[radial_order] = np.cumsum(is_radial_start) - 1
+    radial_pos = np.empty(num_edges, dtype=np.intp)
+    radial_pos[radial_order] = np.arange(num_edges) - radial_starts[np.cumsum(is_radial_start) - 1]
+    radial_start = radial_starts[radial_id]
+    radial_size = radial_sizes[radial_id]
+
+    # The creation order of the undirected edges
+    num_radials = len(radial_starts)
+    radial_keys = sorted_key[radial_starts]
+    is_listed = np.zeros(num_radials, dtype=bool)
+    listed_index = np.zeros(num_radials, dtype=np.intp)
+    if edge_keys is not None and len(edge_keys) != 0 and num_radials != 0:
+        edge_keys = np.asarray(edge_keys, dtype=np.intp).reshape(-1, 2)
+        keys = np.minimum(edge_keys[:, 0], edge_keys[:, 1]) * num_verts + np.maximum(edge_keys[:, 0], edge_keys[:, 1])
+        key_pos = np.minimum(np.searchsorted(radial_keys, keys), num_radials - 1)
+        found = np.flatnonzero(radial_keys[key_pos] == keys)
+        # Assign in reverse so the first of any duplicate edges is used
+        listed_index[key_pos[found[::-1]]] = found[::-1]
+        is_listed[key_pos[found]] = True
+    first_use = radial_order[radial_starts]
+    radial_rank = np.empty(num_radials, dtype=np.intp)
+    radial_rank[np.lexsort((first_use, listed_index, ~is_listed))] = np.arange(num_radials)
+    rank_radial = np.argsort(radial_rank)
+
+    # The half edge that was added to the radial cycle last, BMesh iterates the cycle starting from it
+    radial_last = radial_order[radial_starts + radial_sizes - 1]
+
+    # BMesh walks the edges around a vertex in creation order. It starts at the first created edge
+    # if the last half edge added to it starts at the vertex, otherwise at the next edge of that triangle.
+    corner_rank = radial_rank[radial_id]
+    vert_first_rank = np.full(num_verts, num_radials, dtype=np.intp)
+    np.minimum.at(vert_first_rank, tail_vertex, corner_rank)
+    np.minimum.at(vert_first_rank, head_vertex, corner_rank)
+    used_verts = np.flatnonzero(vert_first_rank < num_radials)
+    first_last = radial_last[rank_radial[vert_first_rank[used_verts]]]
+    first_next = first_last - first_last % 3 + (first_last + 1) % 3
+    vert_start_rank = np.zeros(num_verts, dtype=np.intp)
+    vert_start_rank[used_verts] = np.where(tail_vertex[first_last] == used_verts, vert_first_rank[used_verts], corner_rank[first_next])
+
+    # Vertex links, one edge and one triangle link per triangle corner that uses the vertex.
+    # The edge links of a vertex are followed by its triangle links.
+    # The corners are sorted by vertex, then by edge in the walk order above and
+    # finally in radial cycle order starting from the last added half edge.
+    disk_pos = (corner_rank - vert_start_rank[tail_vertex]) % max(num_radials, 1)
+    is_not_last = radial_last[radial_id] != np.arange(num_edges)
+    vert_order = np.lexsort((np.arange(num_edges), is_not_last, disk_pos, tail_vertex))
+    vert_num_links = np.bincount(tail_vertex, minlength=num_verts)
+    vert_first_link = np.zeros(num_verts, dtype=np.intp)
+    np.cumsum(vert_num_links[:-1], out=vert_first_link[1:])
+
+    vert_links = np.empty(num_edges * 2, dtype=np.intp)
+    link_pos = np.arange(num_edges) + vert_first_link[tail_vertex[vert_order]]
+    vert_links[link_pos] = vert_order
+    vert_links[link_pos + vert_num_links[tail_vertex[vert_order]]] = edge_tri[vert_order]
+
+    # Edge links, the triangles of the radial cycle starting with the triangle of the edge itself
+    edge_first_link = np.zeros(num_edges, dtype=np.intp)
+    np.cumsum(radial_size[:-1], out=edge_first_link[1:])
+    link_edge = np.repeat(np.arange(num_edges), radial_size)
+    link_step = np.arange(len(link_edge)) - edge_first_link[link_edge]
+    link_radial_pos = (radial_pos[link_edge] + link_step) % radial_size[link_edge]
+    edge_links = edge_tri[radial_order[radial_start[link_edge] + link_radial_pos]]
+
+    verts = np.zeros(num_verts, dtype=GEO_VERT_DTYPE)
+    verts["num_edge_links"] = vert_num_links
+    verts["num_tri_links"] = vert_num_links
+    verts["first_edge_link"] = vert_first_link * 2
+    verts["first_tri_link"] = vert_first_link * 2 + vert_num_links
+
+    edges = np.zeros(num_edges, dtype=GEO_EDGE_DTYPE)
+    edges["head_vertex"] = head_vertex
+    edges["tail_vertex"] = tail_vertex
+    # The next half edge in the radial cycle, or the edge itself if it is a boundary edge
+    edges["inverted_edge"] = radial_order[radial_start + (radial_pos + 1) % radial_size]
+    edges["num_tri_links"] = radial_size
+    edges["first_tri_link"] = num_edges * 2 + edge_first_link
+
+    geo_tris = np.zeros(num_tris, dtype=GEO_TRI_DTYPE)
+    geo_tris["edge_ring"] = np.arange(num_edges).reshape(-1, 3)[:, ::-1]
+
+    obj_links = np.concatenate((vert_links, edge_links))
+
+    return verts, edges, geo_tris, obj_links
+
+def create_geo_byte_array_from_arrays(name, verts, edges, tris, mounts, mount_names, obj_links):
+    # Array version of create_geo_byte_array.
+    # The "offset_name" field of the mounts is filled in from "mount_names".
+    verts = as_records(verts, GEO_VERT_DTYPE)
+    edges = as_records(edges, GEO_EDGE_DTYPE)
+    tris = as_records(tris, GEO_TRI_DTYPE)
+    mounts = as_records(mounts, GEO_MOUNT_DTYPE).copy()
+    obj_links = as_records(obj_links, GEO_OBJ_LINK_DTYPE)
+
+    name_bytes, name_offsets, data_block_offset = layout_chunk_name(name)
+
+    offset_verts = data_block_offset
+    data_block_offset += verts.nbytes
+
+    offset_edges = data_block_offset
+    data_block_offset += edges.nbytes
+
+    offset_tris = data_block_offset
+    data_block_offset += tris.nbytes
+
+    mount_name_bytes, mount_str_offsets, data_block_offset = layout_strings(mount_names, data_block_offset)
+    mounts["offset_name"] = mount_str_offsets
+
+    offset_mounts = data_block_offset
+    data_block_offset += mounts.nbytes
+
+    offset_obj_links = data_block_offset
+    data_block_offset += obj_links.nbytes
+
+    byte_arr, data_start = allocate_chunk(CPJ_GEO_MAGIC, CPJ_GEO_VERSION, CPJ_GEO_INFO, data_block_offset)
+
+    CPJ_GEO_INFO.pack_into(byte_arr, CPJ_CHUNK_HEADER.size,
+                           len(verts), offset_verts,
+                           len(edges), offset_edges,
+                           len(tris), offset_tris,
+                           len(mounts), offset_mounts,
+                           len(obj_links), offset_obj_links)
+
+    write_strings(byte_arr, data_start, name_bytes, name_offsets)
+    write_records(byte_arr, data_start + offset_verts, verts)
+    write_records(byte_arr, data_start + offset_edges, edges)
+    write_records(byte_arr, data_start + offset_tris, tris)
+    write_strings(byte_arr, data_start, mount_name_bytes, mount_str_offsets)
+    write_records(byte_arr, data_start + offset_mounts, mounts)
+    write_records(byte_arr, data_start + offset_obj_links, obj_links)
+
+    return byte_arr
+
+def compress_frm_positions(verts, group_index):
+    # Byte compresses (frames, verts, 3) vertex positions for a FRM chunk.
+    # Each vertex group gets its own per frame scale and translation that maps its bounding box to 0-255.
+    # "group_index" is the (verts,) group of every vertex.
+    # Returns the (frames, groups) group tables, the (frames, verts) byte positions and the maximum reconstruction error.
+    verts = np.asarray(verts, dtype=np.float32)
+    group_index = np.asarray(group_index, dtype=np.intp)
+    num_frames = len(verts)
+    num_groups = int(group_index.max()) + 1
+
+    # Sort the vertices by group so the group bounds can be reduced in one go
+    vert_order = np.argsort(group_index, kind="stable")
+    sorted_groups = group_index[vert_order]
+    used_groups = np.unique(sorted_groups)
+    group_starts = np.searchsorted(sorted_groups, used_groups)
+    sorted_verts = verts[:, vert_order]
+
+    group_min = np.zeros((num_frames, num_groups, 3), dtype=np.float32)
+    group_max = np.zeros((num_frames, num_groups, 3), dtype=np.float32)
+    group_min[:, used_groups] = np.minimum.reduceat(sorted_verts, group_starts, axis=1)
+    group_max[:, used_groups] = np.maximum.reduceat(sorted_verts, group_starts, axis=1)
+
+    groups = np.zeros((num_frames, num_groups), dtype=FRM_GROUP_DTYPE)
+    groups["byte_scale"] = (group_max - group_min) / np.float32(255.0)
+    groups["byte_translate"] = group_min
+
+    vert_scale = groups["byte_scale"][:, group_index]
+    vert_translate = groups["byte_translate"][:, group_index]
+    # Groups that are flat along an axis have a zero scale, their vertices are all at the translation.
+    pos = np.divide(verts - vert_translate, vert_scale, out=np.zeros_like(verts), where=vert_scale > 0)
+    pos = np.clip(np.rint(pos), 0, 255).astype(np.uint8)
+
+    byte_pos = np.zeros((num_frames, len(group_index)), dtype=FRM_BYTE_POS_DTYPE)
+    byte_pos["group"] = group_index
+    byte_pos["pos"] = pos
+
+    # Expand the positions like the importer does to measure the error
+    max_error = float(np.abs(pos * vert_scale + vert_translate - verts).max(initial=0.0))
+
+    return groups, byte_pos, max_error
+
+def create_frm_byte_array_from_arrays(name, total_bb, frame_names, bb_min, bb_max, verts, groups=None):
+    # Array version of create_frm_byte_array.
+    # "verts" is a (frames, verts, 3) array of uncompressed positions if "groups" is None.
+    # Otherwise all frames are byte compressed: "groups" holds the (frames, groups) group tables
+    # and "verts" the (frames, verts) byte positions.
+    num_frames = len(frame_names)
+    bb_min = as_records(bb_min, FRM_VEC3F_DTYPE)
+    bb_max = as_records(bb_max, FRM_VEC3F_DTYPE)
+    if groups is None:
+        verts = as_records(verts, FRM_VEC3F_DTYPE)
+        groups = np.zeros((num_frames, 0), dtype=FRM_GROUP_DTYPE)
+    else:
+        verts = as_records(verts, FRM_BYTE_POS_DTYPE)
+        groups = as_records(groups, FRM_GROUP_DTYPE)
+
+    if len(verts) != num_frames or len(groups) != num_frames or len(bb_min) != num_frames or len(bb_max) != num_frames:
+        raise ValueError("All FRM frame arrays need to have the same number of frames")
+
+    num_groups = groups.shape[1]
+    num_verts = verts.shape[1] if verts.ndim > 1 else 0
+    frame_groups_size = groups[0].nbytes if num_frames != 0 else 0
+    frame_verts_size = verts[0].nbytes if num_frames != 0 else 0
+
+    name_bytes, name_offsets, data_block_offset = layout_chunk_name(name)
+
+    records = np.zeros(num_frames, dtype=FRM_FRAME_DTYPE)
+    records["bb_min"] = bb_min
+    records["bb_max"] = bb_max
+    records["num_groups"] = num_groups
+    records["num_verts"] = num_verts
+
+    # Each frame stores its name, groups and verts next to each other
+    frame_name_bytes = []
+    for i, frame_name in enumerate(frame_names):
+        byte_strs, offsets, data_block_offset = layout_strings([frame_name], data_block_offset)
+        frame_name_bytes += byte_strs
+        records["offset_name"][i] = offsets[0]
+        records["data_offset_groups"][i] = data_block_offset
+        data_block_offset += frame_groups_size
+        records["data_offset_verts"][i] = data_block_offset
+        data_block_offset += frame_verts_size
+
+    offset_frames = data_block_offset
+    data_block_offset += records.nbytes
+
+    byte_arr, data_start = allocate_chunk(CPJ_FRM_MAGIC, CPJ_FRM_VERSION, CPJ_FRM_INFO, data_block_offset)
+
+    CPJ_FRM_INFO.pack_into(byte_arr, CPJ_CHUNK_HEADER.size, *total_bb[0][:3], *total_bb[1][:3], num_frames, offset_frames)
+
+    write_strings(byte_arr, data_start, name_bytes, name_offsets)
+    write_strings(byte_arr, data_start, frame_name_bytes, records["offset_name"].tolist())
+    for i in range(num_frames):
+        write_records(byte_arr, data_start + int(records["data_offset_groups"][i]), groups[i])
+        write_records(byte_arr, data_start + int(records["data_offset_verts"][i]), verts[i])
+    write_records(byte_arr, data_start + offset_frames, records)
+
+    return byte_arr
+
+def create_lod_byte_array_from_arrays(name, levels, tris, vert_relay):
+    # Array version of create_lod_byte_array
+    levels = as_records(levels, LOD_LEVEL_DTYPE)
+    tris = as_records(tris, LOD_TRI_DTYPE)
+    vert_relay = as_records(vert_relay, LOD_VERT_RELAY_DTYPE)
+
+    name_bytes, name_offsets, data_block_offset = layout_chunk_name(name)
+
+    offset_levels = data_block_offset
+    data_block_offset += levels.nbytes
+
+    offset_tris = data_block_offset
+    data_block_offset += tris.nbytes
+
+    offset_vert_relay = data_block_offset
+    data_block_offset += vert_relay.nbytes
+
+    byte_arr, data_start = allocate_chunk(CPJ_LOD_MAGIC, CPJ_LOD_VERSION, CPJ_LOD_INFO, data_block_offset)
+
+    CPJ_LOD_INFO.pack_into(byte_arr, CPJ_CHUNK_HEADER.size,
+                           len(levels), offset_levels,
+                           len(tris), offset_tris,
+                           len(vert_relay), offset_vert_relay)
+
+    write_strings(byte_arr, data_start, name_bytes, name_offsets)
+    write_records(byte_arr, data_start + offset_levels, levels)
+    write_records(byte_arr, data_start + offset_tris, tris)
+    write_records(byte_arr, data_start + offset_vert_relay, vert_relay)
+
+    return byte_arr
+
+def create_seq_byte_array_from_arrays(name, play_rate, frames, vert_frame_names, events, bone_names, bone_src_length,
+                                      bone_translate, bone_rotate, bone_scale):
+    # Array version of create_seq_byte_array.
+    # "events" is a list of (event_type, time, param_str) like in the list version and
+    # the "offset_vert_frame_name" field of the frames is filled in from "vert_frame_names".
+    frames = as_records(frames, SEQ_FRAME_DTYPE).copy()
+    bone_info = np.zeros(len(bone_names), dtype=SEQ_BONE_INFO_DTYPE)
+    bone_info["src_length"] = bone_src_length
+    bone_translate = as_records(bone_translate, SEQ_BONE_TRANSLATE_DTYPE)
+    bone_rotate = as_records(bone_rotate, SEQ_BONE_ROTATE_DTYPE)
+    bone_scale = as_records(bone_scale, SEQ_BONE_SCALE_DTYPE)
+
+    name_bytes, name_offsets, data_block_offset = layout_chunk_name(name)
+
+    vert_f_name_bytes, vert_f_name_offsets, data_block_offset = layout_optional_strings(vert_frame_names, data_block_offset)
+    frames["offset_vert_frame_name"] = vert_f_name_offsets
+
+    offset_frames = data_block_offset
+    data_block_offset += frames.nbytes
+
+    event_str_bytes, event_str_offsets, data_block_offset = layout_optional_strings([event_data[2] for event_data in events], data_block_offset)
+    event_records = np.zeros(len(events), dtype=SEQ_EVENT_DTYPE)
+    for i, event_data in enumerate(events):
+        event_records[i] = (bytes(event_data[0], "ASCII"), event_data[1], event_str_offsets[i])
+
+    offset_events = data_block_offset
+    data_block_offset += event_records.nbytes
+
+    bone_info_str_bytes, bone_info_str_off, data_block_offset = layout_strings(bone_names, data_block_offset)
+    bone_info["offset_name"] = bone_info_str_off
+
+    offset_bone_info = data_block_offset
+    data_block_offset += bone_info.nbytes
+
+    offset_bone_translate = data_block_offset
+    data_block_offset += bone_translate.nbytes
+
+    offset_bone_rotate = data_block_offset
+    data_block_offset += bone_rotate.nbytes
+
+    offset_bone_scale = data_block_offset
+    data_block_offset += bone_scale.nbytes
+
+    byte_arr, data_start = allocate_chunk(CPJ_SEQ_MAGIC, CPJ_SEQ_VERSION, CPJ_SEQ_INFO, data_block_offset)
+
+    CPJ_SEQ_INFO.pack_into(byte_arr, CPJ_CHUNK_HEADER.size, play_rate,
+                           len(frames), offset_frames,
+                           len(events), offset_events,
+                           len(bone_info), offset_bone_info,
+                           len(bone_translate), offset_bone_translate,
+                           len(bone_rotate), offset_bone_rotate,
+                           len(bone_scale), offset_bone_scale)
+
+    write_strings(byte_arr, data_start, name_bytes, name_offsets)
+    write_strings(byte_arr, data_start, vert_f_name_bytes, vert_f_name_offsets)
+    write_records(byte_arr, data_start + offset_frames, frames)
+    write_strings(byte_arr, data_start, event_str_bytes, event_str_offsets)
+    write_records(byte_arr, data_start + offset_events, event_records)
+    write_strings(byte_arr, data_start, bone_info_str_bytes, bone_info_str_off)
+    write_records(byte_arr, data_start + offset_bone_info, bone_info)
+    write_records(byte_arr, data_start + offset_bone_translate, bone_translate)
+    write_records(byte_arr, data_start + offset_bone_rotate, bone_rotate)
+    write_records(byte_arr, data_start + offset_bone_scale, bone_scale)
+
+    return byte_arr
+
+def create_skl_byte_array_from_arrays(name, bones, bone_names, verts, weights, mounts, mount_names):
+    # Array version of create_skl_byte_array.
+    # The "offset_name" fields of the bones and mounts are filled in from "bone_names" and "mount_names".
+    bones = as_records(bones, SKL_BONE_DTYPE).copy()
+    verts = as_records(verts, SKL_VERT_DTYPE)
+    weights = as_records(weights, SKL_WEIGHT_DTYPE)
+    mounts = as_records(mounts, SKL_MOUNT_DTYPE).copy()
+
+    name_bytes, name_offsets, data_block_offset = layout_chunk_name(name)
+
+    bone_str_bytes, bone_str_offsets, data_block_offset = layout_strings(bone_names, data_block_offset)
+    bones["offset_name"] = bone_str_offsets
+
+    offset_bones = data_block_offset
+    data_block_offset += bones.nbytes
+
+    offset_verts = data_block_offset
+    data_block_offset += verts.nbytes
+
+    offset_weights = data_block_offset
+    data_block_offset += weights.nbytes
+
+    mount_str_bytes, mount_str_offsets, data_block_offset = layout_strings(mount_names, data_block_offset)
+    mounts["offset_name"] = mount_str_offsets
+
+    offset_mounts = data_block_offset
+    data_block_offset += mounts.nbytes
+
+    byte_arr, data_start = allocate_chunk(CPJ_SKL_MAGIC, CPJ_SKL_VERSION, CPJ_SKL_INFO, data_block_offset)
+
+    CPJ_SKL_INFO.pack_into(byte_arr, CPJ_CHUNK_HEADER.size,
+                           len(bones), offset_bones,
+                           len(verts), offset_verts,
+                           len(weights), offset_weights,
+                           len(mounts), offset_mounts)
+
+    write_strings(byte_arr, data_start, name_bytes, name_offsets)
+    write_strings(byte_arr, data_start, bone_str_bytes, bone_str_offsets)
+    write_records(byte_arr, data_start + offset_bones, bones)
+    write_records(byte_arr, data_start + offset_verts, verts)
+    write_records(byte_arr, data_start + offset_weights, weights)
+    write_strings(byte_arr, data_start, mount_str_bytes, mount_str_offsets)
+    write_records(byte_arr, data_start + offset_mounts, mounts)
+
+    return byte_arr
+
+def create_srf_byte_array_from_arrays(name, textures, tris, uv_coords):
+    # Array version of create_srf_byte_array.
+    # "textures" is a list of (name, ref_name) like in the list version.
+    tris = as_records(tris, SRF_TRI_DTYPE)
+    uv_coords = as_records(uv_coords, SRF_UV_DTYPE)
+
+    name_bytes, name_offsets, data_block_offset = layout_chunk_name(name)
+
+    texture_strings = []
+    for texture_data in textures:
+        texture_strings.append(texture_data[0])
+        # An empty reference name is not stored and gets the offset 0
+        texture_strings.append(texture_data[1] if texture_data[1] != "" else None)
+
+    texture_str_bytes, texture_str_offsets, data_block_offset = layout_optional_strings(texture_strings, data_block_offset)
+    texture_records = np.zeros(len(textures), dtype=SRF_TEXTURE_DTYPE)
+    texture_records["offset_name"] = texture_str_offsets[0::2]
+    texture_records["offset_ref_name"] = np.maximum(texture_str_offsets[1::2], 0)
+
+    offset_textures = data_block_offset
+    data_block_offset += texture_records.nbytes
+
+    offset_tris = data_block_offset
+    data_block_offset += tris.nbytes
+
+    offset_uvs = data_block_offset
+    data_block_offset += uv_coords.nbytes
+
+    byte_arr, data_start = allocate_chunk(CPJ_SRF_MAGIC, CPJ_SRF_VERSION, CPJ_SRF_INFO, data_block_offset)
+
+    CPJ_SRF_INFO.pack_into(byte_arr, CPJ_CHUNK_HEADER.size,
+                           len(textures), offset_textures,
+                           len(tris), offset_tris,
+                           len(uv_coords), offset_uvs)
+
+    write_strings(byte_arr, data_start, name_bytes, name_offsets)
+    write_strings(byte_arr, data_start, texture_str_bytes, texture_str_offsets)
+    write_records(byte_arr, data_start + offset_textures, texture_records)
+    write_records(byte_arr, data_start + offset_tris, tris)
+    write_records(byte_arr, data_start + offset_uvs, uv_coords)
+
+    return byte_arr
@@ -0,0 +1,60 @@
+import argparse
+import os
+import sys
+
+from concurrent.futures import ProcessPoolExecutor
+
+from cpj_utils import load_cpj_chunk_info
+
+def find_cpj_files(paths):
+    cpj_files = []
+    for path in paths:
+        if not os.path.isdir(path):
+            cpj_files.append(path)
+            continue
+        for dir_path, dir_names, file_names in os.walk(path):
+            # Walk the directories in a stable order so the output is reproducible
+            dir_names.sort()
+            for file_name in sorted(file_names):
+                if file_name.lower().endswith(".cpj"):
+                    cpj_files.append(os.path.join(dir_path, file_name))
+    return cpj_files
+
+def stat_file(file_path):
+    try:
+        return file_path, load_cpj_chunk_info(file_path), None
+    except (ImportError, OSError) as e:
+        return file_path, None, str(e)
+
+def stat_command(args):
+    cpj_files = find_cpj_files(args.paths)
+
+    print("file\ttype\tname\tversion\toffset\tsize")
+
+    failed = False
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        for file_path, chunk_infos, error in executor.map(stat_file, cpj_files, chunksize=16):
+            if error != None:
+                print(file_path + ": " + error, file=sys.stderr)
+                failed = True
+                continue
+            for info in chunk_infos:
+                name = info.name if info.name != None else ""
+                print(f"{file_path}\t{info.chunk_type}\t{name}\t{info.version}\t{info.offset}\t{info.size}")
+
+    return 1 if failed else 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Command line tools for Cannibal Project (CPJ) files")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    stat_parser = subparsers.add_parser("stat", help="List the chunks in CPJ files without parsing the chunk data")
+    stat_parser.add_argument("paths", nargs="+", help="CPJ files or directories to search for CPJ files")
+    stat_parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of worker processes (default: number of CPUs)")
+    stat_parser.set_defaults(func=stat_command)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,937 +1,788 @@
 import datetime
-from formats.riff import Riff
+import mmap
+import os
 import struct
 
-def load_cpj_data(file_path):
-    print("Loading: " + file_path)
-    # CPJ files are RIFF compatible files.
-    # This means that RIFF readers and writers can load and save CPJ files.
-    data = Riff.from_file(file_path)
+from dataclasses import dataclass
+
+# The RIFF subchunk header is the id and the byte length of the chunk data.
+# For CPJ chunks this is also the "magic" and "file_len" part of the CPJ chunk header.
+RIFF_CHUNK_HEADER = struct.Struct("<4sI")
+# magic, file_len, version, time_stamp, offset_name
+CPJ_CHUNK_HEADER = struct.Struct("<4sIIII")
+
+@dataclass
+class CpjChunkEntry:
+    chunk_id: str
+    # Byte offset of the chunk in the file (pointing at the RIFF subchunk header)
+    offset: int
+    # Byte size of the chunk including the 8 byte RIFF subchunk header (without padding)
+    size: int
+
+@dataclass
+class CpjChunkInfo:
+    chunk_type: str
+    # None if the chunk doesn't have a name
+    name: str
+    version: int
+    offset: int
+    size: int
+
+def read_c_string(buffer, offset, end):
+    # Read a NULL terminated ASCII string. Stop at "end" if there is no terminator.
+    str_end = offset
+    while str_end < end and buffer[str_end] != 0:
+        str_end += 1
+    return bytes(buffer[offset:str_end]).decode("ASCII")
+
+class CpjFile:
+    """Memory mapped CPJ file.
+
+    Only the RIFF subchunk headers are read when the file is opened.
+    The chunk data is handed out as memoryview slices of the mapped file,
+    so no chunk bytes are copied until something actually parses them.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.chunks = []
+
+        with open(file_path, "rb") as file:
+            try:
+                self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # mmap can't map empty files
+                raise ImportError("This is not a valid CPJ file (The read data is not a RIFF file)")
+        self._view = memoryview(self._mmap)
+
+        try:
+            self._scan_chunks()
+        except ImportError:
+            self.close()
+            raise
+
+    def _scan_chunks(self):
+        file_len = len(self._mmap)
+
+        # Do two sanity checks.
+
+        # Is this a RIFF file?
+        if file_len < 12 or self._mmap[0:4] != b"RIFF":
+            raise ImportError("This is not a valid CPJ file (The read data is not a RIFF file)")
+
+        # Is this a CPJ file?
+        if self._mmap[8:12] != b"CPJB":
+            raise ImportError("Doesn't seem to be a valid cpj file. The header form is not of the CPJ type")
+
+        _, riff_len = RIFF_CHUNK_HEADER.unpack_from(self._mmap, 0)
+        # Don't trust the RIFF length to be inside the file
+        data_end = min(8 + riff_len, file_len)
+
+        # Skip the RIFF header and the CPJB form type
+        offset = 12
+        while offset + RIFF_CHUNK_HEADER.size <= data_end:
+            chunk_id, chunk_len = RIFF_CHUNK_HEADER.unpack_from(self._mmap, offset)
+            chunk_size = RIFF_CHUNK_HEADER.size + chunk_len
+            if offset + chunk_size > file_len:
+                raise ImportError("Doesn't seem to be a valid cpj file. The '" + chunk_id.decode("ASCII", "replace") + "' chunk is truncated")
+
+            try:
+                chunk_id = chunk_id.decode("ASCII")
+            except UnicodeDecodeError:
+                raise ImportError("Doesn't seem to be a valid cpj file. The chunk at byte offset " + str(offset) + " doesn't have a valid chunk id")
+
+            self.chunks.append(CpjChunkEntry(chunk_id, offset, chunk_size))
+
+            # Chunks are padded to an even byte length
+            offset += chunk_size + chunk_len % 2
+
+    def chunk_data(self, chunk):
+        # Return the whole chunk, including the RIFF subchunk header, without copying it
+        return self._view[chunk.offset:chunk.offset + chunk.size]
+
+    def chunk_info(self, chunk):
+        # Decode only the CPJ chunk header and the chunk name
+        if chunk.size < CPJ_CHUNK_HEADER.size:
+            raise ImportError("Doesn't seem to be a valid cpj file. The '" + chunk.chunk_id + "' chunk is too small to contain a chunk header")
+
+        _, _, version, _, offset_name = CPJ_CHUNK_HEADER.unpack_from(self._mmap, chunk.offset)
+
+        name = None
+        # The name offset is relative to the start of the chunk
+        if offset_name != 0 and offset_name < chunk.size:
+            try:
+                name = read_c_string(self._mmap, chunk.offset + offset_name, chunk.offset + chunk.size)
+            except UnicodeDecodeError:
+                raise ImportError("Doesn't seem to be a valid cpj file. The name of the '" + chunk.chunk_id + "' chunk at byte offset " + str(chunk.offset) + " is not an ASCII string")
+
+        return CpjChunkInfo(chunk.chunk_id, name, version, chunk.offset, chunk.size)
+
+    def chunk_data_dict(self, chunk_types=None, name_filter=None):
+        # Only chunks with a type in "chunk_types" (all types if None) are returned.
+        # "name_filter" is called as name_filter(chunk_type, name) and can skip chunks
+        # by name. Only the chunk header is read for the chunks that are skipped.
+        cpj_data = {}
+        for chunk in self.chunks:
+            if chunk_types != None and chunk.chunk_id not in chunk_types:
+                continue
+            if name_filter != None and not name_filter(chunk.chunk_id, self.chunk_info(chunk).name):
+                continue
+            cpj_data.setdefault(chunk.chunk_id, []).append(self.chunk_data(chunk))
+        return cpj_data
 
-    # Do two sanity checks.
+    def close(self):
+        self._view.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # There are still chunk memoryviews in use.
+            # The file will be unmapped when the last of them is freed.
+            pass
 
-    # Is this a RIFF file?
-    if not data.is_riff_chunk:
-        raise ImportError("This is not a valid CPJ file (The read data is not a RIFF file)")
+    def __enter__(self):
+        return self
 
-    # Is this a CPJ file?
-    is_cpj = data.parent_chunk_data.form_type == struct.unpack("I", b"CPJB")[0]
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
-    if not is_cpj:
-        raise ImportError("Doesn't seem to be a valid cpj file. The header form is not of the CPJ type")
+def load_cpj_data(file_path, chunk_types=None, name_filter=None):
+    print("Loading: " + file_path)
+    # CPJ files are RIFF compatible files.
+    # This means that RIFF readers and writers can load and save CPJ files.
+    cpj_file = CpjFile(file_path)
 
-    cpj_data = {}
+    for chunk in cpj_file.chunks:
+        print(chunk.chunk_id)
 
-    for sub_chunk in data.subchunks:
-        chunk_id_str = sub_chunk.chunk_id_readable
-        print(chunk_id_str)
+    # The chunks are memoryviews of the whole chunk, as if we split it out as a new file.
+    # They keep the file mapped for as long as they are alive.
+    cpj_data = cpj_file.chunk_data_dict(chunk_types, name_filter)
+    cpj_file.close()
 
-        chunk_data = sub_chunk.chunk_data.data
-        # Make sure that the byte array is as if we split this out as a new file
-        # Add back the file length
-        chunk_data = struct.pack("I", sub_chunk.chunk.len_data_slot) + chunk_data
-        # And the magic id number
-        chunk_data = struct.pack("I", sub_chunk.chunk.id) + chunk_data
+    return cpj_data
 
-        if chunk_id_str in cpj_data:
-            cpj_data[chunk_id_str].append(chunk_data)
+def load_cpj_chunk_info(file_path):
+    # Get the type, name, version, byte offset and size of all chunks without parsing their data
+    with CpjFile(file_path) as cpj_file:
+        return [cpj_file.chunk_info(chunk) for chunk in cpj_file.chunks]
+
+class CpjWriter:
+    """Streaming CPJ file writer.
+
+    Chunks are appended to the file as they are written, so only the chunk
+    that is currently being written has to be kept in memory. The RIFF size is
+    patched in when the writer is closed. The file is written to a temporary
+    path next to "file_path" and only moved into place once it is complete.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._temp_path = file_path + ".part"
+        self._file = open(self._temp_path, "wb")
+        # Total length of the written chunks including padding
+        self._data_len = 0
+
+        # The RIFF size is not known yet, it is patched in on close
+        self._file.write(RIFF_CHUNK_HEADER.pack(b'RIFF', 0))
+        # Write CPJ form type
+        self._file.write(b'CPJB')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type != None:
+            self.abort()
         else:
-            cpj_data[chunk_id_str] = [chunk_data]
-    return cpj_data
+            self.close()
+
+    def write_chunk(self, chunk):
+        # "chunk" can be any contiguous buffer, like bytes, bytearray, memoryview or a NumPy array
+        chunk_view = memoryview(chunk).cast("B")
+        chunk_len = chunk_view.nbytes
+        self._file.write(chunk_view)
+        # If the length is odd then add a padding byte (NULL byte)
+        if chunk_len % 2 != 0:
+            self._file.write(b'\0')
+        self._data_len += chunk_len + chunk_len % 2
+
+    def close(self):
+        if self._file == None:
+            return
+        # Write total size of all data including the form header (+ 4 bytes)
+        riff_len = self._data_len + 4
+        if riff_len > 0xFFFFFFFF:
+            self.abort()
+            raise ValueError("The CPJ file is too large, the RIFF size field is limited to 4 GiB")
+        self._file.seek(4)
+        self._file.write(struct.pack("<I", riff_len))
+        self._file.close()
+        self._file = None
+        os.replace(self._temp_path, self.file_path)
+
+    def abort(self):
+        # Throw away the partially written file
+        if self._file == None:
+            return
+        self._file.close()
+        self._file = None
+        os.remove(self._temp_path)
 
 def write_cpj_file(out_file_name, byte_data_list):
-    file = open(out_file_name, "wb")
-
-    data_list_byte_len = 0
-    # Figure out the total lenght of the packed data
-    for byte_array in byte_data_list:
-        chunk_len = len(byte_array)
-        data_list_byte_len += chunk_len
-        # If the length is odd then add a padding byte
-        data_list_byte_len += chunk_len % 2
+    # "byte_data_list" can be any iterable of chunks, like a generator that creates them on demand
+    with CpjWriter(out_file_name) as cpj_writer:
+        for byte_array in byte_data_list:
+            cpj_writer.write_chunk(byte_array)
 
-    # Write RIFF magic id
-    file.write(b'RIFF')
-
-    # Write total size of all data including the form header (+ 4 bytes)
-    file.write(struct.pack("I", data_list_byte_len + 4))
-
-    # Write CPJ form type
-    file.write(b'CPJB')
-
-    for byte_array in byte_data_list:
-        file.write(byte_array)
-        if len(byte_array) % 2 != 0:
-            # Add a padding byte (NULL byte)
-            file.write(b'\0')
-    file.close()
-
-def create_cpj_chunk_header_byte_array(type, data_len, version, name_offset):
+def pack_cpj_chunk_header(byte_arr, type, data_len, version, name_offset):
     # The header takes up an additonal 3*4 bytes (we start counting total lenght at the "version" integer)
     data_len += 3*4
-    # Create magic type id
-    byte_arr = bytes(type, "ASCII")
-    # Write the byte lenght of this CPJ chunk
-    byte_arr += struct.pack("I", data_len)
-    # Write format version
-    byte_arr += struct.pack("I", version)
-    # Write creation timestamp
-    byte_arr += struct.pack("I", int(datetime.datetime.today().timestamp()))
-    # Write name offset
-    byte_arr += struct.pack("I", name_offset)
-    return byte_arr
+    timestamp = int(datetime.datetime.today().timestamp())
+    CPJ_CHUNK_HEADER.pack_into(byte_arr, 0, bytes(type, "ASCII"), data_len, version, timestamp, name_offset)
+
+def create_cpj_chunk_header_byte_array(type, data_len, version, name_offset):
+    byte_arr = bytearray(CPJ_CHUNK_HEADER.size)
+    pack_cpj_chunk_header(byte_arr, type, data_len, version, name_offset)
+    return bytes(byte_arr)
 
 def string_to_byte_string(str):
     # Return a NULL terminated byte string
     return bytes(str, "ASCII") + b'\x00'
 
+def layout_strings(strings, data_block_offset):
+    # Encode a contiguous block of strings starting at "data_block_offset".
+    # Returns the encoded strings, their data block offsets and the data block offset after the block.
+    byte_strs = []
+    offsets = []
+    for string in strings:
+        byte_str = string_to_byte_string(string)
+        byte_strs.append(byte_str)
+        offsets.append(data_block_offset)
+        data_block_offset += len(byte_str)
+    return byte_strs, offsets, data_block_offset
+
+def write_strings(byte_arr, data_start, byte_strs, offsets):
+    for byte_str, offset in zip(byte_strs, offsets):
+        if offset < 0:
+            continue
+        pos = data_start + offset
+        byte_arr[pos:pos + len(byte_str)] = byte_str
+
+def allocate_chunk(magic, version, info_struct, data_block_len):
+    # Allocate the whole chunk and fill in the CPJ chunk header.
+    # Returns the chunk byte array and the byte offset of the data block in it.
+    info_offset = info_struct.size
+    # The cpj header is 20 bytes (5*4)
+    name_offset = CPJ_CHUNK_HEADER.size + info_offset
+    data_len = data_block_len + info_offset
+
+    byte_arr = bytearray(CPJ_CHUNK_HEADER.size + data_len)
+    pack_cpj_chunk_header(byte_arr, magic, data_len, version, name_offset)
+    return byte_arr, name_offset
+
+def layout_chunk_name(name):
+    # The chunk name (if any) is always stored at the start of the data block
+    if name == None or name == "":
+        return [], [], 0
+    return layout_strings([name], 0)
+
+# NOTE: All chunk writers first compute the data block layout (the offset of every table),
+# then allocate the whole chunk in one bytearray and fill it with the precompiled structs below.
+# The tables are stored in the same order and at the same offsets as the old concatenating writers.
+
 CPJ_FRM_MAGIC = "FRMB"
 CPJ_FRM_VERSION = 1
+# bb_min (3f), bb_max (3f), num_frames, data_offset_frames
+CPJ_FRM_INFO = struct.Struct("<6f2I")
+# byte_scale (3f), byte_translate (3f)
+CPJ_FRM_GROUP = struct.Struct("<6f")
+# group, pos (3B)
+CPJ_FRM_BYTE_POS = struct.Struct("<4B")
+CPJ_FRM_VEC3F = struct.Struct("<3f")
+# offset_name, bb_min (3f), bb_max (3f), num_groups, data_offset_groups, num_verts, data_offset_verts
+CPJ_FRM_FRAME = struct.Struct("<I6f4I")
 def create_frm_byte_array(name, total_bb, frames):
-    byte_arr = b''
-    # The start of the data block (not the chunk).
-    data_block_offset = 0
-
-    # Write chunk name (if any)
-    if name != "":
-        byte_str = string_to_byte_string(name)
-        byte_arr += byte_str
-
-        data_block_offset += len(byte_str)
+    name_bytes, name_offsets, data_block_offset = layout_chunk_name(name)
 
     frame_name_offsets = []
+    frame_name_bytes = []
     groups_offsets = []
     verts_offsets = []
 
-    # Write all frame array/list type data
+    # Layout all frame array/list type data
     for frame in frames:
-        frame_name_offsets.append(data_block_offset)
+        byte_strs, offsets, data_block_offset = layout_strings([frame[0]], data_block_offset)
+        frame_name_bytes += byte_strs
+        frame_name_offsets += offsets
 
-        byte_str = string_to_byte_string(frame[0])
-        byte_arr += byte_str
+        groups_offsets.append(data_block_offset)
+        data_block_offset += len(frame[4]) * CPJ_FRM_GROUP.size
 
-        data_block_offset += len(byte_str)
+        verts_offsets.append(data_block_offset)
+        # If there are no groups, then we are storing uncompressed vertex positions
+        vert_struct = CPJ_FRM_VEC3F if len(frame[4]) == 0 else CPJ_FRM_BYTE_POS
+        data_block_offset += len(frame[6]) * vert_struct.size
 
-        group_offset = data_block_offset
+    offset_frames = data_block_offset
+    data_block_offset += len(frames) * CPJ_FRM_FRAME.size
 
-        # Write frame groups
-        for group_data in frame[4]:
-            # byte_scale
-            for i in range(3):
-                byte_scale = group_data[0]
-                byte_arr += struct.pack("f", byte_scale[i])
-            # byte_translate
-            for i in range(3):
-                byte_translate = group_data[1]
-                byte_arr += struct.pack("f", byte_translate[i])
-
-            # 3*4 + 3*4 = 24
-            data_block_offset += 24
-
-        groups_offsets.append(group_offset)
-
-        vert_offset = data_block_offset
-
-        # Write frame verts
-        for vert in frame[6]:
-            # If there are no groups, then we are storing uncompressed vertex positions
-            if (len(frame[4]) == 0):
-                # vertex pos
-                for i in range(3):
-                    byte_arr += struct.pack("f", vert[i])
-                # 3*4
-                data_block_offset += 12
-                continue
-            # This vert is stored as compressed byte data
-            # group
-            byte_arr += struct.pack("B", vert[0])
-            # pos
-            for i in range(3):
-                pos = vert[1]
-                byte_arr += struct.pack("B", pos[i])
-            # 1 + 3*1
-            data_block_offset += 4
+    byte_arr, data_start = allocate_chunk(CPJ_FRM_MAGIC, CPJ_FRM_VERSION, CPJ_FRM_INFO, data_block_offset)
 
-        verts_offsets.append(vert_offset)
+    CPJ_FRM_INFO.pack_into(byte_arr, CPJ_CHUNK_HEADER.size, *total_bb[0][:3], *total_bb[1][:3], len(frames), offset_frames)
 
-    offset_frames = data_block_offset
+    write_strings(byte_arr, data_start, name_bytes, name_offsets)
+    write_strings(byte_arr, data_start, frame_name_bytes, frame_name_offsets)
 
-    # Write all remaining frame data
     for i, frame in enumerate(frames):
-        # offset_name
-        byte_arr += struct.pack("I", frame_name_offsets[i])
-        # bb_min
-        for x in range(3):
-            bb_min = frame[1]
-            byte_arr += struct.pack("f", bb_min[x])
-        # bb_max
-        for x in range(3):
-            bb_max = frame[2]
-            byte_arr += struct.pack("f", bb_max[x])
-        # num_groups
-        byte_arr += struct.pack("I", frame[3])
-        # data_offset_groups
-        byte_arr += struct.pack("I", groups_offsets[i])
-        # num_verts
-        byte_arr += struct.pack("I", frame[5])
-        # data_offset_verts
-        byte_arr += struct.pack("I", verts_offsets[i])
-        # 4 + 3*4 + 3*4 + 4*4
-        data_block_offset += 44
-
-    frm_info_bytes = b''
-
-    # bb_min
-    for i in range(3):
-        frm_info_bytes += struct.pack("f", total_bb[0][i])
-    # bb_max
-    for i in range(3):
-        frm_info_bytes += struct.pack("f", total_bb[1][i])
-
-    frm_info_bytes += struct.pack("I", len(frames))
-    frm_info_bytes += struct.pack("I", offset_frames)
-
-    info_offset = 3*4 + 3*4 + 2*4
-    # The cpj header is 20 bytes (5*4)
-    name_offset = 20 + info_offset
-
-    # We already took into account the offset of these info variables at the start of the function
-    data_len = data_block_offset + info_offset
-
-    frm_header_byte_arr = create_cpj_chunk_header_byte_array(CPJ_FRM_MAGIC, data_len, CPJ_FRM_VERSION, name_offset)
-    byte_arr = frm_header_byte_arr + frm_info_bytes + byte_arr
+        pos = data_start + groups_offsets[i]
+        for group_data in frame[4]:
+            byte_scale = group_data[0]
+            byte_translate = group_data[1]
+            CPJ_FRM_GROUP.pack_into(byte_arr, pos, *byte_scale[:3], *byte_translate[:3])
+            pos += CPJ_FRM_GROUP.size
+
+        pos = data_start + verts_offsets[i]
+        if len(frame[4]) == 0:
+            for vert in frame[6]:
+                CPJ_FRM_VEC3F.pack_into(byte_arr, pos, vert[0], vert[1], vert[2])
+                pos += CPJ_FRM_VEC3F.size
+        else:
+            # This vert is stored as compressed byte data
+            for vert in frame[6]:
+                byte_pos = vert[1]
+                CPJ_FRM_BYTE_POS.pack_into(byte_arr, pos, vert[0], byte_pos[0], byte_pos[1], byte_pos[2])
+                pos += CPJ_FRM_BYTE_POS.size
 
-    # Sanity check
-    if (len(byte_arr) != data_len + 20):
-        raise ValueError("The calculated byte lenght of the array doesn't match up with the actual size!")
+        bb_min = frame[1]
+        bb_max = frame[2]
+        CPJ_FRM_FRAME.pack_into(byte_arr, data_start + offset_frames + i * CPJ_FRM_FRAME.size,
+                                frame_name_offsets[i], *bb_min[:3], *bb_max[:3],
+                                frame[3], groups_offsets[i], frame[5], verts_offsets[i])
 
     return byte_arr
 
 CPJ_GEO_MAGIC = "GEOB"
 CPJ_GEO_VERSION = 1
+# num_verts, data_offset_verts, num_edges, data_offset_edges, num_tris, data_offset_tris,
+# num_mounts, data_offset_mounts, num_obj_links, data_offset_obj_links
+CPJ_GEO_INFO = struct.Struct("<10I")
+# flags, group_index, reserved, num_edge_links, num_tri_links, first_edge_link, first_tri_link, ref_pos (3f)
+CPJ_GEO_VERT = struct.Struct("<BBHHHII3f")
+# head_vertex, tail_vertex, inverted_edge, num_tri_links, first_tri_link
+CPJ_GEO_EDGE = struct.Struct("<HHHHI")
+# edge_ring (3H), reserved
+CPJ_GEO_TRI = struct.Struct("<4H")
+# offset_name, tri_index, tri_barys (3f), base_scale (3f), base_rotate (4f), base_translate (3f)
+CPJ_GEO_MOUNT = struct.Struct("<II3f3f4f3f")
+CPJ_GEO_OBJ_LINK = struct.Struct("<H")
 def create_geo_byte_array(name, verts, edges, tris, mounts, obj_links):
-    byte_arr = b''
-    # The start of the data block (not the chunk).
-    data_block_offset = 0
-
-    # Write chunk name (if any)
-    if name != "":
-        byte_str = string_to_byte_string(name)
-        byte_arr += byte_str
-
-        data_block_offset += len(byte_str)
-
-    texture_string_offsets = []
+    name_bytes, name_offsets, data_block_offset = layout_chunk_name(name)
 
     offset_verts = data_block_offset
-
-    # Write vertex data
-    for vert in verts:
-        # flags
-        byte_arr += struct.pack("B", vert[0])
-        # group_index
-        byte_arr += struct.pack("B", vert[1])
-        # reserved
-        byte_arr += struct.pack("H", vert[2])
-        # num_edge_links
-        byte_arr += struct.pack("H", vert[3])
-        # num_tri_links
-        byte_arr += struct.pack("H", vert[4])
-        # first_edge_link
-        byte_arr += struct.pack("I", vert[5])
-        # first_tri_link
-        byte_arr += struct.pack("I", vert[6])
-        for i in range(3):
-            vert_co = vert[7]
-            byte_arr += struct.pack("f", vert_co[i])
-        # 2*1 + 3*2 + 2*4 + 3*4
-        data_block_offset += 28
+    data_block_offset += len(verts) * CPJ_GEO_VERT.size
 
     offset_edges = data_block_offset
-    # Write edge data
-    for edge_data in edges:
-        # head_vertex
-        byte_arr += struct.pack("H", edge_data[0])
-        # tail_vertex
-        byte_arr += struct.pack("H", edge_data[1])
-        # inverted_edge
-        byte_arr += struct.pack("H", edge_data[2])
-        # num_tri_links
-        byte_arr += struct.pack("H", edge_data[3])
-        # first_tri_link
-        byte_arr += struct.pack("I", edge_data[4])
-        # 4*2 + 4 = 22 bytes
-        data_block_offset += 12
+    data_block_offset += len(edges) * CPJ_GEO_EDGE.size
 
     offset_tris = data_block_offset
-    # Write tri data
-    for tri_data in tris:
-        # edge ring
-        for i in range(3):
-            edge_ring = tri_data[0]
-            # index of the edge this triangle consists of
-            byte_arr += struct.pack("H", edge_ring[i])
-        # reserved
-        byte_arr += struct.pack("H", tri_data[1])
-        # 3*2 + 2 = 8 bytes
-        data_block_offset += 8
-
-    # Write mount name strings
-    mount_str_offsets = []
-    for mount_data in mounts:
-        byte_str = string_to_byte_string(mount_data[0])
-        byte_arr += byte_str
-
-        mount_str_offsets.append(data_block_offset)
+    data_block_offset += len(tris) * CPJ_GEO_TRI.size
 
-        data_block_offset += len(byte_str)
+    mount_name_bytes, mount_str_offsets, data_block_offset = layout_strings([mount_data[0] for mount_data in mounts], data_block_offset)
 
     offset_mounts = data_block_offset
-    # Write mount data
-    for i, mount_data in enumerate(mounts):
-        # offset_name
-        byte_arr += struct.pack("I", mount_str_offsets[i])
-        # tri_index
-        byte_arr += struct.pack("I", mount_data[1])
-        # tri_barys
-        for x in range(3):
-            tri_barys = mount_data[2]
-            byte_arr += struct.pack("f", tri_barys[x])
-        # base_scale
-        for x in range(3):
-            base_scale = mount_data[3]
-            byte_arr += struct.pack("f", base_scale[x])
-        # base_rotate
-        for x in range(4):
-            base_rotate = mount_data[4]
-            byte_arr += struct.pack("f", base_rotate[x])
-        # base_translate
-        for x in range(3):
-            base_translate = mount_data[5]
-            byte_arr += struct.pack("f", base_translate[x])
-        # 2*4 + 3*4 + 3*4 + 4*4 + 3*4 = 8 bytes
-        data_block_offset += 60
+    data_block_offset += len(mounts) * CPJ_GEO_MOUNT.size
 
     offset_obj_links = data_block_offset
-    # Write object link data
-    for obj_link in obj_links:
-        # link
-        byte_arr += struct.pack("H", obj_link)
-        data_block_offset += 2
-
-    geo_info_bytes = b''
-
-    geo_info_bytes += struct.pack("I", len(verts))
-    geo_info_bytes += struct.pack("I", offset_verts)
+    data_block_offset += len(obj_links) * CPJ_GEO_OBJ_LINK.size
 
-    geo_info_bytes += struct.pack("I", len(edges))
-    geo_info_bytes += struct.pack("I", offset_edges)
+    byte_arr, data_start = allocate_chunk(CPJ_GEO_MAGIC, CPJ_GEO_VERSION, CPJ_GEO_INFO, data_block_offset)
 
-    geo_info_bytes += struct.pack("I", len(tris))
-    geo_info_bytes += struct.pack("I", offset_tris)
+    CPJ_GEO_INFO.pack_into(byte_arr, CPJ_CHUNK_HEADER.size,
+                           len(verts), offset_verts,
+                           len(edges), offset_edges,
+                           len(tris), offset_tris,
+                           len(mounts), offset_mounts,
+                           len(obj_links), offset_obj_links)
 
-    geo_info_bytes += struct.pack("I", len(mounts))
-    geo_info_bytes += struct.pack("I", offset_mounts)
+    write_strings(byte_arr, data_start, name_bytes, name_offsets)
 
-    geo_info_bytes += struct.pack("I", len(obj_links))
-    geo_info_bytes += struct.pack("I", offset_obj_links)
+    pos = data_start + offset_verts
+    for vert in verts:
+        vert_co = vert[7]
+        CPJ_GEO_VERT.pack_into(byte_arr, pos, *vert[0:7], *vert_co[:3])
+        pos += CPJ_GEO_VERT.size
 
-    info_offset = 10*4
-    # The cpj header is 20 bytes (5*4)
-    name_offset = 20 + info_offset
+    pos = data_start + offset_edges
+    for edge_data in edges:
+        CPJ_GEO_EDGE.pack_into(byte_arr, pos, *edge_data[0:5])
+        pos += CPJ_GEO_EDGE.size
 
-    # We already took into account the offset of these info variables at the start of the function
-    data_len = data_block_offset + info_offset
+    pos = data_start + offset_tris
+    for tri_data in tris:
+        # index of the edges this triangle consists of
+        edge_ring = tri_data[0]
+        CPJ_GEO_TRI.pack_into(byte_arr, pos, *edge_ring[:3], tri_data[1])
+        pos += CPJ_GEO_TRI.size
 
-    geo_header_byte_arr = create_cpj_chunk_header_byte_array(CPJ_GEO_MAGIC, data_len, CPJ_GEO_VERSION, name_offset)
-    byte_arr = geo_header_byte_arr + geo_info_bytes + byte_arr
+    write_strings(byte_arr, data_start, mount_name_bytes, mount_str_offsets)
 
-    # Sanity check
-    if (len(byte_arr) != data_len + 20):
-        raise ValueError("The calculated byte lenght of the array doesn't match up with the actual size!")
+    pos = data_start + offset_mounts
+    for i, mount_data in enumerate(mounts):
+        tri_barys = mount_data[2]
+        base_scale = mount_data[3]
+        base_rotate = mount_data[4]
+        base_translate = mount_data[5]
+        CPJ_GEO_MOUNT.pack_into(byte_arr, pos, mount_str_offsets[i], mount_data[1],
+                                *tri_barys[:3], *base_scale[:3], *base_rotate[:4], *base_translate[:3])
+        pos += CPJ_GEO_MOUNT.size
+
+    pos = data_start + offset_obj_links
+    for obj_link in obj_links:
+        CPJ_GEO_OBJ_LINK.pack_into(byte_arr, pos, obj_link)
+        pos += CPJ_GEO_OBJ_LINK.size
 
     return byte_arr
 
 CPJ_LOD_MAGIC = "LODB"
 CPJ_LOD_VERSION = 3
+# num_levels, data_offset_levels, num_tris, data_offset_tris, num_vert_relay, data_offset_vert_relay
+CPJ_LOD_INFO = struct.Struct("<6I")
+# detail, num_tri, num_vert_relay, first_tri, first_vert_relay
+CPJ_LOD_LEVEL = struct.Struct("<f4I")
+# tri_index, vert_index (3H), uv_index (3H)
+CPJ_LOD_TRI = struct.Struct("<I6H")
+CPJ_LOD_VERT_RELAY = struct.Struct("<H")
 def create_lod_byte_array(name, levels, tris, vert_relay):
-    byte_arr = b''
-    # The start of the data block (not the chunk).
-    data_block_offset = 0
-
-    # Write chunk name (if any)
-    if name != "":
-        byte_str = string_to_byte_string(name)
-        byte_arr += byte_str
-
-        data_block_offset += len(byte_str)
+    name_bytes, name_offsets, data_block_offset = layout_chunk_name(name)
 
     offset_levels = data_block_offset
-
-    # Write level data
-    for level_data in levels:
-        #detail
-        byte_arr += struct.pack("f", level_data[0])
-        # num_tri
-        byte_arr += struct.pack("I", level_data[1])
-        # num_vert_relay
-        byte_arr += struct.pack("I", level_data[2])
-        # first_tri
-        byte_arr += struct.pack("I", level_data[3])
-        # first_vert_replay
-        byte_arr += struct.pack("I", level_data[4])
-        # 5*4 = 20
-        data_block_offset += 20
+    data_block_offset += len(levels) * CPJ_LOD_LEVEL.size
 
     offset_tris = data_block_offset
-
-    # Write tri data
-    for tri_data in tris:
-        # tri_index
-        byte_arr += struct.pack("I", tri_data[0])
-        # vert_index
-        for i in range(3):
-            vert_index = tri_data[1]
-            byte_arr += struct.pack("H", vert_index[i])
-        # uv_index
-        for i in range(3):
-            uv_index = tri_data[2]
-            byte_arr += struct.pack("H", uv_index[i])
-        # 4 + 3*2 + 3*2 = 16
-        data_block_offset += 16
+    data_block_offset += len(tris) * CPJ_LOD_TRI.size
 
     offset_vert_relay = data_block_offset
+    data_block_offset += len(vert_relay) * CPJ_LOD_VERT_RELAY.size
 
-    # Write vert_relay data
-    for vr_data in vert_relay:
-        byte_arr += struct.pack("H", vr_data)
-        data_block_offset += 2
-
-    lod_info_bytes = b''
+    byte_arr, data_start = allocate_chunk(CPJ_LOD_MAGIC, CPJ_LOD_VERSION, CPJ_LOD_INFO, data_block_offset)
 
-    lod_info_bytes += struct.pack("I", len(levels))
-    lod_info_bytes += struct.pack("I", offset_levels)
+    CPJ_LOD_INFO.pack_into(byte_arr, CPJ_CHUNK_HEADER.size,
+                           len(levels), offset_levels,
+                           len(tris), offset_tris,
+                           len(vert_relay), offset_vert_relay)
 
-    lod_info_bytes += struct.pack("I", len(tris))
-    lod_info_bytes += struct.pack("I", offset_tris)
+    write_strings(byte_arr, data_start, name_bytes, name_offsets)
 
-    lod_info_bytes += struct.pack("I", len(vert_relay))
-    lod_info_bytes += struct.pack("I", offset_vert_relay)
-
-    info_offset = 6*4
-    # The cpj header is 20 bytes (5*4)
-    name_offset = 20 + info_offset
-
-    # We already took into account the offset of these info variables at the start of the function
-    data_len = data_block_offset + info_offset
+    pos = data_start + offset_levels
+    for level_data in levels:
+        CPJ_LOD_LEVEL.pack_into(byte_arr, pos, *level_data[0:5])
+        pos += CPJ_LOD_LEVEL.size
 
-    lod_header_byte_arr = create_cpj_chunk_header_byte_array(CPJ_LOD_MAGIC, data_len, CPJ_LOD_VERSION, name_offset)
-    byte_arr = lod_header_byte_arr + lod_info_bytes + byte_arr
+    pos = data_start + offset_tris
+    for tri_data in tris:
+        vert_index = tri_data[1]
+        uv_index = tri_data[2]
+        CPJ_LOD_TRI.pack_into(byte_arr, pos, tri_data[0], *vert_index[:3], *uv_index[:3])
+        pos += CPJ_LOD_TRI.size
 
-    # Sanity check
-    if (len(byte_arr) != data_len + 20):
-        raise ValueError("The calculated byte lenght of the array doesn't match up with the actual size!")
+    pos = data_start + offset_vert_relay
+    for vr_data in vert_relay:
+        CPJ_LOD_VERT_RELAY.pack_into(byte_arr, pos, vr_data)
+        pos += CPJ_LOD_VERT_RELAY.size
 
     return byte_arr
 
 CPJ_MAC_MAGIC = "MACB"
 CPJ_MAC_VERSION = 1
+# num_sections, data_offset_sections, num_commands, data_offset_commands
+CPJ_MAC_INFO = struct.Struct("<4I")
+# offset_name, num_commands, first_command
+CPJ_MAC_SECTION = struct.Struct("<3I")
+# offset_command_str
+CPJ_MAC_COMMAND = struct.Struct("<I")
 def create_mac_byte_array(name, section_data, command_strings):
-    byte_arr = b''
-    # The start of the data block (not the chunk).
-    data_block_offset = 0
-
-    # Write chunk name (if any)
-    if name != "":
-        byte_str = string_to_byte_string(name)
-        byte_arr += byte_str
-
-        data_block_offset += len(byte_str)
-
-    # Write section data
-    section_names = [data[0] for data in section_data]
-    sec_offset_names = []
+    name_bytes, name_offsets, data_block_offset = layout_chunk_name(name)
 
-    # Write all section name strings in a contious block
-    for sec_name in section_names:
-        sec_offset_names.append(data_block_offset)
-        byte_str = string_to_byte_string(sec_name)
-        byte_arr += byte_str
-
-        data_block_offset += len(byte_str)
+    # All section name strings are stored in a contious block
+    sec_name_bytes, sec_offset_names, data_block_offset = layout_strings([data[0] for data in section_data], data_block_offset)
 
     offset_sections = data_block_offset
-    # Write all section data in a contious block
-    for i, sec_data in enumerate(section_data):
-        # offset_name
-        byte_arr += struct.pack("I", sec_offset_names[i])
-        # num_commands
-        byte_arr += struct.pack("I", sec_data[1])
-        # first_command
-        byte_arr += struct.pack("I", sec_data[2])
-
-        data_block_offset += 12 #(3 * 4) bytes for each section
-
-    com_str_offsets = []
+    data_block_offset += len(section_data) * CPJ_MAC_SECTION.size
 
-    # Write command strings in a contious block
-    for command in command_strings:
-        com_str_offsets.append(data_block_offset)
-        byte_str = string_to_byte_string(command)
-        byte_arr += byte_str
-
-        data_block_offset += len(byte_str)
+    com_str_bytes, com_str_offsets, data_block_offset = layout_strings(command_strings, data_block_offset)
 
     offset_commands = data_block_offset
+    data_block_offset += len(command_strings) * CPJ_MAC_COMMAND.size
 
-    # Write command data in a contious block
-    for offset in com_str_offsets:
-        byte_arr += struct.pack("I", offset)
-
-        data_block_offset += 4
-
-    mac_info_bytes = b''
+    byte_arr, data_start = allocate_chunk(CPJ_MAC_MAGIC, CPJ_MAC_VERSION, CPJ_MAC_INFO, data_block_offset)
 
-    mac_info_bytes += struct.pack("I", len(section_data))
-    mac_info_bytes += struct.pack("I", offset_sections)
+    CPJ_MAC_INFO.pack_into(byte_arr, CPJ_CHUNK_HEADER.size,
+                           len(section_data), offset_sections,
+                           len(command_strings), offset_commands)
 
-    mac_info_bytes += struct.pack("I", len(command_strings))
-    mac_info_bytes += struct.pack("I", offset_commands)
+    write_strings(byte_arr, data_start, name_bytes, name_offsets)
+    write_strings(byte_arr, data_start, sec_name_bytes, sec_offset_names)
 
-    info_offset = 4*4
-    # The cpj header is 20 bytes (5*4)
-    name_offset = 20 + info_offset
-
-    # We already took into account the offset of these info variables at the start of the function
-    data_len = data_block_offset + info_offset
+    pos = data_start + offset_sections
+    for i, sec_data in enumerate(section_data):
+        CPJ_MAC_SECTION.pack_into(byte_arr, pos, sec_offset_names[i], sec_data[1], sec_data[2])
+        pos += CPJ_MAC_SECTION.size
 
-    mac_header_byte_arr = create_cpj_chunk_header_byte_array(CPJ_MAC_MAGIC, data_len, CPJ_MAC_VERSION, name_offset)
-    # Add it all together
-    byte_arr = mac_header_byte_arr + mac_info_bytes + byte_arr
+    write_strings(byte_arr, data_start, com_str_bytes, com_str_offsets)
 
-    # Sanity check
-    if (len(byte_arr) != data_len + 20):
-        raise ValueError("The calculated byte lenght of the array doesn't match up with the actual size!")
+    pos = data_start + offset_commands
+    for offset in com_str_offsets:
+        CPJ_MAC_COMMAND.pack_into(byte_arr, pos, offset)
+        pos += CPJ_MAC_COMMAND.size
 
     return byte_arr
 
+def layout_optional_strings(strings, data_block_offset):
+    # Like layout_strings, but "None" entries are not stored and get the offset -1
+    byte_strs = []
+    offsets = []
+    for string in strings:
+        if string == None:
+            byte_strs.append(b'')
+            offsets.append(-1)
+            continue
+        byte_str = string_to_byte_string(string)
+        byte_strs.append(byte_str)
+        offsets.append(data_block_offset)
+        data_block_offset += len(byte_str)
+    return byte_strs, offsets, data_block_offset
+
 CPJ_SEQ_MAGIC = "SEQB"
 CPJ_SEQ_VERSION = 1
+# play_rate, num_frames, data_offset_frames, num_events, data_offset_events,
+# num_bone_info, data_offset_bone_info, num_bone_translate, data_offset_bone_translate,
+# num_bone_rotate, data_offset_bone_rotate, num_bone_scale, data_offset_bone_scale
+CPJ_SEQ_INFO = struct.Struct("<f12I")
+# reserved, num_bone_translate, num_bone_rotate, num_bone_scale,
+# first_bone_translate, first_bone_rotate, first_bone_scale, offset_vert_frame_name
+CPJ_SEQ_FRAME = struct.Struct("<4B3Ii")
+# event_type, time, offset_param_str
+CPJ_SEQ_EVENT = struct.Struct("<4sfi")
+# offset_name, src_length
+CPJ_SEQ_BONE_INFO = struct.Struct("<If")
+# bone_index, reserved, translate (3f)
+CPJ_SEQ_BONE_TRANSLATE = struct.Struct("<HH3f")
+# bone_index, roll, pitch, yaw
+CPJ_SEQ_BONE_ROTATE = struct.Struct("<Hhhh")
+# bone_index, reserved, scale (3f)
+CPJ_SEQ_BONE_SCALE = struct.Struct("<HH3f")
 def create_seq_byte_array(name, play_rate, frames, events, bone_info, bone_translate, bone_rotate, bone_scale):
-    byte_arr = b''
-    # The start of the data block (not the chunk).
-    data_block_offset = 0
-
-    # Write chunk name (if any)
-    if name != "":
-        byte_str = string_to_byte_string(name)
-        byte_arr += byte_str
-
-        data_block_offset += len(byte_str)
+    name_bytes, name_offsets, data_block_offset = layout_chunk_name(name)
 
-    vert_f_name_offsets = []
-
-    # Write all vert_frame_name strings (if any)
-    for frame_data in frames:
-        if frame_data[7] == None:
-            # No name, set the offset to -1
-            vert_f_name_offsets.append(-1)
-            continue
-        # Write name string
-        vert_f_name_offsets.append(data_block_offset)
-        byte_str = string_to_byte_string(frame_data[7])
-        byte_arr += byte_str
-
-        data_block_offset += len(byte_str)
+    # All vert_frame_name strings (if any)
+    vert_f_name_bytes, vert_f_name_offsets, data_block_offset = layout_optional_strings([frame_data[7] for frame_data in frames], data_block_offset)
 
     offset_frames = data_block_offset
+    data_block_offset += len(frames) * CPJ_SEQ_FRAME.size
 
-    # Write frame data
-    for i, frame_data in enumerate(frames):
-        # reserved
-        byte_arr += struct.pack("B", frame_data[0])
-        # num_bone_translate
-        byte_arr += struct.pack("B", frame_data[1])
-        # num_bone_rotate
-        byte_arr += struct.pack("B", frame_data[2])
-        # num_bone_scale
-        byte_arr += struct.pack("B", frame_data[3])
-        # first_bone_translate
-        byte_arr += struct.pack("I", frame_data[4])
-        # first_bone_rotate
-        byte_arr += struct.pack("I", frame_data[5])
-        # first_bone_scale
-        byte_arr += struct.pack("I", frame_data[6])
-        # offset_vert_frame_name
-        byte_arr += struct.pack("i", vert_f_name_offsets[i])
-        # 4*1 + 4*4 = 20
-        data_block_offset += 20
-
-    event_str_offsets = []
-
-    # Write all param_str strings (if any)
-    for event_data in events:
-        if event_data[2] == None:
-            # No name, set the offset to -1
-            event_str_offsets.append(-1)
-            continue
-        # Write name string
-        event_str_offsets.append(data_block_offset)
-        byte_str = string_to_byte_string(event_data[2])
-        byte_arr += byte_str
-
-        data_block_offset += len(byte_str)
+    # All param_str strings (if any)
+    event_str_bytes, event_str_offsets, data_block_offset = layout_optional_strings([event_data[2] for event_data in events], data_block_offset)
 
     offset_events = data_block_offset
+    data_block_offset += len(events) * CPJ_SEQ_EVENT.size
 
-    # Write event data
-    for i, event_data in enumerate(events):
-        # event_type
-        byte_arr += bytes(event_data[0], "ASCII")
-        # time
-        byte_arr += struct.pack("f", event_data[1])
-        # offset_param_str
-        byte_arr += struct.pack("i", event_str_offsets[i])
-        # 3*4 = 12
-        data_block_offset += 12
-
-    bone_info_str_off = []
-
-    # Write all bone offset strings
-    for bone_info_data in bone_info:
-        bone_info_str_off.append(data_block_offset)
-        byte_str = string_to_byte_string(bone_info_data[0])
-        byte_arr += byte_str
-
-        data_block_offset += len(byte_str)
+    bone_info_str_bytes, bone_info_str_off, data_block_offset = layout_strings([bone_info_data[0] for bone_info_data in bone_info], data_block_offset)
 
     offset_bone_info = data_block_offset
-
-    # Write all bone info data
-    for i, bone_info_data in enumerate(bone_info):
-        # offset_name
-        byte_arr += struct.pack("I", bone_info_str_off[i])
-        # src_length
-        byte_arr += struct.pack("f", bone_info_data[1])
-        data_block_offset += 8
+    data_block_offset += len(bone_info) * CPJ_SEQ_BONE_INFO.size
 
     offset_bone_translate = data_block_offset
-
-    # Write all bone translate data
-    for trans_data in bone_translate:
-        # bone_index
-        byte_arr += struct.pack("H", trans_data[0])
-        # reserved
-        byte_arr += struct.pack("H", trans_data[1])
-        # translate
-        for i in range(3):
-            translate = trans_data[2]
-            byte_arr += struct.pack("f", translate[i])
-        # 2*2 + 3*4
-        data_block_offset += 16
+    data_block_offset += len(bone_translate) * CPJ_SEQ_BONE_TRANSLATE.size
 
     offset_bone_rotate = data_block_offset
-
-    # Write all bone translate data
-    for rot_data in bone_rotate:
-        # bone_index
-        byte_arr += struct.pack("H", rot_data[0])
-        # roll
-        byte_arr += struct.pack("h", rot_data[1])
-        # pitch
-        byte_arr += struct.pack("h", rot_data[2])
-        # yaw
-        byte_arr += struct.pack("h", rot_data[3])
-        # 4*2
-        data_block_offset += 8
+    data_block_offset += len(bone_rotate) * CPJ_SEQ_BONE_ROTATE.size
 
     offset_bone_scale = data_block_offset
+    data_block_offset += len(bone_scale) * CPJ_SEQ_BONE_SCALE.size
 
-    # Write all bone translate data
-    for scale_data in bone_scale:
-        # bone_index
-        byte_arr += struct.pack("H", scale_data[0])
-        # reserved
-        byte_arr += struct.pack("H", scale_data[1])
-        # scale
-        for i in range(3):
-            scale = scale_data[2]
-            byte_arr += struct.pack("f", scale[i])
-        # 2*2 + 3*4
-        data_block_offset += 16
-
-    seq_info_bytes = b''
-
-    seq_info_bytes += struct.pack("f", play_rate)
+    byte_arr, data_start = allocate_chunk(CPJ_SEQ_MAGIC, CPJ_SEQ_VERSION, CPJ_SEQ_INFO, data_block_offset)
 
-    seq_info_bytes += struct.pack("I", len(frames))
-    seq_info_bytes += struct.pack("I", offset_frames)
+    CPJ_SEQ_INFO.pack_into(byte_arr, CPJ_CHUNK_HEADER.size, play_rate,
+                           len(frames), offset_frames,
+                           len(events), offset_events,
+                           len(bone_info), offset_bone_info,
+                           len(bone_translate), offset_bone_translate,
+                           len(bone_rotate), offset_bone_rotate,
+                           len(bone_scale), offset_bone_scale)
 
-    seq_info_bytes += struct.pack("I", len(events))
-    seq_info_bytes += struct.pack("I", offset_events)
+    write_strings(byte_arr, data_start, name_bytes, name_offsets)
+    write_strings(byte_arr, data_start, vert_f_name_bytes, vert_f_name_offsets)
 
-    seq_info_bytes += struct.pack("I", len(bone_info))
-    seq_info_bytes += struct.pack("I", offset_bone_info)
+    pos = data_start + offset_frames
+    for i, frame_data in enumerate(frames):
+        CPJ_SEQ_FRAME.pack_into(byte_arr, pos, *frame_data[0:7], vert_f_name_offsets[i])
+        pos += CPJ_SEQ_FRAME.size
 
-    seq_info_bytes += struct.pack("I", len(bone_translate))
-    seq_info_bytes += struct.pack("I", offset_bone_translate)
+    write_strings(byte_arr, data_start, event_str_bytes, event_str_offsets)
 
-    seq_info_bytes += struct.pack("I", len(bone_rotate))
-    seq_info_bytes += struct.pack("I", offset_bone_rotate)
+    pos = data_start + offset_events
+    for i, event_data in enumerate(events):
+        CPJ_SEQ_EVENT.pack_into(byte_arr, pos, bytes(event_data[0], "ASCII"), event_data[1], event_str_offsets[i])
+        pos += CPJ_SEQ_EVENT.size
 
-    seq_info_bytes += struct.pack("I", len(bone_scale))
-    seq_info_bytes += struct.pack("I", offset_bone_scale)
+    write_strings(byte_arr, data_start, bone_info_str_bytes, bone_info_str_off)
 
-    info_offset = 13*4
-    # The cpj header is 20 bytes (5*4)
-    name_offset = 20 + info_offset
+    pos = data_start + offset_bone_info
+    for i, bone_info_data in enumerate(bone_info):
+        CPJ_SEQ_BONE_INFO.pack_into(byte_arr, pos, bone_info_str_off[i], bone_info_data[1])
+        pos += CPJ_SEQ_BONE_INFO.size
 
-    # We already took into account the offset of these info variables at the start of the function
-    data_len = data_block_offset + info_offset
+    pos = data_start + offset_bone_translate
+    for trans_data in bone_translate:
+        translate = trans_data[2]
+        CPJ_SEQ_BONE_TRANSLATE.pack_into(byte_arr, pos, trans_data[0], trans_data[1], *translate[:3])
+        pos += CPJ_SEQ_BONE_TRANSLATE.size
 
-    seq_header_byte_arr = create_cpj_chunk_header_byte_array(CPJ_SEQ_MAGIC, data_len, CPJ_SEQ_VERSION, name_offset)
-    byte_arr = seq_header_byte_arr + seq_info_bytes + byte_arr
+    pos = data_start + offset_bone_rotate
+    for rot_data in bone_rotate:
+        CPJ_SEQ_BONE_ROTATE.pack_into(byte_arr, pos, *rot_data[0:4])
+        pos += CPJ_SEQ_BONE_ROTATE.size
 
-    # Sanity check
-    if (len(byte_arr) != data_len + 20):
-        print("Got " + str(len(byte_arr)) + " but calcuated size is " + str(data_len + 20))
-        raise ValueError("The calculated byte lenght of the array doesn't match up with the actual size!")
+    pos = data_start + offset_bone_scale
+    for scale_data in bone_scale:
+        scale = scale_data[2]
+        CPJ_SEQ_BONE_SCALE.pack_into(byte_arr, pos, scale_data[0], scale_data[1], *scale[:3])
+        pos += CPJ_SEQ_BONE_SCALE.size
 
     return byte_arr
 
 CPJ_SKL_MAGIC = "SKLB"
 CPJ_SKL_VERSION = 1
+# num_bones, data_offset_bones, num_verts, data_offset_verts,
+# num_weights, data_offset_weights, num_mounts, data_offset_mounts
+CPJ_SKL_INFO = struct.Struct("<8I")
+# offset_name, parent_index, base_scale (3f), base_rotate (4f), base_translate (3f), length
+CPJ_SKL_BONE = struct.Struct("<Ii3f4f3ff")
+# num_weights, first_weight
+CPJ_SKL_VERT = struct.Struct("<HH")
+# bone_index, weight_factor, offset_pos (3f)
+CPJ_SKL_WEIGHT = struct.Struct("<If3f")
+# offset_name, bone_index, base_scale (3f), base_rotate (4f), base_translate (3f)
+CPJ_SKL_MOUNT = struct.Struct("<II3f4f3f")
 def create_skl_byte_array(name, bones, verts, weights, mounts):
-    byte_arr = b''
-    # The start of the data block (not the chunk).
-    data_block_offset = 0
+    name_bytes, name_offsets, data_block_offset = layout_chunk_name(name)
 
-    # Write chunk name (if any)
-    if name != "":
-        byte_str = string_to_byte_string(name)
-        byte_arr += byte_str
+    bone_str_bytes, bone_str_offsets, data_block_offset = layout_strings([bone_data[0] for bone_data in bones], data_block_offset)
 
-        data_block_offset += len(byte_str)
+    offset_bones = data_block_offset
+    data_block_offset += len(bones) * CPJ_SKL_BONE.size
+
+    offset_verts = data_block_offset
+    data_block_offset += len(verts) * CPJ_SKL_VERT.size
 
-    bone_str_offsets = []
+    offset_weights = data_block_offset
+    data_block_offset += len(weights) * CPJ_SKL_WEIGHT.size
 
-    # Write bone name strings
-    for bone_data in bones:
-        bone_str_offsets.append(data_block_offset)
-        byte_str = string_to_byte_string(bone_data[0])
-        byte_arr += byte_str
+    mount_str_bytes, mount_str_offsets, data_block_offset = layout_strings([mount_data[0] for mount_data in mounts], data_block_offset)
 
-        data_block_offset += len(byte_str)
+    offset_mounts = data_block_offset
+    data_block_offset += len(mounts) * CPJ_SKL_MOUNT.size
 
-    offset_bones = data_block_offset
+    byte_arr, data_start = allocate_chunk(CPJ_SKL_MAGIC, CPJ_SKL_VERSION, CPJ_SKL_INFO, data_block_offset)
 
-    # Write bone data
-    for i, bone_data in enumerate(bones):
-        # offset_name
-        byte_arr += struct.pack("I", bone_str_offsets[i])
-        # parent_index
-        byte_arr += struct.pack("i", bone_data[1])
-        # base_scale
-        for x in range(3):
-            base_scale = bone_data[2]
-            byte_arr += struct.pack("f", base_scale[x])
-        # base_rotate
-        for x in range(4):
-            base_rotate = bone_data[3]
-            byte_arr += struct.pack("f", base_rotate[x])
-        # base_translate
-        for x in range(3):
-            base_translate = bone_data[4]
-            byte_arr += struct.pack("f", base_translate[x])
-        # length
-        byte_arr += struct.pack("f", bone_data[5])
-
-        # 2*4 + 3*4 + 4*4 + 3*4 + 4 = 52
-        data_block_offset += 52
+    CPJ_SKL_INFO.pack_into(byte_arr, CPJ_CHUNK_HEADER.size,
+                           len(bones), offset_bones,
+                           len(verts), offset_verts,
+                           len(weights), offset_weights,
+                           len(mounts), offset_mounts)
 
-    offset_verts = data_block_offset
+    write_strings(byte_arr, data_start, name_bytes, name_offsets)
+    write_strings(byte_arr, data_start, bone_str_bytes, bone_str_offsets)
 
-    # Write vert data
+    pos = data_start + offset_bones
+    for i, bone_data in enumerate(bones):
+        base_scale = bone_data[2]
+        base_rotate = bone_data[3]
+        base_translate = bone_data[4]
+        CPJ_SKL_BONE.pack_into(byte_arr, pos, bone_str_offsets[i], bone_data[1],
+                               *base_scale[:3], *base_rotate[:4], *base_translate[:3], bone_data[5])
+        pos += CPJ_SKL_BONE.size
+
+    pos = data_start + offset_verts
     for vert_data in verts:
-        # num_weights
-        byte_arr += struct.pack("H", vert_data[0])
-        # first_weight
-        byte_arr += struct.pack("H", vert_data[1])
-        # 2*2
-        data_block_offset += 4
-
-    offset_weights = data_block_offset
+        CPJ_SKL_VERT.pack_into(byte_arr, pos, vert_data[0], vert_data[1])
+        pos += CPJ_SKL_VERT.size
 
-    # Write weight data
+    pos = data_start + offset_weights
     for weight_data in weights:
-        # bone_index
-        byte_arr += struct.pack("I", weight_data[0])
-        # weight_factor
-        byte_arr += struct.pack("f", weight_data[1])
-        # offset_pos
-        for i in range(3):
-            offset_pos = weight_data[2]
-            byte_arr += struct.pack("f", offset_pos[i])
-        # 2*4 + 3*4 = 20
-        data_block_offset += 20
-
-    mount_str_offsets = []
-
-    # Write mount names
-    for mount_data in mounts:
-        mount_str_offsets.append(data_block_offset)
-        byte_str = string_to_byte_string(mount_data[0])
-        byte_arr += byte_str
+        offset_pos = weight_data[2]
+        CPJ_SKL_WEIGHT.pack_into(byte_arr, pos, weight_data[0], weight_data[1], *offset_pos[:3])
+        pos += CPJ_SKL_WEIGHT.size
 
-        data_block_offset += len(byte_str)
-
-    offset_mounts = data_block_offset
+    write_strings(byte_arr, data_start, mount_str_bytes, mount_str_offsets)
 
-    # Write mount data
+    pos = data_start + offset_mounts
     for i, mount_data in enumerate(mounts):
-        # offset_name
-        byte_arr += struct.pack("I", mount_str_offsets[i])
-        # bone_index
-        byte_arr += struct.pack("I", mount_data[1])
-        # base_scale
-        for x in range(3):
-            base_scale = bone_data[2]
-            byte_arr += struct.pack("f", base_scale[x])
-        # base_rotate
-        for x in range(4):
-            base_rotate = bone_data[3]
-            byte_arr += struct.pack("f", base_rotate[x])
-        # base_translate
-        for x in range(3):
-            base_translate = bone_data[4]
-            byte_arr += struct.pack("f", base_translate[x])
-        # 2*4 + 3*4 + 4*4 + 3*4 = 52
-        data_block_offset += 48
-
-    skl_info_bytes = b''
-
-    skl_info_bytes += struct.pack("I", len(bones))
-    skl_info_bytes += struct.pack("I", offset_bones)
-
-    skl_info_bytes += struct.pack("I", len(verts))
-    skl_info_bytes += struct.pack("I", offset_verts)
-
-    skl_info_bytes += struct.pack("I", len(weights))
-    skl_info_bytes += struct.pack("I", offset_weights)
-
-    skl_info_bytes += struct.pack("I", len(mounts))
-    skl_info_bytes += struct.pack("I", offset_mounts)
-
-    info_offset = 2*4 + 2*4 + 2*4 + 2*4
-    # The cpj header is 20 bytes (5*4)
-    name_offset = 20 + info_offset
-
-    # We already took into account the offset of these info variables at the start of the function
-    data_len = data_block_offset + info_offset
-
-    skl_header_byte_arr = create_cpj_chunk_header_byte_array(CPJ_SKL_MAGIC, data_len, CPJ_SKL_VERSION, name_offset)
-    # Add it all together
-    byte_arr = skl_header_byte_arr + skl_info_bytes + byte_arr
-
-    # Sanity check
-    if (len(byte_arr) != data_len + 20):
-        raise ValueError("The calculated byte lenght of the array doesn't match up with the actual size!")
+        base_scale = mount_data[2]
+        base_rotate = mount_data[3]
+        base_translate = mount_data[4]
+        CPJ_SKL_MOUNT.pack_into(byte_arr, pos, mount_str_offsets[i], mount_data[1],
+                                *base_scale[:3], *base_rotate[:4], *base_translate[:3])
+        pos += CPJ_SKL_MOUNT.size
 
     return byte_arr
 
 CPJ_SRF_MAGIC = "SRFB"
 CPJ_SRF_VERSION = 1
+# num_textures, data_offset_textures, num_tris, data_offset_tris, num_uvs, data_offset_uvs
+CPJ_SRF_INFO = struct.Struct("<6I")
+# offset_name, offset_ref_name
+CPJ_SRF_TEXTURE = struct.Struct("<II")
+# uv_index (3H), tex_index, reserved, flags, smooth_group, alpha_level, glaze_tex_index, glaze_func
+CPJ_SRF_TRI = struct.Struct("<3HBBIBBBB")
+CPJ_SRF_UV = struct.Struct("<2f")
 def create_srf_byte_array(name, textures, tris, uv_coords):
-    byte_arr = b''
-    # The start of the data block (not the chunk).
-    data_block_offset = 0
-
-    # Write chunk name (if any)
-    if name != "":
-        byte_str = string_to_byte_string(name)
-        byte_arr += byte_str
-
-        data_block_offset += len(byte_str)
+    name_bytes, name_offsets, data_block_offset = layout_chunk_name(name)
 
-    texture_string_offsets = []
-
-    # Write texture data strings
+    texture_strings = []
     for texture_data in textures:
-        offsets = [0,0]
-        offsets[0] = data_block_offset
-        byte_str = string_to_byte_string(texture_data[0])
-        byte_arr += byte_str
-        data_block_offset += len(byte_str)
+        texture_strings.append(texture_data[0])
+        # An empty reference name is not stored and gets the offset 0
+        texture_strings.append(texture_data[1] if texture_data[1] != "" else None)
 
-        if texture_data[1] != "":
-            offsets[1] = data_block_offset
-            byte_str = string_to_byte_string(texture_data[1])
-            byte_arr += byte_str
-            data_block_offset += len(byte_str)
-        texture_string_offsets.append(offsets)
+    texture_str_bytes, texture_str_offsets, data_block_offset = layout_optional_strings(texture_strings, data_block_offset)
 
     offset_textures = data_block_offset
-
-    # Write texture string offsets
-    for offsets in texture_string_offsets:
-        byte_arr += struct.pack("I", offsets[0])
-        byte_arr += struct.pack("I", offsets[1])
-        data_block_offset += 8 #(2 * 4) bytes for each section
+    data_block_offset += len(textures) * CPJ_SRF_TEXTURE.size
 
     offset_tris = data_block_offset
-    # Write triangle data
-    for tri_data in tris:
-        # uv_index
-        for i in range(3):
-            uv_index = tri_data[0]
-            # index of uvs in uv_coords
-            byte_arr += struct.pack("H", uv_index[i])
-        # tex_index
-        byte_arr += struct.pack("B", tri_data[1])
-        # reserved
-        byte_arr += struct.pack("B", tri_data[2])
-        # flags
-        byte_arr += struct.pack("I", tri_data[3])
-        # smooth_group
-        byte_arr += struct.pack("B", tri_data[4])
-        # alpha_level
-        byte_arr += struct.pack("B", tri_data[5])
-        # glaze_tex_index
-        byte_arr += struct.pack("B", tri_data[6])
-        # glaze_func
-        byte_arr += struct.pack("B", tri_data[7])
-        # 3*2 + 2*1 + 4 + 4*1 = 16 bytes
-        data_block_offset += 16
+    data_block_offset += len(tris) * CPJ_SRF_TRI.size
 
     offset_uvs = data_block_offset
-    for uv_co in uv_coords:
-        byte_arr += struct.pack("f", uv_co[0])
-        byte_arr += struct.pack("f", uv_co[1])
-        data_block_offset += 8 #(2 * 4) bytes for each section
+    data_block_offset += len(uv_coords) * CPJ_SRF_UV.size
 
-    srf_info_bytes = b''
+    byte_arr, data_start = allocate_chunk(CPJ_SRF_MAGIC, CPJ_SRF_VERSION, CPJ_SRF_INFO, data_block_offset)
 
-    srf_info_bytes += struct.pack("I", len(textures))
-    srf_info_bytes += struct.pack("I", offset_textures)
+    CPJ_SRF_INFO.pack_into(byte_arr, CPJ_CHUNK_HEADER.size,
+                           len(textures), offset_textures,
+                           len(tris), offset_tris,
+                           len(uv_coords), offset_uvs)
 
-    srf_info_bytes += struct.pack("I", len(tris))
-    srf_info_bytes += struct.pack("I", offset_tris)
+    write_strings(byte_arr, data_start, name_bytes, name_offsets)
+    write_strings(byte_arr, data_start, texture_str_bytes, texture_str_offsets)
 
-    srf_info_bytes += struct.pack("I", len(uv_coords))
-    srf_info_bytes += struct.pack("I", offset_uvs)
+    pos = data_start + offset_textures
+    for i in range(len(textures)):
+        offset_name = texture_str_offsets[2*i]
+        offset_ref_name = max(texture_str_offsets[2*i + 1], 0)
+        CPJ_SRF_TEXTURE.pack_into(byte_arr, pos, offset_name, offset_ref_name)
+        pos += CPJ_SRF_TEXTURE.size
 
-    info_offset = 6*4
-    # The cpj header is 20 bytes (5*4)
-    name_offset = 20 + info_offset
-
-    # We already took into account the offset of these info variables at the start of the function
-    data_len = data_block_offset + info_offset
-
-    srf_header_byte_arr = create_cpj_chunk_header_byte_array(CPJ_SRF_MAGIC, data_len, CPJ_SRF_VERSION, name_offset)
-    byte_arr = srf_header_byte_arr + srf_info_bytes + byte_arr
+    pos = data_start + offset_tris
+    for tri_data in tris:
+        # index of uvs in uv_coords
+        uv_index = tri_data[0]
+        CPJ_SRF_TRI.pack_into(byte_arr, pos, *uv_index[:3], *tri_data[1:8])
+        pos += CPJ_SRF_TRI.size
 
-    # Sanity check
-    if (len(byte_arr) != data_len + 20):
-        raise ValueError("The calculated byte lenght of the array doesn't match up with the actual size!")
+    pos = data_start + offset_uvs
+    for uv_co in uv_coords:
+        CPJ_SRF_UV.pack_into(byte_arr, pos, uv_co[0], uv_co[1])
+        pos += CPJ_SRF_UV.size
 
     return byte_arr
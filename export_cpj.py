@@ -25,13 +25,17 @@ import bpy
 from mathutils import Vector
 from mathutils import Matrix
 import mathutils
-import bmesh
 
 from cpj_utils import *
+from cpj_arrays import (build_geo_topology, create_geo_byte_array_from_arrays, create_srf_byte_array_from_arrays,
+                        create_skl_byte_array_from_arrays, create_frm_byte_array_from_arrays, compress_frm_positions,
+                        GEO_MOUNT_DTYPE, SRF_TRI_DTYPE, SKL_BONE_DTYPE, SKL_VERT_DTYPE, SKL_WEIGHT_DTYPE, SKL_MOUNT_DTYPE)
 
 import math
 import shlex
 
+import numpy as np
+
 from dataclasses import dataclass
 
 @dataclass
@@ -63,106 +67,101 @@ def save(context, filepath, export_settings):
 
     apply_modifiers = True
 
-    data_chunks = []
-
-    objs_to_process = []
-
-    processed_mesh_names = []
-    processed_uv_names = []
-    processed_armature_names = []
-    frm_populated_obj_name = ""
+    # The chunks are written to the file as soon as they are created so only one of them has to be kept in memory.
+    # If the export fails, the partially written file is removed again.
+    with CpjWriter(filepath) as cpj_writer:
+        objs_to_process = []
+
+        processed_mesh_names = []
+        processed_uv_names = []
+        processed_armature_names = []
+        frm_populated_obj_name = ""
+
+        for text_block in bpy.data.texts:
+            if text_block.name.startswith("cpj_"):
+                mac_name = text_block.name[4:]
+                mac_byte_data, mac_obj_data = parse_mac_text(mac_name, text_block.as_string(), text_block.name)
+                cpj_writer.write_chunk(mac_byte_data)
+                objs_to_process.append(mac_obj_data)
+
+        for obj_data in objs_to_process:
+            mesh_name = obj_data.mesh_name
+            obj = obj_data.mesh_object
+
+            if obj.data.shape_keys != None:
+                # Ensure that the base mesh is exported without any unwanted shapekey deformations
+                old_sk_show = obj.show_only_shape_key
+                old_sk_idx = obj.active_shape_key_index
+                obj.show_only_shape_key = True
+
+                blocks = obj.data.shape_keys.key_blocks
+                if "Armature offsets" in blocks:
+                    obj.active_shape_key_index = blocks.keys().index("Armature offsets")
+                else:
+                    # The basis shape key is on index 0
+                    obj.active_shape_key_index = 0
 
-    for text_block in bpy.data.texts:
-        if text_block.name.startswith("cpj_"):
-            mac_name = text_block.name[4:]
-            mac_byte_data, mac_obj_data = parse_mac_text(mac_name, text_block.as_string(), text_block.name)
-            data_chunks.append(mac_byte_data)
-            objs_to_process.append(mac_obj_data)
+            armature = obj_data.armature_object
+            if armature:
 
-    for obj_data in objs_to_process:
-        mesh_name = obj_data.mesh_name
-        obj = obj_data.mesh_object
+                # Sanity check, ensure that the origin of the armature is the same as the object
+                if armature.matrix_world != obj.matrix_world:
+                    raise Exception("The location, rotation and scale has to be the same for the mesh and armature object! (" + obj.name + ", " + armature.name + ")")
 
-        if obj.data.shape_keys != None:
-            # Ensure that the base mesh is exported without any unwanted shapekey deformations
-            old_sk_show = obj.show_only_shape_key
-            old_sk_idx = obj.active_shape_key_index
-            obj.show_only_shape_key = True
+                # Ensure that the armature is in its rest postion.
+                # Otherwise the exported base geometry will be deformed by it
+                old_pose_setting = armature.data.pose_position
+                armature.data.pose_position = 'REST'
 
-            blocks = obj.data.shape_keys.key_blocks
-            if "Armature offsets" in blocks:
-                obj.active_shape_key_index = blocks.keys().index("Armature offsets")
+            if apply_modifiers:
+                depsgraph = context.evaluated_depsgraph_get()
+                me = obj.evaluated_get(depsgraph).to_mesh()
             else:
-                # The basis shape key is on index 0
-                obj.active_shape_key_index = 0
+                me = obj.to_mesh()
 
-        armature = obj_data.armature_object
-        if armature:
+            # The cpj format only supports triangles, so export the triangulation of the mesh polygons
+            tris, tri_loops, tri_polygons = get_mesh_triangles(me)
 
-            # Sanity check, ensure that the origin of the armature is the same as the object
-            if armature.matrix_world != obj.matrix_world:
-                raise Exception("The location, rotation and scale has to be the same for the mesh and armature object! (" + obj.name + ", " + armature.name + ")")
-
-            # Ensure that the armature is in its rest postion.
-            # Otherwise the exported base geometry will be deformed by it
-            old_pose_setting = armature.data.pose_position
-            armature.data.pose_position = 'REST'
-
-        if apply_modifiers:
-            depsgraph = context.evaluated_depsgraph_get()
-            me = obj.evaluated_get(depsgraph).to_mesh()
-        else:
-            me = obj.to_mesh()
+            if not mesh_name in processed_mesh_names:
+                cpj_writer.write_chunk(create_geo_data(obj, mesh_name, me, tris))
+                processed_mesh_names.append(mesh_name)
 
-        bm = bmesh.new()
-        bm.from_mesh(me)
+                frm_byte_data = create_frm_data(obj, export_settings['compress_frames'])
+                if frm_byte_data != None:
+                    if frm_populated_obj_name != "":
+                        raise Exception("Only one FRM data block can be created in a cpj file! Both " + obj.name + " and " + frm_populated_obj_name + " tried to create FRM data")
+                    cpj_writer.write_chunk(frm_byte_data)
+                    frm_populated_obj_name = obj.name
 
-        # The cpj format only supports triangles, so ensure that everything is triangulated
-        bmesh.ops.triangulate(bm, faces=bm.faces)
-        loops = sum(bm.calc_loop_triangles(),())
+            if len(obj_data.uv_layers) > 1:
+                raise Exception("Can't handle more that one SRF layer on a mesh currently")
 
-        if not mesh_name in processed_mesh_names:
-            data_chunks.append(create_geo_data(obj, mesh_name, bm, loops))
-            processed_mesh_names.append(mesh_name)
+            for uv_name in obj_data.uv_layers:
+                if uv_name in processed_uv_names:
+                    raise Exception("Tried to add multiple UV layers of the same name: " + uv_name)
 
-            frm_byte_data = create_frm_data(obj)
-            if frm_byte_data != None:
-                if frm_populated_obj_name != "":
-                    raise Exception("Only one FRM data block can be created in a cpj file! Both " + obj.name + " and " + frm_populated_obj_name + " tried to create FRM data")
-                data_chunks.append(frm_byte_data)
-                frm_populated_obj_name = obj.name
+                cpj_writer.write_chunk(create_srf_data(obj, uv_name, me, tri_loops, tri_polygons))
+                processed_uv_names.append(uv_name)
 
-        if len(obj_data.uv_layers) > 1:
-            raise Exception("Can't handle more that one SRF layer on a mesh currently")
+            if obj.data.shape_keys != None:
+                obj.show_only_shape_key = old_sk_show
+                obj.active_shape_key_index = old_sk_idx
 
-        for uv_name in obj_data.uv_layers:
-            if uv_name in processed_uv_names:
-                raise Exception("Tried to add multiple UV layers of the same name: " + uv_name)
+            if armature != None:
+                armature_name = obj_data.armature_name
+                if not armature_name in processed_armature_names:
+                    cpj_writer.write_chunk(create_skl_data(obj, me, armature, armature_name))
+                    processed_armature_names.append(armature_name)
+                armature.data.pose_position = old_pose_setting
 
-            data_chunks.append(create_srf_data(obj, uv_name, bm, loops))
-            processed_uv_names.append(uv_name)
-        bm.free()
+            if not export_settings['skip_animation_export']:
+                for seq_byte_data in create_seq_data(obj, armature):
+                    cpj_writer.write_chunk(seq_byte_data)
 
-        if obj.data.shape_keys != None:
-            obj.show_only_shape_key = old_sk_show
-            obj.active_shape_key_index = old_sk_idx
-
-        if armature != None:
-            armature_name = obj_data.armature_name
-            if not armature_name in processed_armature_names:
-                data_chunks.append(create_skl_data(obj, me, armature, armature_name))
-                processed_armature_names.append(armature_name)
-            armature.data.pose_position = old_pose_setting
-
-        if not export_settings['skip_animation_export']:
-            data_chunks += create_seq_data(obj, armature)
-
-        if apply_modifiers:
-            obj.evaluated_get(depsgraph).to_mesh_clear()
-        else:
-            me = obj.to_mesh_clear()
-
-    write_cpj_file(filepath, data_chunks)
+            if apply_modifiers:
+                obj.evaluated_get(depsgraph).to_mesh_clear()
+            else:
+                me = obj.to_mesh_clear()
 
     return {'FINISHED'}
 
@@ -343,7 +342,7 @@ def parse_mac_text(mac_name, mac_text, text_block_name):
 
     return mac_byte_data, mac_obj_data
 
-def get_geo_mount_data(obj, bm):
+def get_geo_mount_data(obj, tris, vert_co):
     mounts = []
     mounts_data = []
     for child in obj.children:
@@ -354,21 +353,17 @@ def get_geo_mount_data(obj, bm):
 
     for mount in mounts:
         # Get triangle to the mount point
-        v0 = bm.verts[mount.parent_vertices[0]]
-        v1 = bm.verts[mount.parent_vertices[1]]
-        v2 = bm.verts[mount.parent_vertices[2]]
+        parent_verts = mount.parent_vertices
+        face_indices = np.flatnonzero((tris == parent_verts[0]).any(axis=1) & (tris == parent_verts[1]).any(axis=1) & (tris == parent_verts[2]).any(axis=1))
 
-        face_set = set( v0.link_faces ) & set( v1.link_faces ) & set( v2.link_faces )
-
-        if len(face_set) != 1:
+        if len(face_indices) != 1:
             raise Exception("Invalid geo mount in object '" + obj.name + "', not parented to a single triangle.")
-        face = face_set.pop()
+        face_index = int(face_indices[0])
 
         # The vertex order might be different in the parent_verticies than the actual winding of the triangle.
         # Use the triangle winding order as that is what is in the Cannibal spec.
-        v0 = face.verts[0]
-        v1 = face.verts[1]
-        v2 = face.verts[2]
+        v0, v1, v2 = [Vector(vert_co[vert_index]) for vert_index in tris[face_index].tolist()]
+        face_normal = mathutils.geometry.normal(v0, v1, v2)
 
         # Convert mount location and axis into mesh local coordinates
         mount_mat = obj_mat_inv @ mount.matrix_world
@@ -376,14 +371,14 @@ def get_geo_mount_data(obj, bm):
 
         point_offset = Vector((0,0,0))
 
-        if bmesh.geometry.intersect_face_point(face, mount_loc):
+        if mathutils.geometry.intersect_point_tri(mount_loc, v0, v1, v2) != None:
             # The projected point will lie inside the triangle
-            vec = mount_loc - v2.co
-            vec_normal = vec.project(face.normal)
+            vec = mount_loc - v2
+            vec_normal = vec.project(face_normal)
 
-            point_in_plane = vec - vec_normal + v2.co
+            point_in_plane = vec - vec_normal + v2
 
-            bary_weights = mathutils.interpolate.poly_3d_calc([v2.co,v1.co,v0.co], point_in_plane)
+            bary_weights = mathutils.interpolate.poly_3d_calc([v2, v1, v0], point_in_plane)
 
             if vec_normal.length > 0.001:
                 point_offset = mount_loc - point_in_plane
@@ -391,7 +386,7 @@ def get_geo_mount_data(obj, bm):
             # The point will have to be projected to the closest edge
             min_dist = float("inf")
 
-            edge_corners = [v2.co,v1.co,v0.co]
+            edge_corners = [v2, v1, v0]
             for i, _ in enumerate(edge_corners):
                 e_vec = edge_corners[(i+1) % 3] - edge_corners[i]
 
@@ -431,9 +426,9 @@ def get_geo_mount_data(obj, bm):
                     point_offset = mount_loc - point_in_plane
         # Calculate the "native" transform axis the cpj mount will use
         # Up
-        z_vec = face.normal
+        z_vec = face_normal
         # Forward
-        y_vec = -(v2.co - point_in_plane)
+        y_vec = -(v2 - point_in_plane)
         y_vec.normalize()
         # Side
         x_vec = y_vec.cross(z_vec)
@@ -460,7 +455,7 @@ def get_geo_mount_data(obj, bm):
 
         mount_data = []
         mount_data.append(mount.name)
-        mount_data.append(face.index)
+        mount_data.append(face_index)
         mount_data.append(bary_weights)
         mount_data.append((1, 1, 1))
         mount_data.append(quat_to_cpj_quat(rot_diff))
@@ -469,85 +464,79 @@ def get_geo_mount_data(obj, bm):
         mounts_data.append(mount_data)
     return mounts_data
 
-def create_geo_data(obj, geo_name, bm, loops):
-    # Ensure all indices are valid and up to date
-    bm.verts.ensure_lookup_table()
-    bm.faces.ensure_lookup_table()
-
-    # The loop indices are invalid after triangulation, fix them.
-    for i, loop in enumerate(loops):
-        loop.index = i
-
-    # construct geo data lists
-    verts = []
-    edges = []
-    tris = []
-    mounts = []
-    obj_links = []
-
-    flags_layer = bm.verts.layers.int['lod_lock']
-    group_index_layer = bm.verts.layers.int['frm_group_index']
-
-    for vert_data in bm.verts:
-        vert = []
-        vert.append(vert_data[flags_layer])
-        vert.append(vert_data[group_index_layer])
-        vert.append(0) # reserved, must be zero
-        vert.append(len(vert_data.link_loops)) # num_edge_links
-        vert.append(len(vert_data.link_faces)) # num_tri_links
-
-        # Save the start index that we wrote data to in obj_links
-        vert.append(len(obj_links)) # first_edge_link
-        for loop in vert_data.link_loops:
-            obj_links.append(loop.index)
-
-        vert.append(len(obj_links)) # first_tri_link
-        for face in vert_data.link_faces:
-            obj_links.append(face.index)
-        # We need to flip the coordinate axis as Blender and CPJ doesn't use the same system
-        vert.append((vert_data.co.x, vert_data.co.z, -vert_data.co.y)) # ref_pos
-
-        verts.append(vert)
-
-    for loop in loops:
-        edge = []
-        edge.append(loop.link_loop_next.vert.index) # head_vertex
-        edge.append(loop.vert.index) # tail_vertex
-        edge.append(loop.link_loop_radial_next.index) # inverted edge
-        edge.append(len(loop.link_loops) + 1) # num_tri_links
-        edge.append(len(obj_links)) # first_tri_link
-
-        obj_links.append(loop.face.index)
-        for i in range(len(loop.link_loops)):
-            loop = loop.link_loop_radial_next
-            obj_links.append(loop.face.index)
-
-        edges.append(edge)
-
-    for tri_data in bm.faces:
-        tri = []
-        edge_ring = tri_data.loops
-        # We need to reverse the winding to be able to properly transform into the CPJ coordinate system.
-        tri.append((edge_ring[2].index, edge_ring[1].index, edge_ring[0].index)) # edge_ring
-        tri.append(0) # reserved, must be zero
-
-        tris.append(tri)
-
-    mounts = get_geo_mount_data(obj, bm)
-
-    geo_byte_data = create_geo_byte_array(geo_name, verts, edges, tris, mounts, obj_links)
+def get_mesh_triangles(me):
+    # Returns the (T,3) vertex indices, loop indices and the polygon index of the mesh loop triangles
+    me.calc_loop_triangles()
+    num_tris = len(me.loop_triangles)
+
+    tris = np.empty(num_tris * 3, dtype=np.int32)
+    me.loop_triangles.foreach_get("vertices", tris)
+    tri_loops = np.empty(num_tris * 3, dtype=np.int32)
+    me.loop_triangles.foreach_get("loops", tri_loops)
+    tri_polygons = np.empty(num_tris, dtype=np.int32)
+    me.loop_triangles.foreach_get("polygon_index", tri_polygons)
+
+    return tris.reshape(-1, 3), tri_loops.reshape(-1, 3), tri_polygons
+
+def check_value_range(obj, values, field_dtype, value_name, chunk_type):
+    # Don't let values silently wrap around when they are cast to the smaller chunk field types
+    limits = np.iinfo(field_dtype)
+    if len(values) != 0 and (values.min() < limits.min or values.max() > limits.max):
+        raise Exception("Object '" + obj.name + "' has '" + value_name + "' values outside of the " + str(limits.min) + "-" + str(limits.max) + " range that a " + chunk_type + " chunk can hold")
+
+def create_geo_data(obj, geo_name, me, tris):
+    num_verts = len(me.vertices)
+
+    # Vertex and edge indices are stored as 16 bit values
+    if num_verts > 65536 or len(tris) * 3 > 65536:
+        raise Exception("The mesh of object '" + obj.name + "' is too large to export. A GEO chunk can only hold 65536 vertices and 21845 triangles")
+
+    # The mesh edge order decides the order of the vertex links, like it did for the BMesh based export
+    edge_keys = np.empty(len(me.edges) * 2, dtype=np.int32)
+    me.edges.foreach_get("vertices", edge_keys)
+
+    # construct geo data arrays
+    verts, edges, geo_tris, obj_links = build_geo_topology(tris, num_verts, edge_keys.reshape(-1, 2))
+
+    vert_co = np.empty(num_verts * 3, dtype=np.float32)
+    me.vertices.foreach_get("co", vert_co)
+    vert_co = vert_co.reshape(-1, 3)
+
+    flags = np.empty(num_verts, dtype=np.int32)
+    me.attributes['lod_lock'].data.foreach_get("value", flags)
+    group_index = np.empty(num_verts, dtype=np.int32)
+    me.attributes['frm_group_index'].data.foreach_get("value", group_index)
+
+    check_value_range(obj, flags, verts.dtype["flags"], "lod_lock", "GEO")
+    check_value_range(obj, group_index, verts.dtype["group_index"], "frm_group_index", "GEO")
+    verts["flags"] = flags
+    verts["group_index"] = group_index
+    # We need to flip the coordinate axis as Blender and CPJ doesn't use the same system
+    verts["ref_pos"] = vert_co[:, [0, 2, 1]] * np.array([1.0, 1.0, -1.0], dtype=np.float32)
+
+    mounts_data = get_geo_mount_data(obj, tris, vert_co)
+
+    mount_names = []
+    mounts = np.zeros(len(mounts_data), dtype=GEO_MOUNT_DTYPE)
+    for i, (mount_name, tri_index, tri_barys, base_scale, base_rotate, base_translate) in enumerate(mounts_data):
+        mount_names.append(mount_name)
+        mounts["tri_index"][i] = tri_index
+        mounts["tri_barys"][i] = tri_barys
+        mounts["base_scale"][i] = base_scale
+        mounts["base_rotate"][i] = base_rotate
+        mounts["base_translate"][i] = base_translate
+
+    geo_byte_data = create_geo_byte_array_from_arrays(geo_name, verts, edges, geo_tris, mounts, mount_names, obj_links)
 
     return geo_byte_data
 
-def create_srf_data(obj, uv_name, bm, loops):
+def create_srf_data(obj, uv_name, me, tri_loops, tri_polygons):
     # This should have already been checked in the MAC data parser, but can't hurt to be a bit paranoid
-    if not uv_name in bm.loops.layers.uv:
+    if not uv_name in me.uv_layers:
         raise Exception("The specifed UV '" + uv_name + "' doesn't exist in object: " + obj.name )
 
     # construct srf data lists
     textures = []
-    tris = []
-    uv_coords = []
 
     # TODO this only works properly with one UV mat.
     # we don't know which textures to pull and we can't have mutiple data layers of the same name for the mesh.
@@ -558,46 +547,55 @@ def create_srf_data(obj, uv_name, bm, loops):
         tex = [material.name, ref_name]
         textures.append(tex)
 
-    flags_layer = bm.faces.layers.int['flags']
-    smooth_group_layer = bm.faces.layers.int['smooth_group']
-    alpha_level_layer = bm.faces.layers.int['alpha_level']
-    glaze_index_layer = bm.faces.layers.int['glaze_index']
-    glaze_func_layer = bm.faces.layers.int['glaze_func']
+    num_loops = len(me.loops)
+    num_polygons = len(me.polygons)
+
+    loop_uvs = np.empty(num_loops * 2, dtype=np.float32)
+    me.uv_layers[uv_name].data.foreach_get("uv", loop_uvs)
+    loop_uvs = loop_uvs.reshape(-1, 2)
+    # The texture coordinate system is different in CPJ.
+    # The upper left corner is the origin point (instead of the bottom left as it is in Blender)
+    loop_uvs[:, 1] = 1.0 - loop_uvs[:, 1]
+
+    # Weld identical UVs, every triangle corner points into the deduplicated UV table.
+    # We need to reverse the winding to be able to properly transform into the CPJ coordinate system.
+    uv_coords, uv_index = np.unique(loop_uvs[tri_loops[:, ::-1]].reshape(-1, 2), axis=0, return_inverse=True)
+    if len(uv_coords) > 65536:
+        raise Exception("Object '" + obj.name + "' has too many unique UV coordinates in '" + uv_name + "'. A SRF chunk can only hold 65536")
 
-    for tri_data in bm.faces:
-        tri = []
-        # We need to reverse the winding to be able to properly transform into the CPJ coordinate system.
-        tri.append((tri_data.loops[2].index, tri_data.loops[1].index, tri_data.loops[0].index))
-        tri.append(tri_data.material_index)
-        tri.append(0) # reserved, must be zero
-        tri.append(tri_data[flags_layer])
-        tri.append(tri_data[smooth_group_layer])
-        tri.append(tri_data[alpha_level_layer])
-        tri.append(tri_data[glaze_index_layer])
-        tri.append(tri_data[glaze_func_layer])
+    tris = np.zeros(len(tri_loops), dtype=SRF_TRI_DTYPE)
+    tris["uv_index"] = uv_index.reshape(-1, 3)
 
-        tris.append(tri)
+    def set_tri_field(field, values, value_name):
+        values = values[tri_polygons]
+        check_value_range(obj, values, tris.dtype[field], value_name, "SRF")
+        tris[field] = values
 
-    uv_layer = bm.loops.layers.uv[0]
+    material_index = np.empty(num_polygons, dtype=np.int32)
+    me.polygons.foreach_get("material_index", material_index)
+    set_tri_field("tex_index", material_index, "material_index")
 
-    for loop in loops:
-        uv = loop[uv_layer].uv
-        # The texture coordinate system is different in CPJ.
-        # The upper left corner is the origin point (instead of the bottom left as it is in Blender)
-        uv_coords.append((uv[0], 1.0 - uv[1]))
+    for field, attribute_name in (("flags", 'flags'), ("smooth_group", 'smooth_group'), ("alpha_level", 'alpha_level'),
+                                  ("glaze_tex_index", 'glaze_index'), ("glaze_func", 'glaze_func')):
+        values = np.empty(num_polygons, dtype=np.int32)
+        me.attributes[attribute_name].data.foreach_get("value", values)
+        set_tri_field(field, values, attribute_name)
 
-    srf_byte_data = create_srf_byte_array(uv_name, textures, tris, uv_coords)
+    srf_byte_data = create_srf_byte_array_from_arrays(uv_name, textures, tris, uv_coords)
 
     return srf_byte_data
 
 def create_skl_data(obj, me, arm_obj, armature_name):
     bone_list = arm_obj.data.bones
+    num_bones = len(bone_list)
+    bone_indices = {bone_data.name: bone_index for bone_index, bone_data in enumerate(bone_list)}
 
-    bones = []
-
-    for bone_data in bone_list:
-        bone = []
+    bones = np.zeros(num_bones, dtype=SKL_BONE_DTYPE)
+    bone_names = []
+    # The inverted rest matrices are used for the weight offsets below
+    inv_bone_matrices = np.empty((num_bones, 4, 4))
 
+    for bone_index, bone_data in enumerate(bone_list):
         mat = bone_data.matrix_local
 
         if bone_data.parent == None:
@@ -612,53 +610,70 @@ def create_skl_data(obj, me, arm_obj, armature_name):
             parent_index = -1
         else:
             base_mat = bone_data.parent.matrix_local
-            parent_index = bone_list.find(bone_data.parent.name)
+            parent_index = bone_indices[bone_data.parent.name]
 
-        diff_mat = base_mat.inverted() @ bone_data.matrix_local
+        diff_mat = base_mat.inverted() @ mat
         decomp = diff_mat.decompose()
-        bone_trans = decomp[0]
-
-        bone.append(bone_data.name)
-        bone.append(parent_index)
-        bone.append(decomp[2]) # base_scale
-        bone.append(quat_to_cpj_quat(decomp[1])) # base_rotation (cpj quaternion)
-        bone.append(bone_trans) # base_translation
-        bone.append(bone_data.length)
-
-        bones.append(bone)
-
-    verts = []
-    weights = []
-
-    for vert_data in me.vertices:
-        vert = []
-        vert.append(len(vert_data.groups)) # num_weights
-        vert.append(len(weights)) # first_weight
-
-        verts.append(vert)
 
-        for group in vert_data.groups:
-            weight_data = []
-
-            bone_name = obj.vertex_groups[group.group].name
-            bone_index = bone_list.find(bone_name)
-            if bone_index < 0:
-                # We did not find the bone for the vertex group in the bone list!
-                # Because this can cause bone weights to break in the cpj file, we have to raise an exception.
-                raise Exception("No corresponding bone for vertex group '" + bone_name + "' found. Either delete the vertex group or create a bone for it.")
-            bone = bone_list[bone_index]
-            offset_pos = bone.matrix_local.inverted() @ vert_data.co
-
-            weight_data.append(bone_index)
-            weight_data.append(group.weight) # weight_factor
-            weight_data.append(offset_pos)
-
-            weights.append(weight_data)
+        bone_names.append(bone_data.name)
+        bones["parent_index"][bone_index] = parent_index
+        bones["base_scale"][bone_index] = decomp[2]
+        bones["base_rotate"][bone_index] = quat_to_cpj_quat(decomp[1]) # cpj quaternion
+        bones["base_translate"][bone_index] = decomp[0]
+        bones["length"][bone_index] = bone_data.length
+
+        inv_bone_matrices[bone_index] = mat.inverted()
+
+    num_verts = len(me.vertices)
+
+    # Gather all (vertex group, weight) pairs, the weights of a vertex are stored after each other
+    num_weights = np.empty(num_verts, dtype=np.intp)
+    weight_groups = []
+    weight_factors = []
+    for vert_index, vert_data in enumerate(me.vertices):
+        vert_groups = vert_data.groups
+        num_weights[vert_index] = len(vert_groups)
+        for group in vert_groups:
+            weight_groups.append(group.group)
+            weight_factors.append(group.weight)
+
+    first_weight = np.zeros(num_verts, dtype=np.intp)
+    np.cumsum(num_weights[:-1], out=first_weight[1:])
+    # The weight indices and counts are stored as 16 bit values. Vertices without weights after the last weight
+    # still point one past it, so the first weight index has to fit as well as the weight count.
+    if len(weight_groups) > 65536 or num_verts > 65536 or (num_verts != 0 and max(first_weight[-1], num_weights.max()) > 65535):
+        raise Exception("The mesh of object '" + obj.name + "' has too many vertices or weights to export. A SKL chunk can only hold 65536 of each")
+
+    # Map the vertex groups to bones once
+    group_bone = np.array([bone_indices.get(group.name, -1) for group in obj.vertex_groups] + [-1], dtype=np.intp)
+    weight_bone = group_bone[np.array(weight_groups, dtype=np.intp)]
+    if np.any(weight_bone < 0):
+        # We did not find the bone for the vertex group in the bone list!
+        # Because this can cause bone weights to break in the cpj file, we have to raise an exception.
+        bone_name = obj.vertex_groups[weight_groups[int(np.argmax(weight_bone < 0))]].name
+        raise Exception("No corresponding bone for vertex group '" + bone_name + "' found. Either delete the vertex group or create a bone for it.")
+
+    vert_co = np.empty(num_verts * 3, dtype=np.float32)
+    me.vertices.foreach_get("co", vert_co)
+    weight_co = vert_co.reshape(-1, 3)[np.repeat(np.arange(num_verts), num_weights)]
+
+    # Transform every weighted vertex into the space of its bone with one batched product
+    weight_matrices = inv_bone_matrices[weight_bone]
+    offset_pos = np.einsum("wij,wj->wi", weight_matrices[:, :3, :3], weight_co) + weight_matrices[:, :3, 3]
+
+    verts = np.zeros(num_verts, dtype=SKL_VERT_DTYPE)
+    verts["num_weights"] = num_weights
+    verts["first_weight"] = first_weight
+
+    weights = np.zeros(len(weight_groups), dtype=SKL_WEIGHT_DTYPE)
+    weights["bone_index"] = weight_bone
+    weights["weight_factor"] = weight_factors
+    weights["offset_pos"] = offset_pos
 
     # TODO mounts. There doesn't seem to be any existing models with bone mounts, it is even supported in the engine?
-    mounts = []
+    mounts = np.zeros(0, dtype=SKL_MOUNT_DTYPE)
 
-    skl_byte_data = create_skl_byte_array(armature_name, bones, verts, weights, mounts)
+    skl_byte_data = create_skl_byte_array_from_arrays(armature_name, bones, bone_names, verts, weights, mounts, [])
 
     return skl_byte_data
 
@@ -720,79 +735,58 @@ def calc_boundbox_max_min(obj):
 
     return max_bb, min_bb
 
-def create_frm_data(obj):
+def create_frm_data(obj, compress_frames):
     if obj.data.shape_keys == None:
         # Nothing to do here.
         return None
 
     skip_entries = ["Basis", "Armature offsets"]
 
-    frames = []
-    # The bounding box for the whole frame bundle
-    inf = float("inf")
-    frm_bb_min = [inf, inf, inf]
-    frm_bb_max = [-inf, -inf, -inf]
-    for block in obj.data.shape_keys.key_blocks:
-        if block.name in skip_entries:
-            continue
-
-        frame_verts = []
-        # Bounding box for the individual frame
-        bb_min = [inf, inf, inf]
-        bb_max = [-inf, -inf, -inf]
-
-        for vert in block.data:
-            # Switch around coordinate system because it is different in CPJ
-            coord = (vert.co.x, vert.co.z, -vert.co.y)
-            # Calculate the bounding box
-            bb_min[0] = min(bb_min[0], coord[0])
-            bb_min[1] = min(bb_min[1], coord[1])
-            bb_min[2] = min(bb_min[2], coord[2])
-
-            bb_max[0] = max(bb_max[0], coord[0])
-            bb_max[1] = max(bb_max[1], coord[1])
-            bb_max[2] = max(bb_max[2], coord[2])
-            # TODO support compression
-            # if frame_groups:
-
-            # Save as Uncompressed vertex data
-            frame_verts.append(coord)
-
-        frame_data = []
-        frame_data.append(block.name)
-        frame_data.append(bb_min)
-        frame_data.append(bb_max)
-
-        num_groups = 0 # TODO used for compression
-        frame_groups = []
-        frame_data.append(num_groups)
-        frame_data.append(frame_groups)
-
-        frame_data.append(len(frame_verts))
-        frame_data.append(frame_verts)
-
-        frames.append(frame_data)
-
-        frm_bb_min[0] = min(frm_bb_min[0], bb_min[0])
-        frm_bb_min[1] = min(frm_bb_min[1], bb_min[1])
-        frm_bb_min[2] = min(frm_bb_min[2], bb_min[2])
-
-        frm_bb_max[0] = max(frm_bb_max[0], bb_max[0])
-        frm_bb_max[1] = max(frm_bb_max[1], bb_max[1])
-        frm_bb_max[2] = max(frm_bb_max[2], bb_max[2])
-
-    if len(frames) == 0:
+    blocks = [block for block in obj.data.shape_keys.key_blocks if not block.name in skip_entries]
+    if len(blocks) == 0:
         return None
 
+    num_frames = len(blocks)
+    num_verts = len(obj.data.vertices)
+
+    # Read all shape keys into one (frames, verts, 3) array
+    frame_co = np.empty((num_frames, num_verts * 3), dtype=np.float32)
+    for i, block in enumerate(blocks):
+        block.data.foreach_get("co", frame_co[i])
+    frame_co = frame_co.reshape(num_frames, num_verts, 3)
+
+    # Switch around coordinate system because it is different in CPJ
+    verts = frame_co[:, :, [0, 2, 1]]
+    verts[:, :, 2] *= -1.0
+
+    # The bounding boxes of the individual frames and the whole frame bundle
+    bb_min = verts.min(axis=1, initial=np.inf)
+    bb_max = verts.max(axis=1, initial=-np.inf)
+    frm_bb_min = bb_min.min(axis=0)
+    frm_bb_max = bb_max.max(axis=0)
+
+    frame_names = [block.name for block in blocks]
+
+    groups = None
+    if compress_frames and num_verts != 0:
+        # Quantize the vertices to bytes within the bounding box of their "frm_group_index" group
+        group_index = np.empty(num_verts, dtype=np.int32)
+        obj.data.attributes['frm_group_index'].data.foreach_get("value", group_index)
+        if group_index.min() < 0 or group_index.max() > 255:
+            raise Exception("The 'frm_group_index' values of object '" + obj.name + "' have to be between 0 and 255 to compress the vertex frames")
+
+        groups, verts, max_error = compress_frm_positions(verts, group_index)
+        print("Compressed vertex frames of " + obj.name + ", max error: " + str(max_error))
+
     # Seems like every cpj file I inspected has only one "default" frame block.
     # Currently this name is not saved anywhere in the imported data. So here we just assume it is "default".
     frm_block_name = "default"
-    frm_byte_data = create_frm_byte_array(frm_block_name, (frm_bb_min, frm_bb_max), frames)
+    frm_byte_data = create_frm_byte_array_from_arrays(frm_block_name, (frm_bb_min, frm_bb_max), frame_names, bb_min, bb_max, verts, groups)
 
     return frm_byte_data
 
 def create_seq_data(obj, armature):
-    seq_byte_list = []
+    # Generator, yields the SEQ chunk of each action as soon as it has been created
     # Read all animation action strips in the blend file and save the data as cpj SEQ data.
     for action in bpy.data.actions:
 
@@ -981,5 +975,4 @@ def create_seq_data(obj, armature):
                     event_data = ["TRIG", marker.frame / (action.frame_end + 1), marker.name]
                 events.append(event_data)
 
-        seq_byte_list.append(create_seq_byte_array(action.name, framerate, frames, events, bone_info, bone_translate, bone_rotate, bone_scale))
-    return seq_byte_list
+        yield create_seq_byte_array(action.name, framerate, frames, events, bone_info, bone_translate, bone_rotate, bone_scale)
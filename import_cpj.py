@@ -21,21 +21,23 @@
 # ----------------------------------------------------------------------------
 import colorsys
 import bpy
-import bmesh
 import mathutils
 
 from cpj_utils import *
 
-from formats.frm import Frm
-from formats.geo import Geo
-from formats.srf import Srf
-from formats.skl import Skl
-from formats.seq import Seq
 from formats.mac import Mac
 
 import math
 from math import pi
 
+import numpy as np
+
+from cpj_arrays import decode_chunks, quaternions_to_matrices, BLENDER_AXES, BLENDER_AXES_SIGN
+
+# Integer values of the Keyframe.interpolation enum, used for bulk foreach_set writes
+KEYFRAME_INTERPOLATION_CONSTANT = 0
+KEYFRAME_INTERPOLATION_LINEAR = 1
+
 # ----------------------------------------------------------------------------
 def get_loaded_data_name_safe(name, load_data_dict):
     if name in load_data_dict:
@@ -56,40 +58,83 @@ def get_loaded_data_safe(name, load_data_dict):
     safe_name = get_loaded_data_name_safe(name, load_data_dict)
     return load_data_dict[safe_name]
 
+def get_required_chunk_names(mac_commands_list):
+    # Collect the names of the GEO, SRF and SKL chunks that the MAC data actually uses
+    required_names = {"GEOB": set(), "SRFB": set(), "SKLB": set()}
+
+    for mac_commands in mac_commands_list:
+        if "SetGeometry" in mac_commands:
+            required_names["GEOB"].add(mac_commands["SetGeometry"].strip('"'))
+        if "SetSurface" in mac_commands:
+            required_names["SRFB"].add(mac_commands["SetSurface"][1].strip('"'))
+        if "SetSkeleton" in mac_commands:
+            required_names["SKLB"].add(mac_commands["SetSkeleton"].strip('"'))
+
+    return required_names
+
 def load(filepath, import_settings):
 
     # info
     print("Reading %s..." % filepath)
 
-    cpj_data = load_cpj_data(filepath)
-
     if import_settings['only_import_animations']:
+        # Only the animation sequences are needed, so don't load any other chunks
+        cpj_data = load_cpj_data(filepath, chunk_types={"SEQB"})
+        chunk_arrays = decode_chunks(cpj_data, import_settings['parallel_parse'])
+
         # Load in all animaiton sequences
-        if "SEQB" in cpj_data:
+        if "SEQB" in chunk_arrays:
             obj = ""
             ob_armature = bpy.context.active_object
 
             if ob_armature.type != 'ARMATURE':
                 raise ImportError("The active object needs to be an armature you want to import the animations to!")
 
-            for seq_byte_data in cpj_data["SEQB"]:
-                seq_data = Seq.from_bytes(seq_byte_data)
-
+            for seq_data in chunk_arrays["SEQB"]:
                 load_seq(seq_data, obj, ob_armature, True)
         else:
             raise ImportError("This file doesn't containt any animation data. There are no SEQ chunks!")
 
         return {'FINISHED'}
 
+    cpj_file = CpjFile(filepath)
+
     # Load Model Actor Configuation data
     # Unlike other chunks, there has to be at least 1 MAC chunk
-    if len(cpj_data["MACB"]) == 0:
+    mac_byte_data_list = cpj_file.chunk_data_dict(chunk_types={"MACB"}).get("MACB", [])
+    if len(mac_byte_data_list) == 0:
+        cpj_file.close()
         raise ImportError("Doesn't seem to be a valid cpj file. There are no MAC chunks!")
 
+    mac_list = []
+    for mac_byte_data in mac_byte_data_list:
+        mac_data = Mac.from_bytes(mac_byte_data)
+        mac_list.append((mac_data, load_mac(mac_data)))
+
+    # Only load the chunks that the MAC commands reference
+    required_names = get_required_chunk_names([mac_commands for _, mac_commands in mac_list])
+    required_types = {"GEOB", "SRFB", "SKLB"}
+    for _, mac_commands in mac_list:
+        if "AddFrames" in mac_commands and "NULL" in mac_commands["AddFrames"]:
+            required_types.add("FRMB")
+        if "AddSequences" in mac_commands and "NULL" in mac_commands["AddSequences"]:
+            required_types.add("SEQB")
+
+    def is_required_chunk(chunk_type, name):
+        if chunk_type in required_names:
+            return name in required_names[chunk_type]
+        return True
+
+    cpj_data = cpj_file.chunk_data_dict(required_types, is_required_chunk)
+
+    # Parse all chunks before creating any Blender data.
+    # Only the Blender data creation below has to run on the main thread.
+    chunk_arrays = decode_chunks(cpj_data, import_settings['parallel_parse'])
+    cpj_file.close()
+
     # Load in all geometry data
     geo_data_dict = {}
-    for geo_byte_data in cpj_data["GEOB"]:
-        geo_data = Geo.from_bytes(geo_byte_data)
+    for geo_data in chunk_arrays.get("GEOB", []):
         mesh_data, geo_mounts = load_geo(geo_data)
         geo_data_dict[mesh_data.name] = [mesh_data, geo_mounts]
 
@@ -98,23 +143,17 @@ def load(filepath, import_settings):
 
     # Load in all surface data
     srf_data_dict = {}
-    if "SRFB" in cpj_data:
-        for srf_byte_data in cpj_data["SRFB"]:
-            srf_data = Srf.from_bytes(srf_byte_data)
-            srf_data_dict[srf_data.name] = srf_data
+    for srf_data in chunk_arrays.get("SRFB", []):
+        srf_data_dict[srf_data.name] = srf_data
 
     # Load in all skeleton data
     skl_data_dict = {}
-    if "SKLB" in cpj_data:
-        for skl_byte_data in cpj_data["SKLB"]:
-            skl_data = Skl.from_bytes(skl_byte_data)
-            arm_data = load_skl(skl_data)
-            skl_data_dict[skl_data.name] = arm_data
-
-    for mac_byte_data in cpj_data["MACB"]:
-        mac_data = Mac.from_bytes(mac_byte_data)
-        mac_commands = load_mac(mac_data)
+    for skl_data in chunk_arrays.get("SKLB", []):
+        arm_data = load_skl(skl_data)
+        skl_data_dict[skl_data.name] = arm_data
 
+    shared_mesh_dict = {}
+    for mac_data, mac_commands in mac_list:
         collection = bpy.data.collections.new(mac_data.name)
         bpy.context.scene.collection.children.link(collection)
 
@@ -135,9 +174,26 @@ def load(filepath, import_settings):
         geo_name = get_loaded_data_name_safe(geo_name, geo_data_dict)
         geo_data = geo_data_dict[geo_name]
 
-        # TODO This is to ensure that we can correctly import multiple objects using the same geo base mesh.
-        # I guess this could be done in a cleaner way...
-        geo_data_dict[geo_name] = [geo_data[0].copy(), geo_data[1]]
+        has_frames = "FRMB" in chunk_arrays and "AddFrames" in mac_commands and "NULL" in mac_commands["AddFrames"]
+        has_sequences = "SEQB" in chunk_arrays and "AddSequences" in mac_commands and "NULL" in mac_commands["AddSequences"]
+
+        # Objects that use the same geometry, surface, skeleton and vertex animations end up with identical meshes.
+        # With "share_meshes" they are all linked to the first mesh instead of getting a copy each.
+        srf_name = mac_commands["SetSurface"][1].strip('"') if "SetSurface" in mac_commands else None
+        skl_name = mac_commands["SetSkeleton"].strip('"') if "SetSkeleton" in mac_commands else None
+        mesh_key = (geo_name, srf_name, skl_name, has_frames, has_sequences)
+
+        shared_mesh = None
+        if import_settings['share_meshes']:
+            shared_mesh = shared_mesh_dict.get(mesh_key)
+
+        if shared_mesh == None:
+            # TODO This is to ensure that we can correctly import multiple objects using the same geo base mesh.
+            # I guess this could be done in a cleaner way...
+            geo_data_dict[geo_name] = [geo_data[0].copy(), geo_data[1]]
+            shared_mesh_dict[mesh_key] = geo_data[0]
+        else:
+            geo_data = [shared_mesh, geo_data[1]]
 
         obj = create_mesh_obj(mac_data.name, collection, geo_data)
         obj.location = loc
@@ -150,37 +206,39 @@ def load(filepath, import_settings):
             # TODO LOD
             print("Skipping LOD entry in MAC file!")
 
-        if "SetSurface" in mac_commands:
-            srf_name = mac_commands["SetSurface"][1].strip('"')
+        if srf_name != None and shared_mesh == None:
             srf_data = get_loaded_data_safe(srf_name, srf_data_dict)
             load_srf(srf_data, obj.data)
 
         ob_armature = ""
-        if "SetSkeleton" in mac_commands:
-            skl_name = mac_commands["SetSkeleton"].strip('"')
+        if skl_name != None:
             skl_data = get_loaded_data_safe(skl_name, skl_data_dict)
-            ob_armature = hook_up_skl_to_obj(obj, skl_name, skl_data, collection)
+            ob_armature = hook_up_skl_to_obj(obj, skl_name, skl_data, collection, shared_mesh != None)
             ob_armature.location = loc
             ob_armature.rotation_euler = rot
             ob_armature.scale = scale
 
         # Load vertex animation data as shape keys
         has_vertex_anim = False
-        if "FRMB" in cpj_data and "AddFrames" in mac_commands and "NULL" in mac_commands["AddFrames"]:
-            for frm_byte_data in cpj_data["FRMB"]:
-                frm_data = Frm.from_bytes(frm_byte_data)
-
-                load_frm(frm_data, obj)
+        if has_frames:
+            for frm_data in chunk_arrays["FRMB"]:
+                if shared_mesh == None:
+                    load_frm(frm_data, obj)
                 has_vertex_anim = True
 
         # Load in all animaiton sequences
-        if "SEQB" in cpj_data and "AddSequences" in mac_commands and "NULL" in mac_commands["AddSequences"]:
-            if not has_vertex_anim:
+        if has_sequences:
+            shape_key_frames = None
+            if has_vertex_anim and shared_mesh == None:
+                shape_key_frames = get_shape_key_frames(obj.data.shape_keys)
+            else:
+                # A shared mesh already has the vertex animations on its shape keys
                 obj = ""
-            for seq_byte_data in cpj_data["SEQB"]:
-                seq_data = Seq.from_bytes(seq_byte_data)
-
-                load_seq(seq_data, obj, ob_armature, False)
+            if obj == "" and ob_armature == "":
+                # There is nothing left to animate on this object
+                continue
+            for seq_data in chunk_arrays["SEQB"]:
+                load_seq(seq_data, obj, ob_armature, False, shape_key_frames)
 
     return {'FINISHED'}
 
@@ -192,35 +250,19 @@ def load_frm(frm_data, obj):
         sk_basis.interpolation = 'KEY_LINEAR'
         obj.data.shape_keys.use_relative = False
 
-    for frame in frm_data.data_block.frames:
-        # Create new shape key
-        sk = obj.shape_key_add(name=frame.name)
-        sk.interpolation = 'KEY_LINEAR'
-
-        uses_group_compression = (frame.num_groups != 0)
-
-        pos = [0.0]*3
-
-        for i, vert in enumerate(frame.verts):
-            if uses_group_compression:
-                group_data = frame.groups[vert.group]
-                byte_pos = vert.pos
-                byte_pos[0] *= group_data.byte_scale.x
-                byte_pos[1] *= group_data.byte_scale.y
-                byte_pos[2] *= group_data.byte_scale.z
+    # Decode and expand all frames at once, already converted to Blender space
+    frame_positions = frm_data.positions()
 
-                byte_pos[0] += group_data.byte_translate.x
-                byte_pos[1] += group_data.byte_translate.y
-                byte_pos[2] += group_data.byte_translate.z
+    if frm_data.num_frames != 0 and frame_positions.shape[1] != len(verts):
+        raise ImportError("The vertex frames in '" + str(frm_data.name) + "' don't have the same number of vertices as the mesh")
 
-                pos = byte_pos
-            else:
-                pos = (vert.x, vert.y, vert.z)
+    for frame_name, positions in zip(frm_data.frame_names, frame_positions):
+        # Create new shape key
+        sk = obj.shape_key_add(name=frame_name)
+        sk.interpolation = 'KEY_LINEAR'
 
-            # position each vert
-            sk.data[i].co.x = pos[0]
-            sk.data[i].co.y = -pos[2]
-            sk.data[i].co.z = pos[1]
+        # position all verts with one bulk write
+        sk.data.foreach_set("co", positions.ravel())
 
 def create_custom_data_layers(mesh_data):
     # NOTE: We are not using the return values from the .new functions as there
@@ -243,58 +285,47 @@ def create_custom_data_layers(mesh_data):
 
 # Load mesh geometry data into Blender.
 def load_geo(geo_data):
-    verts = geo_data.data_block.vertices
-    vert_len = len(verts)
-
-    cpj_verts = []
+    ref_pos = geo_data.ref_pos
+    vert_len = len(ref_pos)
 
-    for vert in verts:
-        ref = vert.ref_pos
-        # Convert the vertex position into the correct transformation space for Blender
-        cpj_verts.append((ref.x, -ref.z, ref.y))
+    # Convert the vertex positions into the correct transformation space for Blender
+    cpj_verts = np.empty((vert_len, 3), dtype=np.float32)
+    cpj_verts[:, 0] = ref_pos[:, 0]
+    cpj_verts[:, 1] = -ref_pos[:, 2]
+    cpj_verts[:, 2] = ref_pos[:, 1]
 
-    edges = geo_data.data_block.edges
-
-    #for edge in edges:
-    tris = geo_data.data_block.triangles
-
-    # Create a list of mesh faces
-    bl_faces = []
-    for tri in tris:
-
-        # Do the reverse winding of the triangle here as otherwise the triangles will
-        # become inverted because we convert the vertex coordinates to the Blender
-        # coordinate system.
-        e0 = tri.edge_ring[2]
-        e1 = tri.edge_ring[1]
-        e2 = tri.edge_ring[0]
-
-        v0 = edges[e0].tail_vertex
-        v1 = edges[e1].tail_vertex
-        v2 = edges[e2].tail_vertex
-        bl_faces.append((v0, v1, v2))
+    # Get the vertex indices of the mesh faces
+    # Do the reverse winding of the triangle here as otherwise the triangles will
+    # become inverted because we convert the vertex coordinates to the Blender
+    # coordinate system.
+    bl_faces = geo_data.tri_vertex_indices()[:, ::-1]
 
     name = "No_name_defined"
 
-    if hasattr(geo_data, 'name'):
+    if geo_data.name != None:
         name = geo_data.name
 
     mesh_data = bpy.data.meshes.new(name)
-    mesh_data.from_pydata(cpj_verts, [], bl_faces)
-    mesh_data.update()
 
-    create_custom_data_layers(mesh_data)
+    # Create the geometry with bulk array writes instead of going via Python lists
+    num_tris = len(bl_faces)
+    mesh_data.vertices.add(vert_len)
+    mesh_data.vertices.foreach_set("co", cpj_verts.ravel())
+    mesh_data.loops.add(num_tris * 3)
+    mesh_data.loops.foreach_set("vertex_index", bl_faces.astype(np.int32).ravel())
+    mesh_data.polygons.add(num_tris)
+    # All faces are triangles, so each face starts three loops after the previous one
+    mesh_data.polygons.foreach_set("loop_start", np.arange(0, num_tris * 3, 3, dtype=np.int32))
+    mesh_data.update(calc_edges=True)
 
-    lod_lock_layer = mesh_data.attributes["lod_lock"]
-    group_index_layer = mesh_data.attributes["frm_group_index"]
+    create_custom_data_layers(mesh_data)
 
-    for i, vert in enumerate(verts):
-        # As 'flags' can only be 0 or 1, we don't need to do any type casting
-        lod_lock_layer.data[i].value = vert.flags
-        group_index_layer.data[i].value = vert.group_index
+    # 'flags' can only be 0 or 1, so it maps directly to the lod_lock value
+    mesh_data.attributes["lod_lock"].data.foreach_set("value", geo_data.flags.astype(np.int32))
+    mesh_data.attributes["frm_group_index"].data.foreach_set("value", geo_data.group_index.astype(np.int32))
 
-    print("mounts on geo object: " + str(len(geo_data.data_block.mounts)))
-    return mesh_data, geo_data.data_block.mounts
+    print("mounts on geo object: " + str(len(geo_data.mounts)))
+    return mesh_data, geo_data
 
 def create_mesh_obj(name, collection, geo_data):
     mesh_data = geo_data[0]
@@ -304,91 +335,96 @@ def create_mesh_obj(name, collection, geo_data):
     scene = bpy.context.scene
     collection.objects.link(obj)
 
-    for mount in geo_mounts:
+    mounts = geo_mounts.mounts
+    if len(mounts) == 0:
+        return obj
+
+    tri_index = mounts["tri_index"].astype(np.intp)
+    if tri_index.max() >= len(mesh_data.polygons):
+        raise ImportError("A mount in '" + mesh_data.name + "' references a triangle that doesn't exist")
+
+    # Gather the parent triangle vertices of all mounts
+    loop_start = np.empty(len(mesh_data.polygons), dtype=np.int32)
+    mesh_data.polygons.foreach_get("loop_start", loop_start)
+    loop_verts = np.empty(len(mesh_data.loops), dtype=np.int32)
+    mesh_data.loops.foreach_get("vertex_index", loop_verts)
+    vert_co = np.empty(len(mesh_data.vertices) * 3, dtype=np.float32)
+    mesh_data.vertices.foreach_get("co", vert_co)
+
+    tri_verts = loop_verts[loop_start[tri_index][:, None] + np.arange(3)]
+    tri_co = vert_co.reshape(-1, 3).astype(np.float64)[tri_verts]
+    v0, v1, v2 = tri_co[:, 0], tri_co[:, 1], tri_co[:, 2]
+
+    def normalized(vecs):
+        return vecs / np.linalg.norm(vecs, axis=1)[:, None]
+
+    # Calcute how much to move the mount point from the parent face center
+    # NOTE we need to reverse the vertex order here (IE 2,1,0 instead of 0,1,2)
+    # because we changed the winding of the triangle when we imported the mesh (to fix the mesh normals).
+    tri_barys = mounts["tri_barys"]
+    mount_loc = v2 * tri_barys[:, 0:1] + v1 * tri_barys[:, 1:2] + v0 * tri_barys[:, 2:3]
+
+    # The triangle normal, the same as polygon.normal
+    normal = normalized(np.cross(v0 - v1, v1 - v2))
+
+    # The mounts local tranform matrix is calculated by:
+    # 1. Using the triangle normal as the "Up" axis
+    # 2. Forward axis that is the direction from mount_loc to the first vertex in the triangle (v2 in this case because we changed the winding)
+    # 3. The last axis is determined by crossing the to axis vectors above
+    y_vec = normalized(mount_loc - v2)
+    x_vec = normalized(np.cross(y_vec, normal))
+    mount_local_matrix = np.stack((x_vec, y_vec, normal), axis=2)
+
+    # The VERTEX_3 parent transform that Blender computes from the triangle:
+    # Z is the triangle normal, X points from the first to the second vertex and the origin is the triangle center.
+    parent_x = normalized(v1 - v0)
+    parent_matrix_inv = np.stack((parent_x, np.cross(normal, parent_x), normal), axis=1)
+    local_coords = np.einsum("mij,mj->mi", parent_matrix_inv, mount_loc - tri_co.mean(axis=1))
+
+    base_rotate = mounts["base_rotate"]
+    rot_mat = quaternions_to_matrices(np.stack((base_rotate[:, 0], -base_rotate[:, 2], base_rotate[:, 1], base_rotate[:, 3]), axis=1))
+
+    parent_inverse = np.zeros((len(mounts), 4, 4))
+    parent_inverse[:, :3, :3] = parent_matrix_inv @ mount_local_matrix @ rot_mat
+    # Specify the offset from parent face center
+    # NOTE we don't set the third axis (Z) here because we should always lie in the triangle plane, so it should always be zero.
+    parent_inverse[:, 0, 3] = local_coords[:, 0]
+    parent_inverse[:, 1, 3] = local_coords[:, 1]
+    parent_inverse[:, 3, 3] = 1.0
+
+    location = mounts["base_translate"][:, BLENDER_AXES] * BLENDER_AXES_SIGN
+
+    for i, mount_name in enumerate(geo_mounts.mount_names):
         # Create an "Empty" type object as a mount
-        mount_obj = bpy.data.objects.new(mount.name, None)
+        mount_obj = bpy.data.objects.new(mount_name, None)
         collection.objects.link(mount_obj)
 
         # Setup the partent
-        parent_tri = mesh_data.polygons[mount.tri_index]
-
         mount_obj.parent = obj
         mount_obj.parent_type = 'VERTEX_3'
-        mount_obj.parent_vertices = parent_tri.vertices
-
-        # Calcute how much to move the mount point from the parent face center
-        v0 = mesh_data.vertices[parent_tri.vertices[0]]
-        v1 = mesh_data.vertices[parent_tri.vertices[1]]
-        v2 = mesh_data.vertices[parent_tri.vertices[2]]
+        mount_obj.parent_vertices = tri_verts[i].tolist()
+        mount_obj.matrix_parent_inverse = parent_inverse[i].tolist()
 
-        # NOTE we need to reverse the vertex order here (IE 2,1,0 instead of 0,1,2)
-        # because we changed the winding of the triangle when we imported the mesh (to fix the mesh normals).
-        mount_loc = v2.co * mount.tri_barys.x + v1.co * mount.tri_barys.y + v0.co * mount.tri_barys.z
+        mount_obj.location = location[i].tolist()
 
-        # The mounts local tranform matrix is calculated by:
-        # 1. Using the triangle normal as the "Up" axis
-        # 2. Forward axis that is the direction from mount_loc to the first vertex in the triangle (v2 in this case because we changed the winding)
-        # 3. The last axis is determined by crossing the to axis vectors above
-
-        # Up
-        z_vec = parent_tri.normal
-        # Forward
-        y_vec = -(v2.co - mount_loc)
-        y_vec.normalize()
-        # Side
-        x_vec = y_vec.cross(z_vec)
-        x_vec.normalize()
-
-        mount_local_matrix = mathutils.Matrix([x_vec, y_vec, z_vec]).transposed()
-
-        # Make sure that "matrix_world" is up to date.
-        # We need to make sure that the mount point has been moved into the origin of Blenders triangle matrix transform space.
-        # Otherwise we can't figure out how to manipulate the matrix_parent_inverse matrix to get to correct transform.
-        bpy.context.view_layer.update()
-
-        mat_world_inv = mount_obj.matrix_world.inverted()
-        local_coords = mat_world_inv @ mount_loc
-
-        matrix_diff = mat_world_inv.to_3x3() @ mount_local_matrix
-
-        mount_obj.matrix_parent_inverse = matrix_diff.to_4x4()
-
-        quat = mathutils.Quaternion((mount.base_rotate.s, mount.base_rotate.v.x, -mount.base_rotate.v.z, mount.base_rotate.v.y))
-        rot_mat = quat.to_matrix().to_4x4()
-
-        mount_obj.matrix_parent_inverse = mount_obj.matrix_parent_inverse @ rot_mat
-
-        # Specify the offset from parent face center
-        # NOTE we don't set the third axis (Z) here because we should always lie in the triangle plane, so it should always be zero.
-        mount_obj.matrix_parent_inverse[0][3] = local_coords[0]
-        mount_obj.matrix_parent_inverse[1][3] = local_coords[1]
-
-        mount_obj.location.x = mount.base_translate.x
-        mount_obj.location.y = -mount.base_translate.z
-        mount_obj.location.z = mount.base_translate.y
-
-        #mount_obj.scale[0] = mount.base_scale.x
-        #mount_obj.scale[1] = -mount.base_scale.z
-        #mount_obj.scale[2] = mount.base_scale.y
+        #mount_obj.scale[0] = base_scale[0]
+        #mount_obj.scale[1] = -base_scale[2]
+        #mount_obj.scale[2] = base_scale[1]
 
     return obj
 
 # Load mesh texture and UV data into Blender.
 def load_srf(srf_data, mesh_data):
-    # Create new empty UV layer
-    bl_uv_layer = mesh_data.uv_layers.new(name=srf_data.name, do_init=False)
-
-    # Init BMesh with our existing object mesh
-    bm = bmesh.new()
-    bm.from_mesh(mesh_data)
-    bm.faces.ensure_lookup_table()
-    uv_layer = bm.loops.layers.uv[0]
+    num_tris = len(mesh_data.polygons)
 
     # Sanity check
-    if srf_data.num_tris != len(bm.faces):
+    if srf_data.num_tris != num_tris:
         raise ImportError("Different number of mesh faces in GEO and SRF")
 
-    textures = srf_data.data_block.textures
+    # Create new empty UV layer
+    bl_uv_layer = mesh_data.uv_layers.new(name=srf_data.name, do_init=False)
+
+    textures = srf_data.textures
 
     h_val = 0.0
 
@@ -404,81 +440,46 @@ def load_srf(srf_data, mesh_data):
             mat["CPJ texture ref"] = tex.ref_name
         h_val += 0.1
 
-    tris = srf_data.data_block.tris
-    uvs = srf_data.data_block.uvs
-
-    # Create the UV map
-    for i, tri in enumerate(tris):
-        # This is reversing the loop because we reversed the vertex loop order for the geometry itself as well
-        uv0_idx = tri.uv_index[2]
-        uv1_idx = tri.uv_index[1]
-        uv2_idx = tri.uv_index[0]
-
-        uv0 = (uvs[uv0_idx].u, 1.0 - uvs[uv0_idx].v)
-        uv1 = (uvs[uv1_idx].u, 1.0 - uvs[uv1_idx].v)
-        uv2 = (uvs[uv2_idx].u, 1.0 - uvs[uv2_idx].v)
-
-        bm.faces[i].loops[0][uv_layer].uv = uv0
-        bm.faces[i].loops[1][uv_layer].uv = uv1
-        bm.faces[i].loops[2][uv_layer].uv = uv2
-
-        # set material index
-        bm.faces[i].material_index = tri.tex_index
-
-    # Update our object mesh
-    bm.to_mesh(mesh_data)
-    bm.free()
-
-    flags_layer = mesh_data.attributes["flags"]
-    smooth_group_layer = mesh_data.attributes["smooth_group"]
-    alpha_level_layer = mesh_data.attributes["alpha_level"]
-    glaze_index_layer = mesh_data.attributes["glaze_index"]
-    glaze_func_layer = mesh_data.attributes["glaze_func"]
-
-    for i, tri in enumerate(tris):
-        flags_layer.data[i].value = tri.flags
-        smooth_group_layer.data[i].value = tri.smooth_group
-        alpha_level_layer.data[i].value = tri.alpha_level
-        glaze_index_layer.data[i].value = tri.glaze_tex_index
-        glaze_func_layer.data[i].value = tri.glaze_func
-
-def process_bone(bone_index, created_bones, edit_bones, bone_datas, has_processed_parents):
-    bone_data = bone_datas[bone_index]
-
-    parent_index = bone_data.parent_index
-    bone = edit_bones[created_bones[bone_index]]
-
-    if parent_index >= 0:  # -1 is root bone/no parent
-        parent_bone = edit_bones[created_bones[parent_index]]
-        bone.parent = parent_bone
-
-        if has_processed_parents[parent_index] == False:
-            # Ensure that root parent bone is in the correct position.
-            process_bone(parent_index, created_bones, edit_bones, bone_datas, has_processed_parents)
-
-        # Set position to partent bone.
-        # The relative transform will be handled in pose mode in a later step.
-        bone.head = parent_bone.head
-    else:
-        # Set root bone position.
-        # We need to do it here because otherwise the child bone transform
-        # relations will not be correct.
-        bhv = bone_data.base_translate
-        bone.head = (bhv.x, -bhv.z, bhv.y)
-
-    has_processed_parents[bone_index] = True
-    bone.tail = bone.head + mathutils.Vector((0.0, 0.0, 1.0))
-    bone.length = bone_data.length
+    uvs = srf_data.uvs
+    # This is reversing the loop because we reversed the vertex loop order for the geometry itself as well
+    uv_index = srf_data.uv_index[:, ::-1]
+    if num_tris != 0 and uv_index.max() >= len(uvs):
+        raise ImportError("A SRF triangle references an UV coordinate that doesn't exist")
+
+    # Create the UV map.
+    # Gather the UVs of every triangle corner and scatter them to the face loops.
+    loop_start = np.empty(num_tris, dtype=np.int32)
+    mesh_data.polygons.foreach_get("loop_start", loop_start)
+    loop_indices = loop_start[:, None] + np.arange(3)
+
+    loop_uvs = np.empty((len(mesh_data.loops), 2), dtype=np.float32)
+    loop_uvs[loop_indices] = uvs[uv_index]
+    loop_uvs[:, 1] = 1.0 - loop_uvs[:, 1]
+    bl_uv_layer.data.foreach_set("uv", loop_uvs.ravel())
+
+    tris = srf_data.tris
+
+    # set material index
+    mesh_data.polygons.foreach_set("material_index", tris["tex_index"].astype(np.int32))
+
+    mesh_data.attributes["flags"].data.foreach_set("value", tris["flags"].astype(np.int32))
+    mesh_data.attributes["smooth_group"].data.foreach_set("value", tris["smooth_group"].astype(np.int32))
+    mesh_data.attributes["alpha_level"].data.foreach_set("value", tris["alpha_level"].astype(np.int32))
+    mesh_data.attributes["glaze_index"].data.foreach_set("value", tris["glaze_tex_index"].astype(np.int32))
+    mesh_data.attributes["glaze_func"].data.foreach_set("value", tris["glaze_func"].astype(np.int32))
 
 # Load skeleton bones as blender armatures
 def load_skl(skl_data):
-    # Bones are handled in multiple passes since their
-    # transforms are parent sensitive
     name = "No_name_defined"
 
-    if hasattr(skl_data, 'name'):
+    if skl_data.name != None:
         name = skl_data.name
 
+    # The rest pose is computed up front from the bone base transforms,
+    # so the bones only have to be written once in edit mode.
+    rest_matrices, rest_lengths = skl_data.rest_matrices()
+    parent_index = skl_data.parent_index.tolist()
+
     armature_data = bpy.data.armatures.new(name)
     ob_armature = bpy.data.objects.new(name, armature_data)
 
@@ -491,116 +492,60 @@ def load_skl(skl_data):
     # So the root bone will always be index zero and so on.
     created_bones = []
 
-    bone_datas = skl_data.data_block.bones
-
     bpy.ops.object.mode_set(mode='EDIT', toggle=False)
     edit_bones = ob_armature.data.edit_bones
 
-    # Pass 1: Create bones and vertex groups
-    for bone_data in bone_datas:
-        edit_bone = edit_bones.new(bone_data.name)
-        # temp head and tail, these get set for real
-        # once the parent is set
+    # Pass 1: Create bones
+    for bone_index, bone_name in enumerate(skl_data.bone_names):
+        edit_bone = edit_bones.new(bone_name)
+        # Setting the matrix keeps the bone length, so start with a unit length bone
         edit_bone.head = (0, 0, 0)
-        edit_bone.tail = (0, 0, 1)
+        edit_bone.tail = (0, 1, 0)
+        edit_bone.matrix = rest_matrices[bone_index].tolist()
+        edit_bone.length = float(rest_lengths[bone_index])
 
         # Save name here as the edit_bone variable will point to an invalid bone when Blender automatically shuffles the bone order
         created_bones.append(edit_bone.name)
 
     # Pass 2: Set bone parents
-    has_processed_parents = [False] * len(bone_datas)
-
-    for bone_index in range(len(bone_datas)):
-        process_bone(bone_index, created_bones, edit_bones, bone_datas, has_processed_parents)
-
-    bpy.ops.object.mode_set(mode='POSE', toggle=False)
-    # Pass 3: Transform bones
-    for bone_index, bone_data in enumerate(bone_datas):
-
-        bone_name = created_bones[bone_index]
-
-        pose_bone = ob_armature.pose.bones[bone_name]
-
-        if pose_bone.parent != None:
-            # We have already set the correct position for non parented bones.
-            # So only set the location for bones that have parents here.
-            bone_trans = bone_data.base_translate
-            pose_bone.location = (bone_trans.x, bone_trans.y, bone_trans.z)
-
-        # Recreating quat in a way blender recognizes
-        bone_quat = mathutils.Quaternion((
-            bone_data.base_rotate.s,
-            bone_data.base_rotate.v.x,
-            bone_data.base_rotate.v.y,
-            bone_data.base_rotate.v.z
-        ))
-
-        pose_bone.rotation_quaternion = bone_quat
-
-        bone_scl = bone_data.base_scale
-        pose_bone.scale = (bone_scl.x, bone_scl.y, bone_scl.z)
-
-    # Finally, set current pose as rest pose
-    bpy.ops.pose.armature_apply(selected=False)
-
-    # Pass 4: Try to connect bones that are in range of each other
-    # This breaks animations, especially translations because we change the direction the bone points to
-    #bpy.ops.object.mode_set(mode='EDIT', toggle=False)
-    #for bone in edit_bones:
-    #    if bone.parent != None:
-    #        vec = bone.parent.head - bone.head
-    #        if abs(vec.length - bone.parent.length) < 0.001:
-    #            bone.parent.tail = bone.head
-    #            bone.use_connect = True
-
-    ## Align tails of bones at the end of a bone chain
-    #for bone in edit_bones:
-    #    if not bone.use_connect:
-    #        continue
-
-    #    children_connected = False
-    #    for child_bone in bone.children:
-    #        if child_bone.use_connect:
-    #            children_connected = True
-    #            break
-
-    #    if children_connected:
-    #        continue
-
-    #    old_length = bone.length
-    #    vec = bone.head - bone.parent.head
-    #    bone.tail = bone.head + vec
-    #    bone.length = old_length
+    for bone_index, bone_name in enumerate(created_bones):
+        if parent_index[bone_index] >= 0:  # -1 is root bone/no parent
+            edit_bones[bone_name].parent = edit_bones[created_bones[parent_index[bone_index]]]
 
     bpy.ops.object.mode_set(mode='OBJECT', toggle=False)
 
     # Remove armature object, we will create it later with the MAC data
     bpy.data.objects.remove(ob_armature)
-    print("mounts on skl object: " + str(len(skl_data.data_block.mounts)))
+    print("mounts on skl object: " + str(len(skl_data.mounts)))
 
-    vertex_data = skl_data.data_block.verts
-    weight_data = skl_data.data_block.weights
+    vertex_data = skl_data.verts
+    weight_data = skl_data.weights
 
-    return (armature_data, created_bones, vertex_data, weight_data)
+    return (armature_data, created_bones, vertex_data, weight_data, rest_matrices)
 
-def hook_up_skl_to_obj(obj, name, skl_data, collection):
+def hook_up_skl_to_obj(obj, name, skl_data, collection, shared_mesh=False):
     armature_data = skl_data[0]
     created_bones = skl_data[1]
     vertex_data = skl_data[2]
     weight_data = skl_data[3]
+    bone_matrices = skl_data[4]
 
     ob_armature = bpy.data.objects.new(name, skl_data[0])
-    edit_bones = ob_armature.data.edit_bones
 
     scene = bpy.context.scene
     collection.objects.link(ob_armature)
     bpy.context.view_layer.objects.active = ob_armature
 
-    # Create Vertex Groups and Weights
-    for bone_name in created_bones:
-        obj.vertex_groups.new(name=bone_name)
+    if shared_mesh:
+        # The vertex groups (their names are stored in the mesh), weights and armature offset shape key
+        # already exist in the shared mesh, so only the armature has to be hooked up.
+        mod = obj.modifiers.new("Armature", 'ARMATURE')
+        mod.object = ob_armature
+        ob_armature.show_in_front = True
+        return ob_armature
 
-    bpy.ops.object.mode_set(mode='EDIT', toggle=False)
+    # Create Vertex Groups and Weights
+    vertex_groups = [obj.vertex_groups.new(name=bone_name) for bone_name in created_bones]
 
     # We will create a base shape key to to store the shape described by the bone vertex offsets.
     # NOTE that this assumes that there are not vertex animations if there is a skeleton.
@@ -610,36 +555,52 @@ def hook_up_skl_to_obj(obj, name, skl_data, collection):
     sk_arm.value = 1.0
     obj.data.shape_keys.use_relative = True
 
-    for vert_index, vertex in enumerate(obj.data.vertices):
-        num_weights = vertex_data[vert_index].num_weights
-        first_weight_idx =  vertex_data[vert_index].first_weight
-
-        vert_co = mathutils.Vector((0.0, 0.0, 0.0))
-
-        for group_offset in range(num_weights):
-            weight = weight_data[first_weight_idx + group_offset]
-
-            group_name = created_bones[weight.bone_index]
-            bone = edit_bones[group_name]
+    num_verts = len(obj.data.vertices)
+    num_bones = len(created_bones)
+    if len(vertex_data) < num_verts:
+        raise ImportError("The skeleton '" + name + "' has weights for fewer vertices than the mesh")
+
+    # Expand the per vertex weight ranges into one entry per weight
+    num_weights = vertex_data["num_weights"][:num_verts].astype(np.intp)
+    weight_start = np.zeros(num_verts, dtype=np.intp)
+    np.cumsum(num_weights[:-1], out=weight_start[1:])
+    weight_vert = np.repeat(np.arange(num_verts), num_weights)
+    weight_rows = vertex_data["first_weight"][:num_verts].astype(np.intp)[weight_vert] + (np.arange(len(weight_vert)) - weight_start[weight_vert])
+    if len(weight_rows) != 0 and weight_rows.max() >= len(weight_data):
+        raise ImportError("A vertex in skeleton '" + name + "' references a weight that doesn't exist")
+
+    weight_bone = weight_data["bone_index"][weight_rows].astype(np.intp)
+    weight_factor = weight_data["weight_factor"][weight_rows]
+    if len(weight_bone) != 0 and weight_bone.max() >= num_bones:
+        raise ImportError("A weight in skeleton '" + name + "' references a bone that doesn't exist")
+
+    # Convert the weight offsets to world space with the stacked (B,4,4) bone rest matrices
+    weight_matrices = bone_matrices[weight_bone]
+    offsets = np.einsum("kij,kj->ki", weight_matrices[:, :3, :3], weight_data["offset_pos"][weight_rows]) + weight_matrices[:, :3, 3]
+
+    # Only mutiply by the weight if there is more than one weight group.
+    factor = np.where(num_weights[weight_vert] > 1, weight_factor, 1.0)
+    offsets *= factor[:, None]
+
+    vert_co = np.empty((num_verts, 3), dtype=np.float32)
+    for axis in range(3):
+        vert_co[:, axis] = np.bincount(weight_vert, weights=offsets[:, axis], minlength=num_verts)
+    sk_arm.data.foreach_set("co", vert_co.ravel())
+
+    # Assign the vertex groups with one call per (bone, weight) pair.
+    # Later weights replace earlier ones for the same vertex and bone, like the 'REPLACE' mode does.
+    vert_bone = weight_vert * num_bones + weight_bone
+    _, last = np.unique(vert_bone[::-1], return_index=True)
+    last = len(vert_bone) - 1 - last
+    order = last[np.lexsort((weight_factor[last], weight_bone[last]))]
+
+    bucket_bone = weight_bone[order]
+    bucket_factor = weight_factor[order]
+    bucket_starts = np.flatnonzero(np.r_[True, (bucket_bone[1:] != bucket_bone[:-1]) | (bucket_factor[1:] != bucket_factor[:-1])])
+    bucket_ends = np.r_[bucket_starts[1:], len(order)]
+    for start, end in zip(bucket_starts.tolist(), bucket_ends.tolist()):
+        vertex_groups[bucket_bone[start]].add(weight_vert[order[start:end]].tolist(), float(bucket_factor[start]), 'REPLACE')
 
-            vg = obj.vertex_groups.get(group_name)
-            vg.add((vert_index,), weight.weight_factor, 'REPLACE')
-
-            off_pos = weight.offset_pos
-            vec = mathutils.Vector((off_pos.x, off_pos.y, off_pos.z))
-
-            # Convert coordniates to world space
-            vec = bone.matrix @ vec
-
-            if num_weights > 1:
-                # Only mutiply by the weight if there is more than one weight group.
-                vec = vec * weight.weight_factor
-
-            vert_co += vec
-
-        sk_arm.data[vert_index].co = vert_co
-
-    bpy.ops.object.mode_set(mode='OBJECT', toggle=False)
     # Pass 6: Mount Points
     # TODO
     # but that can be later
@@ -651,6 +612,33 @@ def hook_up_skl_to_obj(obj, name, skl_data, collection):
 
     return ob_armature
 
+def add_track_fcurves(action, armature_obj, bone_names, track, values, prop_name, ignore_non_existing_bones):
+    if track.count.sum() == 0:
+        return
+
+    if track.bone_index.max() >= len(bone_names):
+        raise ImportError("A bone key in sequence '" + action.name + "' references a bone that doesn't exist")
+
+    key_frames = track.frame
+    keys, key_bones, bone_starts, bone_ends = track.bone_keys()
+
+    for start, end in zip(bone_starts.tolist(), bone_ends.tolist()):
+        bone_name = bone_names[key_bones[start]]
+        if ignore_non_existing_bones and bone_name not in armature_obj.pose.bones:
+            continue
+        data_path = armature_obj.pose.bones[bone_name].path_from_id(prop_name)
+
+        bone_keys = keys[start:end]
+        co = np.empty((end - start, 2), dtype=np.float32)
+        co[:, 0] = key_frames[bone_keys]
+        bone_values = values[bone_keys]
+        for index in range(bone_values.shape[1]):
+            fcurve = action.fcurve_ensure_for_datablock(armature_obj, data_path, index=index, group_name=bone_name)
+            co[:, 1] = bone_values[:, index]
+            fcurve.keyframe_points.add(end - start)
+            fcurve.keyframe_points.foreach_set("co", co.ravel())
+            fcurve.update()
+
 def armature_seq(armature_obj, seq_data, ignore_non_existing_bones):
     armature_obj.animation_data_create()
 
@@ -661,78 +649,17 @@ def armature_seq(armature_obj, seq_data, ignore_non_existing_bones):
 
     armature_obj.animation_data.action = action
 
-    frames = seq_data.data_block.frames
-
-    bone_info = seq_data.data_block.bone_info
-    bone_rot_data = seq_data.data_block.bone_rotate
-    bone_scale_data = seq_data.data_block.bone_scale
-    bone_trans_data = seq_data.data_block.bone_translate
+    bone_names = seq_data.bone_names
 
-    scene = bpy.context.scene
-
-    for i, frame in enumerate(frames):
-        scene.frame_current = i
-
-        for rot_idx in range(frame.num_bone_rotate):
-            bone_rot = bone_rot_data[frame.first_bone_rotate + rot_idx]
-
-            bone_name = bone_info[bone_rot.bone_index].name
-
-            if ignore_non_existing_bones and bone_name not in armature_obj.pose.bones:
-                continue
-
-            bone = armature_obj.pose.bones[bone_name]
-
-            # Convert values to radians
-            # 32768 is 180 degrees in the compressed 16bit value from roll,pitch, and yaw.
-            x = bone_rot.pitch * pi / 32768
-            y = bone_rot.yaw * pi / 32768
-            z = bone_rot.roll * pi / 32768
-
-            # Order of rotation is:
-            # 1. Roll (Z)
-            # 2. Pitch (X)
-            # 3. Yaw (Y)
-            euler_rot = mathutils.Euler((x,y,z), 'ZXY')
-            bone.rotation_quaternion = euler_rot.to_quaternion()
-
-            bone.keyframe_insert("rotation_quaternion")
-
-        for scale_idx in range(frame.num_bone_scale):
-            bone_scale = bone_scale_data[frame.first_bone_scale + scale_idx]
-
-            bone_name = bone_info[bone_scale.bone_index].name
-
-            if ignore_non_existing_bones and bone_name not in armature_obj.pose.bones:
-                continue
-
-            bone = armature_obj.pose.bones[bone_name]
-
-            scale = bone_scale.scale
-            bone.scale = (scale.x, scale.y, scale.z)
-
-            bone.keyframe_insert("scale")
-
-        for trans_idx in range(frame.num_bone_translate):
-            bone_trans = bone_trans_data[frame.first_bone_translate + trans_idx]
-
-            bone_name = bone_info[bone_trans.bone_index].name
-
-            if ignore_non_existing_bones and bone_name not in armature_obj.pose.bones:
-                continue
-
-            bone = armature_obj.pose.bones[bone_name]
-
-            trans = bone_trans.translate
-            bone.location = (trans.x, trans.y, trans.z)
-
-            bone.keyframe_insert("location")
+    add_track_fcurves(action, armature_obj, bone_names, seq_data.rotate, seq_data.rotate_quaternions(), "rotation_quaternion", ignore_non_existing_bones)
+    add_track_fcurves(action, armature_obj, bone_names, seq_data.scale, seq_data.scale.value, "scale", ignore_non_existing_bones)
+    add_track_fcurves(action, armature_obj, bone_names, seq_data.translate, seq_data.translate.value, "location", ignore_non_existing_bones)
 
     action.use_frame_range = True
     # There is no way to know if the animation is intended to be cyclic, but just assume this is the case.
     action.use_cyclic = True
     action.frame_start = 0
-    action.frame_end = i
+    action.frame_end = seq_data.num_frames - 1
 
     return action
 
@@ -758,10 +685,14 @@ def add_action_events(action, events):
         else:
             raise ImportError(f"Event type {event.event_type} is not yet supported...")
 
-def load_seq(seq_data, obj, armature_obj, ignore_non_existing_bones):
+def get_shape_key_frames(shape_keys):
+    # Lookup table from shape key (vertex frame) name to its eval_time frame
+    return {key_block.name: key_block.frame for key_block in shape_keys.key_blocks}
+
+def load_seq(seq_data, obj, armature_obj, ignore_non_existing_bones, shape_key_frames=None):
     # TODO only create animation data for skeleton/shape keys if the animations has any keys for them
 
-    if len(seq_data.data_block.frames) == 0:
+    if seq_data.num_frames == 0:
         # Some files (like EDF_FrameTest.cpj) has broken sequence data in them.
         # IE sequences with no frames
         return
@@ -772,7 +703,7 @@ def load_seq(seq_data, obj, armature_obj, ignore_non_existing_bones):
         action = armature_seq(armature_obj, seq_data, ignore_non_existing_bones)
 
     if obj == "":
-        add_action_events(action, seq_data.data_block.events)
+        add_action_events(action, seq_data.events)
         return
 
     # Handle vertex animations
@@ -787,34 +718,48 @@ def load_seq(seq_data, obj, armature_obj, ignore_non_existing_bones):
 
     obj_key_data.animation_data.action = action
 
-    frames = seq_data.data_block.frames
-
-    scene = bpy.context.scene
-
-    for i, frame in enumerate(frames):
-        scene.frame_current = i
+    if shape_key_frames == None:
+        shape_key_frames = get_shape_key_frames(obj_key_data)
 
-        if frame.offset_vert_frame_name == -1:
+    # Some files like EDF1.cpj has lingering vertex frame animation data but no
+    # vertex frames to go with them, skip the frames without a matching shape key.
+    key_times = []
+    key_values = []
+    for i, vert_frame_name in enumerate(seq_data.vert_frame_names):
+        if vert_frame_name == None:
             # No vertex frame data here
             continue
-
-        if not frame.vert_frame_name in obj_key_data.key_blocks:
-            # Some files like EDF1.cpj has lingering vertex frame animation data but no
-            # vertex frames to go with them.
+        key_frame = shape_key_frames.get(vert_frame_name)
+        if key_frame == None:
             continue
-
-        shape_key = obj_key_data.key_blocks[frame.vert_frame_name]
-
-        obj_key_data.eval_time = shape_key.frame
-        obj_key_data.keyframe_insert("eval_time")
+        key_times.append(i)
+        key_values.append(key_frame)
+
+    if len(key_times) != 0:
+        co = np.empty((len(key_times), 2), dtype=np.float32)
+        co[:, 0] = key_times
+        co[:, 1] = key_values
+
+        # Only blend linearly to the next key if it is the next or previous shape key.
+        # Otherwise eval_time would sweep through all the shape keys in between.
+        all_frames = np.unique(np.fromiter(shape_key_frames.values(), dtype=np.float32))
+        key_ranks = np.searchsorted(all_frames, co[:, 1])
+        interpolation = np.full(len(key_times), KEYFRAME_INTERPOLATION_LINEAR, dtype=np.int32)
+        interpolation[:-1][np.abs(np.diff(key_ranks)) > 1] = KEYFRAME_INTERPOLATION_CONSTANT
+
+        fcurve = action.fcurve_ensure_for_datablock(obj_key_data, "eval_time")
+        fcurve.keyframe_points.add(len(key_times))
+        fcurve.keyframe_points.foreach_set("co", co.ravel())
+        fcurve.keyframe_points.foreach_set("interpolation", interpolation)
+        fcurve.update()
 
     action.use_frame_range = True
     # There is no way to know if the animation is intended to be cyclic, but just assume this is the case.
     action.use_cyclic = True
     action.frame_start = 0
-    action.frame_end = i
+    action.frame_end = seq_data.num_frames - 1
 
-    add_action_events(action, seq_data.data_block.events)
+    add_action_events(action, seq_data.events)
 
 def load_mac(mac_data):
     autoexec_commands = {}
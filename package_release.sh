@@ -11,7 +11,7 @@ cd $SCRIPT_DIR
 rm -fr release/*
 mkdir -p $RELEASE_DIR
 cp -r formats $RELEASE_DIR
-cp cpj_utils.py export_cpj.py import_cpj.py __init__.py kaitaistruct.py $RELEASE_DIR
+cp cpj_utils.py cpj_arrays.py export_cpj.py import_cpj.py __init__.py kaitaistruct.py $RELEASE_DIR
 
 cd release
 zip -r io_mesh_cannibal_addon.zip io_mesh_cannibal -x "*/__pycache__/*"
@@ -84,3 +84,39 @@ write_cpj_file("/tmp/out.cpj", byte_array_list)
 file_data2 = load_cpj_data("/tmp/out.cpj")
 
 compare_cpj_data(file_data1, file_data2)
+
+# Round trip the chunks that have NumPy decoders through the array writers
+array_byte_data_list = []
+
+for frm in file_data1.get("FRMB", []):
+    array_byte_data_list.append(round_trip_frm_arrays(FrmArrays(frm)))
+
+for geo in file_data1.get("GEOB", []):
+    array_byte_data_list.append(round_trip_geo_arrays(GeoArrays(geo)))
+
+for seq in file_data1.get("SEQB", []):
+    array_byte_data_list.append(round_trip_seq_arrays(SeqArrays(seq)))
+
+write_cpj_file("/tmp/out_arrays.cpj", array_byte_data_list)
+
+file_data3 = load_cpj_data("/tmp/out_arrays.cpj")
+
+compare_cpj_data({chunk_type: file_data1[chunk_type] for chunk_type in file_data3}, file_data3)
+
+# A chunk name that isn't ASCII should be reported as a broken file and not stop the chunk census
+from cpj_tool import stat_file
+
+cpj_bytes = bytearray(cpj_path.read_bytes())
+for info in load_cpj_chunk_info(sys.argv[1]):
+    if info.name:
+        _, _, _, _, offset_name = CPJ_CHUNK_HEADER.unpack_from(cpj_bytes, info.offset)
+        cpj_bytes[info.offset + offset_name] = 0xE9
+        break
+
+Path("/tmp/bad_name.cpj").write_bytes(cpj_bytes)
+
+_, chunk_infos, error = stat_file("/tmp/bad_name.cpj")
+if error == None:
+    print("A malformed chunk name was not reported")
+    exit(1)
+print("Malformed chunk name: " + error)
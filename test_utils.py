@@ -1,4 +1,5 @@
 from cpj_utils import *
+from cpj_arrays import *
 
 def round_trip_frm_data(frm_data):
     # construct a vertex frame animation data list from parsed data
@@ -305,3 +306,46 @@ def round_trip_srf_data(srf_data):
     srf_byte_data = create_srf_byte_array(srf_data.name, textures, tris, uv_coords)
 
     return srf_byte_data
+
+def round_trip_frm_arrays(frm_arrays):
+    # Write the frames back with the array writer.
+    # NOTE: The array writer only handles chunks where all frames are stored the same way.
+    # Chunks that mix compressed and uncompressed frames (or vary the group count) are written
+    # back frame by frame in their original form with the list based writer instead.
+    frames = frm_arrays.frames
+    total_bb = (frm_arrays.bb_min, frm_arrays.bb_max)
+
+    num_groups = frames["num_groups"]
+    if len(frames) == 0 or np.all(num_groups == 0):
+        verts = frm_arrays.positions(blender_axes=False)
+        return create_frm_byte_array_from_arrays(frm_arrays.name, total_bb, frm_arrays.frame_names, frames["bb_min"], frames["bb_max"], verts)
+
+    raw_frames = [frm_arrays.raw_frame(i) for i in range(frm_arrays.num_frames)]
+    if np.all(num_groups == num_groups[0]):
+        groups = np.stack([raw_frame[0] for raw_frame in raw_frames])
+        verts = np.stack([raw_frame[1] for raw_frame in raw_frames])
+        return create_frm_byte_array_from_arrays(frm_arrays.name, total_bb, frm_arrays.frame_names, frames["bb_min"], frames["bb_max"], verts, groups)
+
+    frame_list = []
+    for i, (groups, verts) in enumerate(raw_frames):
+        frame = [frm_arrays.frame_names[i], tuple(frames["bb_min"][i].tolist()), tuple(frames["bb_max"][i].tolist())]
+        if groups is None:
+            frame += [0, [], len(verts), [tuple(vert) for vert in verts.tolist()]]
+        else:
+            frame_groups = [(tuple(group[0]), tuple(group[1])) for group in groups.tolist()]
+            frame_verts = [(vert[0], tuple(vert[1])) for vert in verts.tolist()]
+            frame += [len(groups), frame_groups, len(verts), frame_verts]
+        frame_list.append(frame)
+
+    return create_frm_byte_array(frm_arrays.name, total_bb, frame_list)
+
+def round_trip_geo_arrays(geo_arrays):
+    return create_geo_byte_array_from_arrays(geo_arrays.name, geo_arrays.verts, geo_arrays.edges, geo_arrays.tris,
+                                             geo_arrays.mounts, geo_arrays.mount_names, geo_arrays.obj_links)
+
+def round_trip_seq_arrays(seq_arrays):
+    events = [(event.event_type, event.time, event.param_str) for event in seq_arrays.events]
+
+    return create_seq_byte_array_from_arrays(seq_arrays.name, seq_arrays.play_rate, seq_arrays.frames, seq_arrays.vert_frame_names,
+                                             events, seq_arrays.bone_names, seq_arrays.bone_src_length,
+                                             seq_arrays.translate.table, seq_arrays.rotate.table, seq_arrays.scale.table)